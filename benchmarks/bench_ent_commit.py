@@ -0,0 +1,69 @@
+import argparse
+import time
+import spacy
+
+from diaag_nlp_colon.config.colon import col_patterns
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401 registers components and extensions
+
+# Benchmark: deferred entity removal (one doc.ents update at the end of the pipeline)
+# vs. removing false positives after every marking component.
+# Uses the rule-based colonoscopy components only (entity ruler instead of the trained model), on long reports
+# made by repeating the findings of the sample report.
+#   python benchmarks/bench_ent_commit.py [--repeats 50] [--runs 5]
+
+SAMPLE_REPORT = 'tests/reports/colo_sample.txt'
+
+FINDINGS = ('Two 5 mm polyps in the sigmoid colon were removed with a cold snare. '
+            'A 12 mm sessile polyp at 20 cm, removed piecemeal. No polyp seen at 15 cm from the anus. '
+            'Random biopsy taken with cold forceps. ')
+
+
+def build_nlp(eager):
+    nlp = spacy.blank('en')
+    nlp.add_pipe("col_keyword_filter")
+    nlp.add_pipe("set_report_type", config={"report_type": "col"})
+    ruler = nlp.add_pipe("entity_ruler", config={"overwrite_ents": True})
+    ruler.add_patterns(col_patterns.header_patterns + col_patterns.polyp_patterns + col_patterns.metrics_patterns)
+    nlp.add_pipe("filter_outside_properties_col")
+    if eager:
+        nlp.add_pipe("remove_false_pos", name="remove_outside_false_pos")
+    nlp.add_pipe("extract_col_props")
+    nlp.add_pipe("select_relevant_sections_col")
+    if eager:
+        nlp.add_pipe("remove_false_pos", name="remove_window_ents")
+    nlp.add_pipe("mark_false_pos", config={"report_type": "col", "defer_removal": not eager})
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("polyp_property_extractor_col")
+    return nlp
+
+
+def make_long_report(repeats):
+    with open(SAMPLE_REPORT) as f:
+        report = f.read()
+    pos = report.find('FINDINGS:') + len('FINDINGS:')
+    return colon_pipelines.clean_report_text(report[:pos] + ' ' + FINDINGS * repeats + report[pos:])
+
+
+def time_pipeline(nlp, text, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        doc = nlp(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings), doc
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deferred vs. eager false positive removal')
+    parser.add_argument('--repeats', type=int, default=50, help='copies of the findings text in the report')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_long_report(args.repeats)
+    eager_time, eager_doc = time_pipeline(build_nlp(eager=True), text, args.runs)
+    deferred_time, deferred_doc = time_pipeline(build_nlp(eager=False), text, args.runs)
+    assert [e.text for e in eager_doc.ents] == [e.text for e in deferred_doc.ents]
+
+    print('report: {} chars, {} tokens, {} entities'.format(len(text), len(deferred_doc), len(deferred_doc.ents)))
+    print('eager removal:    {:.4f} s'.format(eager_time))
+    print('deferred removal: {:.4f} s ({:.1%} faster)'.format(deferred_time, 1 - deferred_time / eager_time))
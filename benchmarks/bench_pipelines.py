@@ -0,0 +1,154 @@
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy
+import spacy
+
+import synthetic_reports
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import colon_report_buckets
+
+# Benchmark: throughput, latency percentiles and peak RSS of the public entry points on synthetic reports
+#   python benchmarks/bench_pipelines.py [--n 200] [--length 3000] [--out results.json]
+# Each target is called once per report, after a warm-up call (which builds the cached pipelines).
+# The bucket functions are timed on reports made by the pipelines, so they measure the rule logic only.
+# Peak RSS is the process high-water mark after the target ran, it includes the targets before it.
+# Compare two result files across commits with
+#   python benchmarks/bench_pipelines.py --compare old.json new.json
+
+
+def _merge_rec(buckets):
+    return colon_report_buckets.merge_patient_buckets(*buckets)
+
+
+def _rec_from_text(texts):
+    return colon_report_buckets.make_rec_from_text(*texts)
+
+
+def _col_buckets(col):
+    return [colon_report_buckets.filter_buckets_col(colon_pipelines.col_pipeline(text)) for text in col]
+
+
+def _path_buckets(path):
+    return [colon_report_buckets.filter_buckets_path(colon_pipelines.path_pipeline(text)) for text in path]
+
+
+# target name -> function returning (function called per item, list of items) for a corpus
+# items of the bucket functions are made when the target runs, so unselected targets cost nothing
+TARGETS = {
+    'col_pipeline': lambda col, path: (colon_pipelines.col_pipeline, col),
+    'path_pipeline': lambda col, path: (colon_pipelines.path_pipeline, path),
+    'make_rec_from_text': lambda col, path: (_rec_from_text, list(zip(col, path))),
+    'filter_buckets_col': lambda col, path: (
+        colon_report_buckets.filter_buckets_col, [colon_pipelines.col_pipeline(text) for text in col]),
+    'filter_buckets_path': lambda col, path: (
+        colon_report_buckets.filter_buckets_path, [colon_pipelines.path_pipeline(text) for text in path]),
+    'merge_patient_buckets': lambda col, path: (_merge_rec, list(zip(_col_buckets(col), _path_buckets(path)))),
+}
+
+
+# process high-water mark RSS in MB (ru_maxrss is in KB on Linux, bytes on macOS)
+def peak_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def item_chars(item):
+    if isinstance(item, str):
+        return len(item)
+    if isinstance(item, tuple) and all(isinstance(text, str) for text in item):
+        return sum(len(text) for text in item)
+    return 0
+
+
+def run_target(func, items):
+    func(items[0])
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        item_start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - item_start)
+    total = time.perf_counter() - start
+    latencies = numpy.array(latencies)
+    chars = sum(item_chars(item) for item in items)
+    return {
+        'items': len(items),
+        'total_seconds': total,
+        'items_per_second': len(items) / total,
+        'chars_per_second': chars / total if chars else None,
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(numpy.percentile(latencies, 50) * 1000),
+        'p99_ms': float(numpy.percentile(latencies, 99) * 1000),
+        'max_ms': float(latencies.max() * 1000),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    col, path = synthetic_reports.make_corpus(args.n, length=args.length, seed=args.seed)
+    results = {}
+    for name in args.targets or list(TARGETS):
+        func, items = TARGETS[name](col, path)
+        results[name] = run_target(func, items)
+        print('{:<22} {:>9.1f} items/s  p50 {:>8.2f} ms  p99 {:>8.2f} ms  peak RSS {:>7.1f} MB'.format(
+            name, results[name]['items_per_second'], results[name]['p50_ms'], results[name]['p99_ms'],
+            results[name]['peak_rss_mb']))
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'spacy': spacy.__version__,
+        'config': {'n': args.n, 'length': args.length, 'seed': args.seed,
+                   'col_chars': sum(len(text) for text in col), 'path_chars': sum(len(text) for text in path)},
+        'results': results,
+    }
+
+
+# Print the change of each metric between two result files
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print('{} -> {}'.format(old.get('commit'), new.get('commit')))
+    for name, new_result in new['results'].items():
+        old_result = old['results'].get(name)
+        if not old_result:
+            continue
+        changes = ['{} {:+.1%}'.format(metric, new_result[metric] / old_result[metric] - 1)
+                   for metric in ['items_per_second', 'p50_ms', 'p99_ms', 'peak_rss_mb'] if old_result[metric]]
+        print('{:<22} {}'.format(name, '  '.join(changes)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the colon pipelines on synthetic reports')
+    parser.add_argument('--n', type=int, default=200, help='number of colonoscopy and of pathology reports')
+    parser.add_argument('--length', type=int, default=3000, help='approximate characters per colonoscopy report')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), help='targets to run (default all)')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    result = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,165 @@
+import argparse
+import json
+import random
+import re
+import string
+import sys
+import time
+
+from diaag_nlp_colon.classes.report import ColReport, PathReport
+from diaag_nlp_colon.components import false_pos_filter
+from diaag_nlp_colon.config.colon import col_patterns, path_patterns
+from diaag_nlp_colon.services import keyword_scanner
+from diaag_nlp_colon.services.section_splitter import SectionSplitter
+
+# Benchmark: worst-case match time of every regex that runs on report text
+# Regexes come from the REGEX token predicates of the entity ruler patterns, the SectionSplitter header regexes,
+# the keyword scanner categories (vocab lists), the module-level component regexes and the Report regex methods.
+# Each one is run on adversarial inputs: long runs of digits, whitespace, punctuation and single words, random text,
+# and near misses built from the literal words of the regex itself (e.g. 'recommendation' * n for a header regex).
+# Inputs grow from --length / 64 to --length characters; a regex that goes over --budget seconds on one input is not
+# run on the longer ones, so a backtracking regex fails fast instead of stalling the run.
+# Exits with status 1 if any regex went over the budget.
+#   python benchmarks/bench_regex.py [--length 100000] [--budget 0.1] [--out regex.json]
+# Token predicates are run on the input as if it were one token (spaCy searches them in each token's text).
+
+GROWTH = [64, 16, 4, 1]
+WORD_REGEX = re.compile(r'[A-Za-z]{2,}')
+
+
+# returns list of (name, regex source, token attribute) for the REGEX token predicates of entity ruler patterns
+# LOWER predicates see lowercased token text, so they are run on lowercased input
+def token_regexes(module_name, patterns):
+    regexes = []
+    for pattern in patterns:
+        for token in pattern['pattern']:
+            for attr, value in token.items():
+                if isinstance(value, dict) and 'REGEX' in value:
+                    name = '{}:{}/{}:{}'.format(module_name, pattern['label'], pattern.get('id'), value['REGEX'])
+                    regexes.append((name, value['REGEX'], attr.upper()))
+    return regexes
+
+
+# literal words of a regex source, for near-miss inputs
+def regex_words(source):
+    return WORD_REGEX.findall(re.sub(r'\\.', ' ', source))
+
+
+# returns dict of input name -> text of about length characters
+def generic_inputs(length, seed):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + string.punctuation + ' \n\t'
+    return {
+        'digits': '1' * length,
+        'digits_hyphen': '1-' * (length // 2),
+        'digits_dot': '1.' * (length // 2),
+        'spaces': ' ' * length,
+        'newlines': '\r\n' * (length // 2),
+        'word': 'a' * length,
+        'parens': '(' * length,
+        'random': ''.join(rng.choice(alphabet) for _ in range(length)),
+    }
+
+
+# near misses: each literal word of the regexes repeated with no separator, with a space, and with punctuation
+# (in lower and upper case), and all words of a regex repeated as a phrase
+def near_miss_inputs(sources, length):
+    inputs = {}
+    for source in sources:
+        words = regex_words(source)
+        for word in words:
+            for sep in ['', ' ', '(', '-', ':']:
+                unit = word + sep
+                inputs['near_miss:{!r}'.format(unit)] = unit * (length // len(unit))
+                inputs['near_miss:{!r}'.format(unit.upper())] = unit.upper() * (length // len(unit))
+        if len(words) > 1:
+            unit = ' '.join(words) + ' '
+            inputs['near_miss:{!r}'.format(unit)] = unit * (length // len(unit))
+    return inputs
+
+
+# returns list of (name, regex sources, function called with the input text)
+def targets():
+    result = []
+    for module_name, module in [('col_patterns', col_patterns), ('path_patterns', path_patterns)]:
+        patterns = [p for name in dir(module) if name.endswith('_patterns') for p in getattr(module, name)]
+        for name, source, attr in token_regexes(module_name, patterns):
+            regex = re.compile(source)
+            if attr == 'LOWER':
+                result.append((name, [source], lambda text, regex=regex: regex.search(text.lower())))
+            else:
+                result.append((name, [source], regex.search))
+    for module_name, module in [('col_patterns', col_patterns), ('path_patterns', path_patterns)]:
+        for regex, section_id in SectionSplitter(module.header_patterns).patterns:
+            name = 'section_splitter:{}:{}'.format(module_name, section_id)
+            result.append((name, [regex.pattern], lambda text, regex=regex: list(regex.finditer(text))))
+    scanner = keyword_scanner.REPORT_SCANNER
+    for category, terms in scanner.terms.items():
+        result.append(('keyword_scanner:{}'.format(category), terms,
+                       lambda text, category=category: scanner.search(text, category)))
+    result.append(('false_pos_filter:SIZE_MEAS_REGEX', [false_pos_filter.SIZE_MEAS_REGEX.pattern],
+                   false_pos_filter.SIZE_MEAS_REGEX.search))
+    # the Report regex methods scan through REPORT_SCANNER, with the terms of their category
+    for report_class, method, category in [(ColReport, 'regex_poor_prep', 'poor_prep'),
+                                           (ColReport, 'regex_incomplete_proc', 'incomplete_proc'),
+                                           (PathReport, 'text_has_hist', 'hist'),
+                                           (PathReport, 'text_has_bucket_4_hist', 'bucket_4_hist'),
+                                           (PathReport, 'regex_malignancy', 'malignancy')]:
+        result.append(('{}.{}'.format(report_class.__name__, method), scanner.terms[category],
+                       lambda text, report_class=report_class, method=method:
+                       getattr(report_class(text=text), method)()))
+    return result
+
+
+# returns dict with the worst time of func over the inputs, growing them until one goes over budget
+def run_target(func, inputs, budget):
+    worst_seconds = 0
+    worst_input = None
+    over_budget = None
+    for divisor in GROWTH:
+        for input_name, text in inputs.items():
+            text = text[:max(1, len(text) // divisor)]
+            start = time.perf_counter()
+            func(text)
+            seconds = time.perf_counter() - start
+            if seconds > worst_seconds:
+                worst_seconds, worst_input = seconds, '{} ({} chars)'.format(input_name, len(text))
+            if seconds > budget and over_budget is None:
+                over_budget = worst_input
+        if over_budget:
+            break
+    return {'worst_seconds': worst_seconds, 'worst_input': worst_input, 'over_budget': over_budget}
+
+
+def run(args):
+    generic = generic_inputs(args.length, args.seed)
+    results = {}
+    failed = []
+    for name, sources, func in targets():
+        inputs = dict(generic, **near_miss_inputs(sources, args.length))
+        result = run_target(func, inputs, args.budget)
+        results[name] = result
+        flag = '  OVER BUDGET' if result['over_budget'] else ''
+        print('{:<90} {:>9.4f} s  {}{}'.format(name[:90], result['worst_seconds'], result['worst_input'], flag))
+        if result['over_budget']:
+            failed.append((name, result['over_budget']))
+    return results, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worst-case match time of the regexes run on report text')
+    parser.add_argument('--length', type=int, default=100000, help='longest input in characters')
+    parser.add_argument('--budget', type=float, default=0.1, help='fail if a regex takes longer on one input')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write worst-case timings to this JSON file')
+    args = parser.parse_args()
+
+    results, failed = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'length': args.length, 'budget': args.budget, 'results': results}, f, indent=2)
+    if failed:
+        print('\nregexes over budget:')
+        for name, input_name in failed:
+            print('  {}: {}'.format(name, input_name))
+        sys.exit(1)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import random
+import re
+import sys
+
+import numpy
+
+import synthetic_reports
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import colon_report_buckets, file_proc
+from diaag_nlp_colon.services.pipeline_profiler import PipelineProfiler
+
+# Benchmark: how the time of each pipeline stage grows with report length and entity density
+# For every density, one colonoscopy and one pathology report is made per length (1 KB to 1 MB by default) and run
+# through the pipelines with a PipelineProfiler; the bucket functions and generate_col_dataset are timed as well.
+# The complexity of each stage is the slope of log(time) over log(length). A linear stage has a slope of about 1,
+# a quadratic one about 2. Exits with status 1 if any stage's slope is above --max-exponent.
+#   python benchmarks/bench_scaling.py [--sizes 1000 4000 ... 1000000] [--densities 0.2 0.7] [--out scaling.json]
+# Stages faster than --min-seconds at a length are left out of its fit (timer noise).
+
+DEFAULT_SIZES = [1000, 4000, 16000, 64000, 256000, 1000000]
+DEFAULT_DENSITIES = [0.2, 0.7]
+
+# brat annotation labels made for generate_col_dataset, by the text they are made from
+BRAT_ANNOTATIONS = [
+    ('location', re.compile('|'.join(synthetic_reports.LOCATIONS))),
+    ('finding-polyp', re.compile(r'polyps?\b')),
+    ('size-measurement', re.compile(r'\d+(\.\d+)? ?(mm|cm)')),
+    ('morphology', re.compile('|'.join(synthetic_reports.MORPHOLOGIES))),
+]
+
+
+# brat .ann text for a report, one annotation per match of BRAT_ANNOTATIONS (in label order, like brat output)
+def make_brat(text):
+    lines = []
+    for label, regex in BRAT_ANNOTATIONS:
+        for match in regex.finditer(text):
+            lines.append('T{}\t{} {} {}\t{}'.format(len(lines) + 1, label, match.start(), match.end(), match.group()))
+    return '\n'.join(lines)
+
+
+# returns dict of stage name -> seconds, for one col and one path report
+def time_stages(col_text, path_text):
+    profiler = PipelineProfiler()
+    col_report = colon_pipelines.col_pipeline(col_text, profiler=profiler)
+    path_report = colon_pipelines.path_pipeline(path_text, profiler=profiler)
+    with profiler.timer('buckets', 'filter_buckets_col'):
+        col_buckets = colon_report_buckets.filter_buckets_col(col_report)
+    with profiler.timer('buckets', 'filter_buckets_path'):
+        path_buckets = colon_report_buckets.filter_buckets_path(path_report)
+    with profiler.timer('buckets', 'merge_patient_buckets'):
+        colon_report_buckets.merge_patient_buckets(col_buckets, path_buckets)
+    brat = make_brat(col_text)
+    with profiler.timer('file_proc', 'generate_col_dataset'):
+        file_proc.generate_col_dataset({'report': brat}, {'report': col_text})
+    return {'{}.{}'.format(pipeline, name): stats.total_seconds for (pipeline, name), stats in profiler.stats.items()}
+
+
+# slope of log(seconds) over log(size), None if fewer than 3 sizes are above min_seconds
+def fit_exponent(sizes, seconds, min_seconds):
+    points = [(size, t) for size, t in zip(sizes, seconds) if t >= min_seconds]
+    if len(points) < 3:
+        return None
+    point_sizes, point_seconds = zip(*points)
+    return float(numpy.polyfit(numpy.log(point_sizes), numpy.log(point_seconds), 1)[0])
+
+
+def run(args):
+    # spaCy refuses texts over nlp.max_length (1,000,000 chars by default)
+    for report_type in ['col', 'path']:
+        nlp = colon_pipelines.get_nlp(report_type)
+        nlp.max_length = max(nlp.max_length, 2 * max(args.sizes))
+    # warm-up, the first reports through a pipeline are slower
+    warmup_rng = random.Random(args.seed)
+    time_stages(synthetic_reports.make_col_report(warmup_rng), synthetic_reports.make_path_report(warmup_rng))
+    results = {}
+    failed = []
+    for density in args.densities:
+        rng = random.Random(args.seed)
+        timings = {}
+        for size in args.sizes:
+            col_text = synthetic_reports.make_col_report(rng, size, density)
+            path_text = synthetic_reports.make_path_report(rng, size, density)
+            runs = [time_stages(col_text, path_text) for _ in range(args.runs)]
+            for stage in runs[0]:
+                timings.setdefault(stage, []).append(min(run_timings[stage] for run_timings in runs))
+        exponents = {stage: fit_exponent(args.sizes, seconds, args.min_seconds) for stage, seconds in timings.items()}
+        results[str(density)] = {'timings': timings, 'exponents': exponents}
+
+        print('\ndensity {}'.format(density))
+        print('{:<50} {}  {:>8}'.format('stage', ' '.join('{:>9}'.format(size) for size in args.sizes), 'exponent'))
+        for stage, seconds in timings.items():
+            exponent = exponents[stage]
+            flag = ''
+            if exponent is not None and exponent > args.max_exponent:
+                flag = '  SUPERLINEAR'
+                failed.append((density, stage, exponent))
+            print('{:<50} {}  {:>8}{}'.format(stage, ' '.join('{:>9.4f}'.format(t) for t in seconds),
+                                              '-' if exponent is None else '{:.2f}'.format(exponent), flag))
+    return results, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-stage scaling of the colon pipelines with report length')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='report lengths in characters')
+    parser.add_argument('--densities', type=float, nargs='+', default=DEFAULT_DENSITIES,
+                        help='fraction of findings with polyp entities')
+    parser.add_argument('--runs', type=int, default=3, help='runs per length, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-exponent', type=float, default=1.3, help='fail if a stage scales worse than this')
+    parser.add_argument('--min-seconds', type=float, default=0.002, help='ignore timings below this in the fit')
+    parser.add_argument('--out', help='write timings and exponents to this JSON file')
+    args = parser.parse_args()
+
+    results, failed = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'sizes': args.sizes, 'max_exponent': args.max_exponent, 'results': results}, f, indent=2)
+    if failed:
+        print('\nsuperlinear stages:')
+        for density, stage, exponent in failed:
+            print('  density {}: {} ({:.2f})'.format(density, stage, exponent))
+        sys.exit(1)
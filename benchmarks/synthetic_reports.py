@@ -0,0 +1,146 @@
+import random
+
+from diaag_nlp_colon.config.colon import col_patterns, path_patterns, vocab
+
+# Synthetic colonoscopy and pathology reports for benchmarks
+# Section headers are rendered from the entity ruler header patterns, findings are built from the polyp vocab,
+# so the reports go through the same section filters and entity patterns as real reports.
+#   col, path = synthetic_reports.make_corpus(100, length=4000)
+
+LOCATIONS = ['cecum', 'ascending colon', 'hepatic flexure', 'transverse colon', 'splenic flexure',
+             'descending colon', 'sigmoid colon', 'rectum', 'rectosigmoid junction', 'appendiceal orifice']
+QUANTITIES = ['One', 'Two', 'Three', 'A single', 'Multiple', 'Four', 'Several']
+MORPHOLOGIES = ['sessile', 'pedunculated', 'flat', 'semi-pedunculated', 'polypoid']
+REMOVALS = ['removed with a cold snare', 'removed with cold biopsy forceps', 'removed with a hot snare',
+            'removed piecemeal', 'resected and retrieved', 'not retrieved']
+COL_OTHER_FINDINGS = ['Non-bleeding internal hemorrhoids were found on retroflexion.',
+                      'Scattered diverticula were found in the sigmoid colon.',
+                      'The terminal ileum appeared normal.',
+                      'No old blood seen.',
+                      'Random biopsy taken with cold forceps for evaluation of microscopic colitis.']
+PROCEDURES = ['POLYPECTOMY', 'BIOPSY', 'SNARED', 'COLD SNARE POLYPECTOMY']
+PATH_NOTES = ['Note: Deeper levels were examined.', 'The margins cannot be assessed in this fragmented specimen.',
+              'Clinical correlation is recommended.']
+DYSPLASIA = ['No high-grade dysplasia', 'Negative for high grade dysplasia', 'No cytologic dysplasia',
+             'No dysplasia identified']
+
+# section text used for colonoscopy report headers that are not filled with findings
+COL_SECTION_TEXT = {
+    'section_IND': 'Screening colonoscopy, average risk.',
+    'section_PROC_P': 'COLONOSCOPY - screening, average risk',
+    'section_MEDS': 'MAC anesthesia',
+    'section_PROC_TECH': 'Informed consent obtained for the procedure including risks, benefits and alternatives. '
+                         'The endoscope passed with ease through the anus under direct visualization; it was '
+                         'advanced to the cecum, confirmed by the appendiceal orifice and ileocecal valve. '
+                         'The quality of the preparation was {prep}. Retroflexion was performed in the rectum.',
+    'section_COMP': 'None.',
+    'section_EBL': 'Minimal',
+    'section_IMP': 'See findings.',
+}
+# order of the colonoscopy sections, findings go into section_FIN
+COL_SECTIONS = ['section_IND', 'section_PROC_P', 'section_MEDS', 'section_PROC_TECH', 'section_FIN', 'section_COMP',
+                'section_EBL', 'section_IMP']
+PATH_SECTIONS = ['section_FD', 'section_MD', 'section_GD', 'section_COM']
+
+
+# Render a SECTION_HEADER token pattern as text, e.g. [{"LOWER": "findings"}, {"TEXT": ":"}] -> 'FINDINGS:'
+# Optional tokens are left out, LOWER values are upper-cased like the headers in real reports
+# returns None for patterns with regex tokens
+def header_text(pattern):
+    words = []
+    for token in pattern:
+        if token.get('OP') == '?':
+            continue
+        value = next(value for key, value in token.items() if key.upper() in ('TEXT', 'LOWER'))
+        if isinstance(value, dict):
+            if 'IN' not in value:
+                return None
+            value = value['IN'][0]
+        if token.get('LOWER') == value:
+            value = value.upper()
+        if value == ':' and words:
+            words[-1] += value
+        else:
+            words.append(value)
+    return ' '.join(words)
+
+
+def _headers(header_patterns):
+    headers = {}
+    for pattern in header_patterns:
+        text = header_text(pattern['pattern'])
+        if text is not None:
+            headers.setdefault(pattern['id'], text)
+    return headers
+
+
+COL_HEADERS = _headers(col_patterns.header_patterns)
+PATH_HEADERS = _headers(path_patterns.header_patterns)
+
+
+def col_finding(rng):
+    size = rng.choice(['{} mm'.format(rng.randint(2, 9)), '{}mm'.format(rng.randint(2, 25)),
+                       '{} cm'.format(rng.choice([1, 1.5, 2, 3]))])
+    return '{} {} {} polyp{} in the {} {}.'.format(
+        rng.choice(QUANTITIES), size, rng.choice(MORPHOLOGIES), rng.choice(['', 's']), rng.choice(LOCATIONS),
+        rng.choice(REMOVALS))
+
+
+def path_part(rng, letter):
+    hist = rng.choice(list(vocab.HIST_TYPES.values()) + vocab.COL_NO_HIST + ['hyperplastic polyp'])
+    if rng.random() < 0.05:
+        hist = 'invasive ' + rng.choice(vocab.PATH_MALIGNANCY)
+    return '{}.  {}, POLYP ({}):  - {}  - {}'.format(
+        letter, rng.choice(LOCATIONS).upper(), rng.choice(PROCEDURES), hist.capitalize(), rng.choice(DYSPLASIA))
+
+
+# Colonoscopy report of about length characters (at least one finding)
+# optional param: density, fraction of findings that describe polyps (the others have few or no entities)
+def make_col_report(rng, length=3000, density=0.7):
+    findings = [col_finding(rng)]
+    base_length = sum(len(text) + 40 for text in COL_SECTION_TEXT.values())
+    while base_length + sum(len(f) + 1 for f in findings) < length:
+        findings.append(col_finding(rng) if rng.random() < density else rng.choice(COL_OTHER_FINDINGS))
+    prep = rng.choice(list(vocab.COL_PREP_QUALITY))
+    sections = []
+    for section_id in COL_SECTIONS:
+        if section_id == 'section_FIN':
+            text = '\n'.join(findings)
+        else:
+            text = COL_SECTION_TEXT[section_id].format(prep=prep)
+        sections.append('{}\n{}\n'.format(COL_HEADERS[section_id], text))
+    return 'RECORD NUMBER:      {}\n\n{}'.format(rng.randint(1000000, 9999999), '\n'.join(sections))
+
+
+# Pathology report of about length characters (at least one part)
+# optional param: density, fraction of final diagnosis lines that are specimen parts (the others are notes)
+def make_path_report(rng, length=2000, density=1.0):
+    parts = []
+    n_parts = 0
+    while not n_parts or 600 + sum(len(p) + 4 for p in parts) < length:
+        if density >= 1 or rng.random() < density:
+            parts.append(path_part(rng, chr(ord('A') + n_parts % 26)))
+            n_parts += 1
+        else:
+            parts.append(rng.choice(PATH_NOTES))
+    section_text = {
+        'section_FD': '    '.join(parts),
+        'section_MD': 'A microscopic examination has been performed.',
+        'section_GD': 'The case is received in {} formalin filled containers, labeled with the patient\'s name. '
+                      'Part A-3 tissue fragments, 0.2-0.4 cm in greatest dimension, cassette A1.'.format(n_parts),
+        'section_COM': 'Clinical correlation recommended.',
+    }
+    sections = ['{}:\n\n{}\n'.format(PATH_HEADERS[section_id].rstrip(':'), section_text[section_id])
+                for section_id in PATH_SECTIONS]
+    return 'CLINICAL INFORMATION:\n\nScreening.\n\n\n{}'.format('\n\n'.join(sections))
+
+
+# returns (list of colonoscopy reports, list of pathology reports), n of each
+# optional param: length, approximate characters per colonoscopy report (pathology reports are 2/3 of that)
+# optional param: density, see make_col_report / make_path_report (default: their own defaults)
+def make_corpus(n, length=3000, seed=0, density=None):
+    rng = random.Random(seed)
+    kwargs = {} if density is None else {'density': density}
+    col = [make_col_report(rng, length, **kwargs) for _ in range(n)]
+    path = [make_path_report(rng, length * 2 // 3, **kwargs) for _ in range(n)]
+    return col, path
@@ -0,0 +1,4 @@
+import logging
+
+# library logging: nothing is output unless the application configures a handler
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -1,6 +1,6 @@
-import re
 from diaag_nlp_colon.classes.representations import AsDictMixin
 from diaag_nlp_colon.config.colon import vocab
+from diaag_nlp_colon.services import keyword_scanner
 
 
 class Report:
@@ -8,6 +8,17 @@ class Report:
     def __init__(self, text='', mrn=None):
         self.text = text
         self.pat_mrn = mrn
+        self._keyword_hits = None
+        self._scanned_text = None
+
+    # returns True if report text matches a keyword_scanner.REPORT_SCANNER category
+    # report text is scanned once for all categories, results are reused until the text changes
+    def has_keyword(self, category):
+        if self._keyword_hits is None or self._scanned_text is not self.text:
+            hits = keyword_scanner.REPORT_SCANNER.scan(self.text or '')
+            self._keyword_hits = {name: match is not None for name, match in hits.items()}
+            self._scanned_text = self.text
+        return self._keyword_hits[category]
 
 
 class ColReport(Report, AsDictMixin):
@@ -80,14 +91,10 @@ class ColReport(Report, AsDictMixin):
         }
 
     def regex_poor_prep(self):
-        prep_regex = r'(' + ')|('.join(vocab.COL_POOR_PREP_REGEX) + r')'
-        match = re.search(prep_regex, self.text, re.IGNORECASE)
-        return True if match else False
+        return self.has_keyword('poor_prep')
 
     def regex_incomplete_proc(self):
-        incomp_regex = r'(' + ')|('.join(vocab.COL_INCOMPLETE_PROC) + r')'
-        match = re.search(incomp_regex, self.text, re.IGNORECASE)
-        return True if match else False
+        return self.has_keyword('incomplete_proc')
 
 
 class PathReport(Report, AsDictMixin):
@@ -96,7 +103,7 @@ class PathReport(Report, AsDictMixin):
     """
 
     hists = ['tubular adenoma', 'sessile serrated']
-    bucket_4_hists = ['tubulovillous adenoma', 'villous adenoma', 'traditional serrated adenoma']
+    bucket_4_hists = vocab.BUCKET_4_HISTS
     hra_hists = ['tubulovillous adenoma', 'villous adenoma']
 
     def __init__(self, text='', pat_mrn=None, polyps=None, candidate_buckets=None, full_report_text=None,
@@ -169,16 +176,10 @@ class PathReport(Report, AsDictMixin):
         return len([p for p in self.polyps if not p['histology']])
 
     def text_has_hist(self):
-        hist_regex = r'(' + ')|('.join(list(vocab.HIST_TYPES.keys())) + r')'
-        hist_match = re.search(hist_regex, self.text, re.IGNORECASE)
-        return True if hist_match else False
+        return self.has_keyword('hist')
 
     def text_has_bucket_4_hist(self):
-        hist_regex = r'(' + ')|('.join(self.bucket_4_hists) + r')'
-        hist_match = re.search(hist_regex, self.text, re.IGNORECASE)
-        return True if hist_match else False
+        return self.has_keyword('bucket_4_hist')
 
     def regex_malignancy(self):
-        mal_regex = r'(' + ')|('.join(vocab.PATH_MALIGNANCY) + r')'
-        match = re.search(mal_regex, self.text, re.IGNORECASE)
-        return True if match else False
+        return self.has_keyword('malignancy')
@@ -1,5 +1,4 @@
-import re
-from diaag_nlp_colon.config.colon import vocab
+from diaag_nlp_colon.services import diagnostics, keyword_scanner
 from spacy.language import Language
 
 
@@ -7,15 +6,27 @@ from spacy.language import Language
 
 @Language.component("col_keyword_filter")
 def col_keyword_filter(doc):
-    col_tp_regex = r'(' + ')|('.join(vocab.COL_KEYWORDS) + r')'
-    col_fp_regex = r'(' + ')|('.join(vocab.COL_FP_KEYWORDS) + r')'
-    tp_match = re.search(col_tp_regex, doc.text, re.IGNORECASE)
-    fp_match = re.search(col_fp_regex, doc.text, re.IGNORECASE)
+    tp_match, fp_match = find_col_keywords(doc.text)
     if fp_match:
         doc._.set('col_related', False)
-        print('\nfound non colon-related doc with FP term {}: \n{}'.format(fp_match, doc.text))
+        diagnostics.event('col_keyword_filter', 'non_colon_keyword', term=fp_match.term,
+                          start=fp_match.start, end=fp_match.end)
     elif tp_match:
         doc._.set('col_related', True)
     else:
         doc._.set('col_related', False)
     return doc
+
+
+# Search raw report text for colon-related and non colon-related keywords
+# returns: (first colon keyword match, first non-colon keyword match), either can be None
+def find_col_keywords(text):
+    hits = keyword_scanner.REPORT_SCANNER.scan(text, ['col', 'col_fp'])
+    return hits['col'], hits['col_fp']
+
+
+# Same decision as the col_keyword_filter component, made on raw text before tokenization
+# returns: True if report text is colon-related
+def is_col_related(text):
+    tp_match, fp_match = find_col_keywords(text)
+    return bool(tp_match) and not fp_match
@@ -1,6 +1,6 @@
 from diaag_nlp_colon.config.colon import vocab
 from diaag_nlp_colon.components import report_section_filter
-from diaag_nlp_colon.services import prop_getters
+from diaag_nlp_colon.services import false_pos_flags, prop_getters
 from spacy.language import Language
 import re
 
@@ -19,7 +19,7 @@ def extract_prep_quality(doc):
     worst_prep = None
     best_prep = None
     # Check for recorded quality of preparation or views
-    for ent in doc.ents:
+    for ent in false_pos_flags.valid_ents(doc):
         if ent.label_ == 'PREP_QUALITY':
             for token in ent:
                 if token.lower_ in vocab.COL_PREP_QUALITY:
@@ -63,7 +63,7 @@ def check_prep_quality(prep, worst, best):
 def extract_withdrawal_time(doc):
     withdrawal_time_min = None
     withdrawal_time_sec = None
-    for ent in doc.ents:
+    for ent in false_pos_flags.valid_ents(doc):
         # Format 1: "Withdrawal time was 6 minutes"
         if ent.label_ == 'WITHDRAWAL_TIME':
             for token in ent:
@@ -93,7 +93,7 @@ def extract_cecal_intubation(doc):
     # Initialize cecal_int by checking EXTENT_OF_EXAM
     cecal_int = check_exam_extent(doc)
     # Overwrite extent section with any CECAL_INT ents
-    for ent in doc.ents:
+    for ent in false_pos_flags.valid_ents(doc):
         if ent.label_ == 'CECAL_INT' and ent.ent_id_ == 'cecal_int_pos':
             cecal_int = True
         elif ent.label_ == 'CECAL_INT' and ent.ent_id_ == 'cecal_int_neg':
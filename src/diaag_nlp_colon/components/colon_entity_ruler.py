@@ -0,0 +1,52 @@
+import numpy
+from spacy.language import Language
+from spacy.pipeline.entityruler import DEFAULT_ENT_ID_SEP, EntityRuler
+from spacy.tokens import Span
+
+# Entity ruler used by the colon pipelines
+# spaCy's EntityRuler filters the doc's existing entities again after every accepted match, which is quadratic on
+# long reports that already have many (model) entities. This ruler finds the same matches and makes the same doc.ents,
+# removing the overwritten entities in one pass at the end.
+
+
+class ColonEntityRuler(EntityRuler):
+    def set_annotations(self, doc, matches):
+        new_entities = []
+        seen_tokens = set()
+        for match_id, start, end in matches:
+            if not self.overwrite and any(t.ent_type for t in doc[start:end]):
+                continue
+            # check for end - 1 here because boundaries are inclusive
+            if start not in seen_tokens and end - 1 not in seen_tokens:
+                if match_id in self._ent_ids:
+                    label, ent_id = self._ent_ids[match_id]
+                    span = Span(doc, start, end, label=label, span_id=ent_id)
+                else:
+                    span = Span(doc, start, end, label=match_id)
+                new_entities.append(span)
+                seen_tokens.update(range(start, end))
+        # existing entities that overlap a new one are overwritten
+        covered = numpy.zeros(len(doc) + 1, dtype=bool)
+        covered[list(seen_tokens)] = True
+        entities = [e for e in doc.ents if not covered[e.start:e.end].any()]
+        doc.ents = entities + new_entities
+
+
+@Language.factory(
+    "colon_entity_ruler",
+    assigns=["doc.ents", "token.ent_type", "token.ent_iob"],
+    default_config={
+        "phrase_matcher_attr": None,
+        "matcher_fuzzy_compare": {"@misc": "spacy.levenshtein_compare.v1"},
+        "validate": False,
+        "overwrite_ents": False,
+        "ent_id_sep": DEFAULT_ENT_ID_SEP,
+        "scorer": {"@scorers": "spacy.entity_ruler_scorer.v1"},
+    },
+    default_score_weights={"ents_f": 1.0, "ents_p": 0.0, "ents_r": 0.0, "ents_per_type": None},
+)
+def make_colon_entity_ruler(nlp, name, phrase_matcher_attr, matcher_fuzzy_compare, validate, overwrite_ents,
+                            ent_id_sep, scorer):
+    return ColonEntityRuler(nlp, name, phrase_matcher_attr=phrase_matcher_attr,
+                            matcher_fuzzy_compare=matcher_fuzzy_compare, validate=validate,
+                            overwrite_ents=overwrite_ents, ent_id_sep=ent_id_sep, scorer=scorer)
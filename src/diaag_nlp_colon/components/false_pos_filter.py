@@ -1,5 +1,8 @@
 import re
 from spacy.language import Language
+from spacy.util import normalize_slice
+from diaag_nlp_colon.config.colon import false_pos_rules
+from diaag_nlp_colon.services import diagnostics, false_pos_flags
 
 # Component to correct common NER errors using token context
 
@@ -7,65 +10,20 @@ from spacy.language import Language
 # remove entity Spans that contain a Token marked as a false positive
 @Language.component("remove_false_pos")
 def remove_false_pos(doc):
-    doc.ents = [ent for ent in doc.ents if not ent._.has_false_pos]
+    flags = false_pos_flags.get_flags(doc)
+    doc.ents = [ent for ent in doc.ents if not flags[ent.start:ent.end].any()]
     return doc
 
 
+# Separate false positive markers for pipelines assembled by hand, each applies the false_pos_rules.FP_RULES of some
+# entity labels (the assembled pipelines use mark_false_pos, which applies all of them in one pass)
+
 # remove location/size false positives, e.g. 'COLON AT 15 cm'
 @Language.component("mark_size_false_pos")
 def mark_size_false_pos(doc):
-    col_next_fps = ['snare', 'snares', 'number', 'quantity', 'amount',
-                    'clots', 'above', 'round', 'long', 'hiatal', 'erosions',
-                    'sec', 'second', 'area', 'from', 'circumference']
-    col_prev_fps = ['at', 'first', 'distal']
-    size_meas_regex = r'(centimeter|cm)|(mil?limeter|mm)'
-    report_type = doc._.get('report_type')
-    try:
-        test = doc.ents
-    except ValueError:
-        print('Error getting doc.ents')
-        doc.ents = []
-        return doc
-    for ent in doc.ents:
-        token = doc[ent.start]
-        prev_token = doc[ent.start - 1: ent.start]
-        next_token = doc[ent.end: ent.end + 1]
-        ent_context = doc[ent.start - 2: ent.end + 3]
-
-        if ent.label_ == 'POLYP_SIZE_MEAS':
-            next_next_token = doc[ent.end + 1:ent.end + 2]
-            if prev_token and prev_token.text.lower() in col_prev_fps:
-                token._.set('is_false_pos', True)
-            if next_token and next_token.text.lower() in col_next_fps:
-                token._.set('is_false_pos', True)
-            # Checking text of the 3 tokens after ent
-            following_text = doc[ent.end:ent.end + 4].text.lower()
-            if following_text and any([fp in following_text for fp in ['boston', 'scientific', 'circumference']]):
-                token._.set('is_false_pos', True)
-            # measurement check - if the units are not cm or mm, mark as FP
-            # NOTE: this filters too much out for Pathology
-            if report_type == 'col':
-                size_units_match = re.search(size_meas_regex, doc[ent.start: ent.end + 3].text, re.IGNORECASE)
-                if not size_units_match:
-                    # print('no units - found false positive size meas: {} {} {}'.format(prev_token.text, ent.text,
-                    #                                                                    doc[ent.end:ent.end + 5]))
-                    token._.set('is_false_pos', True)
-                if next_token.text.lower() == 'biopsy' and next_next_token.text.lower() == 'forceps':
-                    token._.set('is_false_pos', True)
-            # ulcer check
-            if mentions_ulcer(ent_context.text):
-                token._.set('is_false_pos', True)
-
-        if ent.label_ == 'POLYP_SIZE_NONSPEC':
-            if prev_token and prev_token.text.lower() == 'no':
-                token._.set('is_false_pos', True)
-            if next_token and next_token.text.lower() in col_next_fps:
-                token._.set('is_false_pos', True)
-            # ulcer check
-            if mentions_ulcer(ent_context.text):
-                token._.set('is_false_pos', True)
-
-    return doc
+    # the units and biopsy forceps rules only apply to colonoscopy reports
+    report_type = 'col' if doc._.get('report_type') == 'col' else 'path'
+    return _mark_labels(doc, 'mark_size_false_pos', report_type, ['POLYP_SIZE_MEAS', 'POLYP_SIZE_NONSPEC'])
 
 
 @Language.component("mentions_ulcer")
@@ -78,115 +36,221 @@ def mentions_ulcer(ent_context):
 # pathology: "specimen received in two containers" ...
 @Language.component("mark_quant_false_pos")
 def mark_quant_false_pos(doc):
-    path_prev_fps = []
-    path_next_fps = ['container', 'containers', 'deeper']
-    try:
-        test = doc.ents
-    except ValueError:
-        print('Error getting doc.ents')
-        doc.ents = []
-        return doc
-    for ent in doc.ents:
-        if ent.label_ == 'POLYP_QUANT':
-            prev_token = doc[ent.start - 1: ent.start]
-            next_token = doc[ent.end: ent.end + 1]
-            if '#' in ent.text:
-                doc[ent.start]._.set('is_false_pos', True)
-            if prev_token and prev_token.text.lower() in path_prev_fps:
-                doc[ent.start]._.set('is_false_pos', True)
-            if next_token and next_token.text.lower() in path_next_fps:
-                doc[ent.start]._.set('is_false_pos', True)
-    return doc
+    return _mark_labels(doc, 'mark_quant_false_pos', 'path', ['POLYP_QUANT'])
 
 
 # mark quantity false positives for removal
 # sometimes size is mistaken for quantity, e.g. 14-mm or 10-15mm polyp
 @Language.component("mark_quant_false_pos_col")
 def mark_quant_false_pos_col(doc):
-    col_next_fps = ['mm', 'cm', 'millimeter', 'centimeter']
-    try:
-        test = doc.ents
-    except ValueError:
-        print('Error getting doc.ents')
-        doc.ents = []
-        return doc
-    for ent in doc.ents:
-        if ent.label_ == 'POLYP_QUANT':
-            context = doc[ent.start: ent.end + 1].text.lower()
-            # TODO: test changing the following condition from AND --> OR
-            if any([fp in context for fp in col_next_fps]) and not doc[ent.start].like_num:
-                print('found false positive quant ent: {}'.format(context))
-                doc[ent.start]._.set('is_false_pos', True)
-    return doc
+    return _mark_labels(doc, 'mark_quant_false_pos_col', 'col', ['POLYP_QUANT'])
 
 
 # mark location false positives for removal
 @Language.component("mark_loc_false_pos")
 def mark_loc_false_pos(doc):
-    path_prev_fps = ['labelled "', 'designated as']
-    try:
-        test = doc.ents
-    except ValueError:
-        print('Error getting doc.ents')
-        doc.ents = []
-        return doc
-    for ent in doc.ents:
-        if ent.label_ == 'POLYP_LOC':
-            prev_tokens = doc[ent.start - 2: ent.start]
-            if any([fp in prev_tokens.text for fp in path_prev_fps]):
-                print('found false positive loc ent: {} {}'.format(prev_tokens.text, ent.text))
-                doc[ent.start]._.set('is_false_pos', True)
-    return doc
+    return _mark_labels(doc, 'mark_loc_false_pos', 'path', ['POLYP_LOC'])
 
 
 # mark polyp sample false positives for removal
 @Language.component("mark_sample_false_pos")
 def mark_sample_false_pos(doc):
-    try:
-        test = doc.ents
-    except ValueError:
-        print('Error getting doc.ents')
-        doc.ents = []
-        return doc
-    for ent in doc.ents:
-        if ent.label_ == 'POLYP_SAMPLE':
-            prev_token = doc[ent.start - 1:ent.start]
-            prev_tokens = doc[ent.start - 3: ent.start]
-            if prev_tokens.text.lower() == 'no evidence of':
-                doc[ent.start]._.set('is_false_pos', True)
-            if prev_token.text.lower() == 'no':
-                doc[ent.start]._.set('is_false_pos', True)
-        if ent.label_ == 'SAMPLE':
-            if ent[0].lower_ == 'diagnosis':
-                doc[ent.start]._.set('is_false_pos', True)
-
-    return doc
+    return _mark_labels(doc, 'mark_sample_false_pos', 'col', ['POLYP_SAMPLE', 'SAMPLE'])
 
 
 # mark malignant histology false positives for removal
 @Language.component("mark_malignancy_false_pos")
 def mark_malignancy_false_pos(doc):
-    for ent in doc.ents:
-        if ent.label_ == 'MALIGNANCY':
-            prev_tokens = doc[ent.start - 8: ent.start]
-            if any(token.lower_ in ['negative', 'no'] for token in prev_tokens):
-                doc[ent.start]._.set('is_false_pos', True)
-    return doc
+    return _mark_labels(doc, 'mark_malignancy_false_pos', 'path', ['MALIGNANCY'])
 
 
 @Language.component("mark_proc_false_pos_col")
 def mark_proc_false_pos_col(doc):
-    for ent in doc.ents:
-        next_tokens = doc[ent.end: ent.end + 3]
-        prev_tokens = doc[ent.start - 3: ent.start]
-        if ent.label_ == 'POLYP_PROC' and ent.ent_id_ == 'proc_biopsy_taken':
-            if any(token.lower_ in ['forcep', 'forceps'] for token in next_tokens):
-                doc[ent.start]._.set('is_false_pos', True)
-            if any(token.lower_ in ['random', 'removed', 'cold'] for token in prev_tokens):
-                doc[ent.start]._.set('is_false_pos', True)
+    return _mark_labels(doc, 'mark_proc_false_pos_col', 'col', ['POLYP_PROC'])
+
+
+# Mark false positives of some labels only, with the rules of a pipeline
+def _mark_labels(doc, name, report_type, labels):
+    rules = false_pos_rules.FP_RULES[report_type]
+    label_rules = compile_rules({label: rules[label] for label in labels}, doc.vocab.strings)
+    return _mark_ents(doc, name, label_rules)
+
+
+# region fused false positive marking
+
+# units of a measured size
+SIZE_MEAS_REGEX = re.compile(r'(centimeter|cm)|(mil?limeter|mm)', re.IGNORECASE)
+
+
+# Mark false positives for all colonoscopy or pathology rules (config.colon.false_pos_rules) in one pass over
+# the ents, then remove the marked ents. Replaces the separate mark_*_false_pos + remove_false_pos components.
+# Rule word lists are compiled to StringStore hashes, context tokens are compared by their integer ids.
+# optional config: defer_removal, leave the marked ents in place for a later remove_false_pos
+@Language.factory("mark_false_pos", default_config={"report_type": "col", "defer_removal": False})
+def create_false_pos_marker(nlp, name, report_type, defer_removal=False):
+    label_rules = compile_rules(false_pos_rules.FP_RULES[report_type], nlp.vocab.strings)
+
+    def mark_false_pos(doc):
+        doc = _mark_ents(doc, name, label_rules)
+        return doc if defer_removal else remove_false_pos(doc)
+
+    return mark_false_pos
+
+
+# Mark every entity that matches a rule of its label
+# params: doc, component name (for diagnostics), compiled rules per label hash (see compile_rules)
+def _mark_ents(doc, name, label_rules):
+    try:
+        ents = false_pos_flags.valid_ents(doc)
+    except ValueError:
+        diagnostics.logger.warning('%s: could not get doc.ents', name)
+        doc.ents = []
+        return doc
+    for ent in ents:
+        for check, rule in label_rules.get(ent.label, []):
+            if 'ent_id' in rule and ent.ent_id != rule['ent_id']:
+                continue
+            if check(doc, ent, rule):
+                false_pos_flags.mark(doc, ent.start)
+                diagnostics.event(name, rule['check'], ent)
+                break
     return doc
 
 
+# Rules of false_pos_rules.FP_RULES[report_type] with their checks, keyed by the label's hash
+# returns: dict of label hash -> list of (check function, compiled rule)
+def compile_rules(rules_by_label, strings):
+    return {
+        strings.add(label): [(FP_CHECKS[rule['check']], compile_rule(rule, strings)) for rule in rules]
+        for label, rules in rules_by_label.items()
+    }
+
+
+# Rule with its word list as hashes:
+#   words -> frozenset of hashes (lowercase, or exact text if case_sensitive)
+#   phrases -> list of tuples of hashes, one per whitespace-separated word
+#   ent_id -> hash
+def compile_rule(rule, strings):
+    compiled = dict(rule)
+    words = rule.get('words', [])
+    if not rule.get('case_sensitive'):
+        words = [word.lower() for word in words]
+    compiled['words'] = frozenset(strings.add(word) for word in words)
+    compiled['phrases'] = [tuple(strings.add(part) for part in word.split(' ')) for word in words]
+    if 'ent_id' in rule:
+        compiled['ent_id'] = strings.add(rule['ent_id'])
+    return compiled
+
+
+# Token bounds of the context doc[start:end] as a section doc sees it
+# With a section window (doc._.section_bounds, see report_section_filter.set_section_window) the slice is taken within
+# the window, the same as slicing the section copy made by the default section filters: context checks never read
+# tokens outside the section, negative starts count from the end of the section and an inverted range is empty.
+def _context_bounds(doc, start, end):
+    section_start, section_end = doc._.section_bounds or (0, len(doc))
+    start, end = normalize_slice(section_end - section_start, start - section_start, end - section_start)
+    return start + section_start, end + section_start
+
+
+# Token positions of the context doc[start:end], without making the Span
+def _token_range(doc, start, end):
+    return range(*_context_bounds(doc, start, end))
+
+
+# Span of the context doc[start:end]
+def _context(doc, start, end):
+    start, end = _context_bounds(doc, start, end)
+    return doc[start:end]
+
+
+# Hash the rule compares a token by: lowercase form, or exact text for case-sensitive rules
+def _token_key(token, rule):
+    return token.orth if rule.get('case_sensitive') else token.lower
+
+
+# Context checks used by the false positive rules
+# params: doc, entity Span, compiled rule dict
+# returns: True if the entity is a false positive
+
+def _prev_word(doc, ent, rule):
+    return any(_token_key(doc[i], rule) in rule['words'] for i in _token_range(doc, ent.start - 1, ent.start))
+
+
+def _next_word(doc, ent, rule):
+    return any(_token_key(doc[i], rule) in rule['words'] for i in _token_range(doc, ent.end, ent.end + 1))
+
+
+def _prev_words(doc, ent, rule):
+    return any(_token_key(doc[i], rule) in rule['words'] for i in _token_range(doc, ent.start - rule['window'], ent.start))
+
+
+def _next_words(doc, ent, rule):
+    return any(_token_key(doc[i], rule) in rule['words'] for i in _token_range(doc, ent.end, ent.end + rule['window']))
+
+
+def _next_words_equal(doc, ent, rule):
+    return any(_is_phrase_at(doc, ent.end, phrase, rule) for phrase in rule['phrases'])
+
+
+# phrase (words separated by single spaces) right before the entity
+def _prev_phrase(doc, ent, rule):
+    return any(_is_phrase_at(doc, ent.start - len(phrase), phrase, rule) for phrase in rule['phrases'])
+
+
+def _is_phrase_at(doc, start, phrase, rule):
+    if _context_bounds(doc, start, start + len(phrase)) != (start, start + len(phrase)):
+        return False
+    for offset, word in enumerate(phrase):
+        token = doc[start + offset]
+        if _token_key(token, rule) != word:
+            return False
+        # words of the phrase are separated by exactly one space
+        if offset < len(phrase) - 1 and doc[start + offset + 1].idx != token.idx + len(token) + 1:
+            return False
+    return True
+
+
+# substring of the entity text, e.g. '#' glued to other characters in 'A#2'
+# (a substring can't span tokens, so each token text is searched instead of building ent.text)
+def _ent_contains(doc, ent, rule):
+    return any(substring in token.text for token in ent for substring in rule['substrings'])
+
+
+def _first_word(doc, ent, rule):
+    return _token_key(ent[0], rule) in rule['words']
+
+
+# units can be glued to the number (e.g. '14-mm', '10-15mm'), so these checks search the context text
+def _no_size_units(doc, ent, rule):
+    return not SIZE_MEAS_REGEX.search(_context(doc, ent.start, ent.end + rule['window']).text)
+
+
+def _size_unit_quant(doc, ent, rule):
+    context = _context(doc, ent.start, ent.end + 1).text.lower()
+    return any([fp in context for fp in rule['unit_words']]) and not doc[ent.start].like_num
+
+
+def _mentions_ulcer(doc, ent, rule):
+    return bool(mentions_ulcer(_context(doc, ent.start - 2, ent.end + 3).text))
+
+
+FP_CHECKS = {
+    'prev_word': _prev_word,
+    'next_word': _next_word,
+    'prev_words': _prev_words,
+    'next_words': _next_words,
+    'next_words_equal': _next_words_equal,
+    'prev_phrase': _prev_phrase,
+    'ent_contains': _ent_contains,
+    'first_word': _first_word,
+    'no_size_units': _no_size_units,
+    'size_unit_quant': _size_unit_quant,
+    'mentions_ulcer': _mentions_ulcer,
+}
+
+# endregion
+
+
 # Check if lesion described in report is actually from a previous procedure + ignore those entities
 @Language.component("filter_previous_breast_lesions")
 def filter_previous_breast_lesions(doc):
@@ -211,18 +275,18 @@ def mark_breast_lesion_false_pos(doc):
             sent = ent.sent
             prec = doc[sent.start: ent.start]
             if any([token.lower_ in ['no'] for token in prec]):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
             # another negation: "non-mass" (enhancement, etc)
             if doc[ent.start - 2: ent.start].text.lower() == 'non-':
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
             # Filter out known false pos matches
             if any([token.lower_ in fp_vocab for token in ent]):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
             # Check if notes are referring to a lesion seen on another exam, or estimated lesion type
             if any([token.lower_ in pre_fp for token in doc[ent.start - 5: ent.start]]):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
             if any([token.lower_ in post_fp for token in doc[ent.end: ent.end + 3]]):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
     return doc
 
 
@@ -232,7 +296,7 @@ def mark_breast_lesion_size_false_pos(doc):
     for ent in size_ents:
         next_tokens = doc[ent.end: ent.end + 3]
         if any([token.lower_ in ["deep", "marker"] for token in next_tokens]):
-            doc[ent.start]._.set('is_false_pos', True)
+            false_pos_flags.mark(doc, ent.start)
     return doc
 
 
@@ -243,27 +307,27 @@ def mark_breast_path_false_pos(doc):
     for sent in doc.sents:
         if doc[sent.start].ent_id_ == 'section_CM':
             for ent in sent.ents[1:]:
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
     for ent in doc.ents:
         # Ignore entities labelled in "surgical margins" description
         if ent.label_ == 'SURG_MARGINS':
             for ent in doc[ent.end: ent.sent.end].ents:
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
         # Filter out unrelated measurement (sometimes noted with mitotic score)
         if ent.label_ == 'SIZE':
            if doc[ent.end].lower_ in ['field', 'diameter']:
-               doc[ent.start]._.set('is_false_pos', True)
+               false_pos_flags.mark(doc, ent.start)
            if any(['margin' in token.lower_ for token in ent.sent]):
-               doc[ent.start]._.set('is_false_pos', True)
+               false_pos_flags.mark(doc, ent.start)
         if ent.label_ == 'HIST':
             if any(token.lower_ in ['negative', 'no', 'not'] for token in ent.sent):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
         if ent.label_ == 'CLOCK':
             if any(['margin' in token.text for token in ent.sent]):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
             next_tokens = doc[ent.end: ent.end + 3]
             if any([token.lower_ in ["am", "pm"] for token in next_tokens]):
-                doc[ent.start]._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, ent.start)
     return doc
 
 
@@ -276,5 +340,5 @@ def mark_prostate_path_false_pos(doc):
         if ent.ent_id_ == 'section_SR':
             summary = True
         if summary and ent.label_ not in ['WEIGHT', 'STAGING']:
-            doc[ent.start]._.set('is_false_pos', True)
+            false_pos_flags.mark(doc, ent.start)
     return doc
@@ -4,6 +4,7 @@ from spacy.language import Language
 from diaag_nlp_colon.components import false_pos_filter
 from diaag_nlp_colon.config.num_words import num_words
 from diaag_nlp_colon.config.colon import vocab
+from diaag_nlp_colon.services import diagnostics, false_pos_flags, keyword_scanner, prop_getters
 
 # region colon polyp extractors
 
@@ -28,10 +29,10 @@ def polyp_property_extractor_path(doc):
     }
 
     # handle case where there is no regex sample but there's still a sample
-    has_sample_regex = any([t.ent_type_ == 'POLYP_SAMPLE_REGEX' for t in doc])
+    doc_ents = false_pos_flags.valid_ents(doc)
+    has_sample_regex = any([ent.label_ == 'POLYP_SAMPLE_REGEX' for ent in doc_ents])
     if not has_sample_regex:
-        hist_regex = r'(' + ')|('.join(vocab.HIST_TYPES) + r')'
-        hist_match = re.search(hist_regex, doc.text, re.IGNORECASE)
+        hist_match = keyword_scanner.REPORT_SCANNER.search(doc._.relevant_section.text_with_ws, 'hist')
         if hist_match:
             polyp['sample'] = True
             doc_polyps.append(polyp)
@@ -40,13 +41,13 @@ def polyp_property_extractor_path(doc):
     # e.g. (BIOPSY A): or (SNARE POLYPECTOMY A): or (SNARE POLYPECTOMY AND BIOPSY A):
     # if any of those ents: add new polyp on LOCATION (rather than regex sample) or HIST (same)
 
-    for ent in doc.ents:
+    for ent in doc_ents:
         if ent.label_ == 'POLYP_SAMPLE_REGEX':
             # check for H. Pylori false positive
             token = doc[ent.start]
             next_token = doc[ent.end: ent.end + 1]
             if next_token and 'pylori' in next_token.text.lower():
-                token._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, token.i)
                 continue
             # Move on to new polyp
             polyp = {
@@ -89,7 +90,7 @@ def polyp_property_extractor_path(doc):
         elif ent.label_ == 'POLYP_CYT_DYSPLASIA':
             if 'cytologic' not in ent.text.lower():
                 token = doc[ent.start]
-                token._.set('is_false_pos', True)
+                false_pos_flags.mark(doc, token.i)
                 continue
             hist = polyp['histology']
             neg = re.search(r'(no)|(negative)', ent.text, re.IGNORECASE)
@@ -125,9 +126,13 @@ def polyp_property_extractor_col(doc):
         return doc
 
     doc_polyps = []
+    # polyps in doc_polyps without a location, waiting for one to be backpropagated
+    unlocated_polyps = []
     doc_prop_vals = {'doc_quant': 0, 'max_size': 0}
-    for sent in doc.sents:
-        if not sent._.has_sample or not sent._.has_props:
+    # sentence entity counts and entities, computed once for the doc
+    sent_table = prop_getters.sentence_ent_table(doc)
+    for sent_i, sent_ents in enumerate(false_pos_flags.valid_ents_by_sent(doc)):
+        if not sent_table.has_sample[sent_i] or not sent_table.has_props[sent_i]:
             continue
         polyp = {
             'location': '',
@@ -142,13 +147,13 @@ def polyp_property_extractor_col(doc):
         # if there are multiple polyp sizes or locations in the sentence, we should have multiple polyps/obs
         multi_loc = False
         multi_size = False
-        if sent._.loc_count > 1:
+        if sent_table.loc_count[sent_i] > 1:
             multi_loc = True
             polyp['multi'] = True
-        elif sent._.size_meas_count > 1:
+        elif sent_table.size_meas_count[sent_i] > 1:
             multi_size = True
             polyp['multi'] = True
-        for ent in sent.ents:
+        for ent in sent_ents:
             if ent.label_ == 'POLYP_LOC':
                 polyp['location'] = ent.text
                 if multi_loc:
@@ -160,15 +165,15 @@ def polyp_property_extractor_col(doc):
                     polyp['quantity_approx'] = None
                     polyp['retained'] = False
                     # **backpropagate location** to prev polyps (if None)
-                    for prev_polyp in doc_polyps:
-                        if not prev_polyp['location']:
-                            prev_polyp['location'] = ent.text
+                    for prev_polyp in unlocated_polyps:
+                        prev_polyp['location'] = ent.text
+                    unlocated_polyps.clear()
             elif ent.label_ == 'POLYP_MORPH':
                 polyp['morphology'] = ent.text
             elif ent.label_ == 'POLYP_QUANT':
                 quant = extract_quantity(ent)
                 if not quant:
-                    print('In property extraction: could not extract quantity from ent:', ent)
+                    diagnostics.event('polyp_property_extractor_col', 'no_quantity', ent)
                 elif type(quant) is str:
                     polyp['quantity_approx'] = quant
                 else:
@@ -182,7 +187,7 @@ def polyp_property_extractor_col(doc):
                     # large sizes are probably false positives
                     if size > 8:
                         token = doc[ent.start]
-                        token._.set('is_false_pos', True)
+                        false_pos_flags.mark(doc, token.i)
                         continue
                     if size >= 1.0:
                         doc._.set('has_large_polyp', True)
@@ -198,9 +203,12 @@ def polyp_property_extractor_col(doc):
                         polyp['quantity'] = None
                         polyp['quantity_approx'] = None
                         # **backpropagate location** to prev polyps (if None)
-                        for prev_polyp in doc_polyps:
-                            if not prev_polyp['location'] and polyp['location']:
+                        if polyp['location']:
+                            for prev_polyp in unlocated_polyps:
                                 prev_polyp['location'] = polyp['location']
+                            unlocated_polyps.clear()
+                        else:
+                            unlocated_polyps.append(doc_polyps[-1])
             elif ent.label_ == 'POLYP_SIZE_NONSPEC':
                 polyp['size_approx'] = ent.text.lower()
                 if ent.text.lower() in ['large', 'giant', 'huge']:
@@ -214,6 +222,8 @@ def polyp_property_extractor_col(doc):
 
         if not multi_loc and not multi_size:
             doc_polyps.append(polyp)
+            if not polyp['location']:
+                unlocated_polyps.append(polyp)
 
     # add to user_data storage of doc
     doc.user_data['polyps'] = doc_polyps[:]
@@ -273,7 +283,7 @@ def extract_size_meas(ent):
     if 'mm' in ent.text.lower() or 'millimeters' in ent.text.lower():
         sizes = [size / 10 for size in sizes]
     if len(sizes) == 0:
-        print('In property extraction: no measurement found in str:', ent)
+        diagnostics.event('extract_size_meas', 'no_measurement', ent)
         return None
     return sorted(sizes, reverse=True)[0]
 
@@ -285,7 +295,7 @@ def extract_dimensions(ent):
     if matches:
         sizes = [int(float(i)) for i in matches]
     if len(sizes) == 0:
-        print('In property extraction: no measurement found in str:', ent)
+        diagnostics.event('extract_dimensions', 'no_measurement', ent)
     if len(sizes) < 3:
         sizes.extend([None for i in range(3 - len(sizes))])
     return sizes[:3]
@@ -308,7 +318,7 @@ def extract_quantity(ent):
             num_words_dict[word] = idx
         num_str = ' '.join([t.lower_ for t in ent if t.like_num])
         if num_str not in num_words_dict:
-            print('In property extraction: no matching number for', num_str)
+            diagnostics.event('extract_quantity', 'no_matching_number', ent)
         else:
             quant = num_words_dict[num_str]
     # specific word for number ("single", "a")
@@ -316,7 +326,7 @@ def extract_quantity(ent):
         quant = 1
     # nonspecific number ("multiple", "many") <- Do not currently translate into integer quantity
     else:
-        print('In property extraction: suspicious quantity ent:', ent.text)
+        diagnostics.event('extract_quantity', 'nonspecific_quantity', ent)
         quant = ent.text
     return quant
 
@@ -1,8 +1,91 @@
-from diaag_nlp_colon.components import false_pos_filter
+from diaag_nlp_colon.config.colon import col_patterns, path_patterns
+from diaag_nlp_colon.services import diagnostics, false_pos_flags
+from diaag_nlp_colon.services.section_index import get_section_index
+from diaag_nlp_colon.services.section_splitter import SectionSplitter
 from spacy.language import Language
+from spacy.util import minibatch
 
 # Component to process Docs according to section headers in report text
 
+# Header patterns and ids of the sections kept by extract_relevant_sections_col / extract_relevant_sections_path
+RELEVANT_SECTIONS = {
+    'col': (col_patterns.header_patterns, ['section_FIN', 'section_DOTP']),
+    'path': (path_patterns.header_patterns, ['section_FD'])
+}
+
+
+# Run the trained model pipes (tok2vec + ner) only on the report section that is kept later in the pipeline
+# The section is located on the raw text, before tokens exist, and the predicted entities are mapped back
+# onto the full doc. The whole doc is used if the section is not found, and the model is skipped entirely
+# for reports that are not colon-related (their entities are dropped by the section filters anyway).
+# The model pipes stay in the pipeline, disabled, so their weights are still saved and loaded with it.
+@Language.factory("section_ner", default_config={"report_type": "col", "model_pipes": ["tok2vec", "ner"]})
+def create_section_ner(nlp, name, report_type, model_pipes):
+    return SectionNER(nlp, report_type, model_pipes)
+
+
+class SectionNER:
+
+    def __init__(self, nlp, report_type, model_pipes):
+        self.nlp = nlp
+        header_patterns, self.section_ids = RELEVANT_SECTIONS[report_type]
+        self.splitter = SectionSplitter(header_patterns)
+        self.model_pipe_names = model_pipes
+
+    def __call__(self, doc):
+        return next(self.pipe([doc]))
+
+    def pipe(self, docs, batch_size=128):
+        # model pipes are looked up on first use, they are created after this component when loading from disk
+        model_pipes = [self.nlp.get_pipe(name) for name in self.model_pipe_names]
+        for batch in minibatch(docs, batch_size):
+            # (doc, doc the model runs on, char offset of that doc in the original)
+            targets = []
+            for doc in batch:
+                ner_range = self.ner_range(doc)
+                if ner_range is None:
+                    continue
+                start, end = ner_range
+                if start == 0 and end == len(doc.text):
+                    targets.append((doc, doc, 0))
+                else:
+                    targets.append((doc, self.nlp.make_doc(doc.text[start:end]), start))
+
+            model_docs = [model_doc for _, model_doc, _ in targets]
+            for model_pipe in model_pipes:
+                # plain function components have no pipe method, run them per doc (like spacy.util._pipe)
+                if hasattr(model_pipe, 'pipe'):
+                    model_docs = list(model_pipe.pipe(model_docs, batch_size=batch_size))
+                else:
+                    model_docs = [model_pipe(model_doc) for model_doc in model_docs]
+
+            for (doc, _, offset), model_doc in zip(targets, model_docs):
+                if model_doc is not doc:
+                    spans = [
+                        doc.char_span(offset + ent.start_char, offset + ent.end_char, label=ent.label_,
+                                      alignment_mode='contract')
+                        for ent in model_doc.ents
+                    ]
+                    doc.ents = [span for span in spans if span is not None and len(span) > 0]
+            yield from batch
+
+    # Character range of the doc text the model should run on, or None to skip the model
+    def ner_range(self, doc):
+        if not doc._.col_related:
+            return None
+        section_range = self.splitter.section_range(doc.text, self.section_ids)
+        return section_range if section_range else (0, len(doc.text))
+
+
+# Tag each doc with the report type of the pipeline that is processing it
+# (read by components whose rules differ between colonoscopy and pathology reports)
+@Language.factory("set_report_type", default_config={"report_type": None})
+def create_report_type_setter(nlp, name, report_type):
+    def set_report_type(doc):
+        doc._.set('report_type', report_type)
+        return doc
+    return set_report_type
+
 
 # Only keep ents in Final Diagnosis section
 @Language.component("filter_outside_ents_path")
@@ -52,6 +135,26 @@ def get_following_sections(doc):
     return after_fd, after_gd
 
 
+# Token bounds of the report section kept for pathology: first Final Diagnosis section
+# returns: (start, end), the whole doc if there are no section headers
+def relevant_section_bounds_path(doc):
+    section_index = get_section_index(doc)
+    section_start = 0
+    section_end = len(doc)
+
+    # if no headers were found, just process entire doc
+    if len(section_index.headers) == 0:
+        return section_start, section_end
+
+    # TODO: review decision to only use first FD section
+    # Some revised reports have multiple FD sections, only take first
+    section_bounds = section_index.section_bounds(['section_FD'], first=True)
+    if section_bounds:
+        section_start, section_end = section_bounds
+
+    return section_start + 1, section_end
+
+
 # make new doc with only relevant report sections for pathology
 @Language.component("extract_relevant_sections_path")
 def extract_relevant_sections_path(doc):
@@ -60,36 +163,35 @@ def extract_relevant_sections_path(doc):
         # doc.user_data['full_report_text'] = doc.text
         return doc
 
-    section_headers = doc._.get('section_header_list')
-    section_start = 0
-    section_end = len(doc)
-
     # if no headers were found, just process entire doc
-    if len(section_headers) == 0:
+    if len(get_section_index(doc).headers) == 0:
         # doc.user_data['full_report_text'] = doc.text
         return doc
 
-    # TODO: review decision to only use first FD section
-    if len(section_headers) > 0:
-        for idx, header_ent in enumerate(section_headers):
-            if header_ent.ent_id_ in ['section_FD']:
-                section_start = header_ent.end
-                if idx < len(section_headers) - 1:
-                    section_end = section_headers[idx + 1].start
-                else:
-                    section_end = len(doc)
-                # Some revised reports have multiple FD sections, only take first
-                break
+    section_start, section_end = relevant_section_bounds_path(doc)
 
     # turn section into its own doc
-    section_span = doc[section_start+1:section_end]
+    section_span = doc[section_start:section_end]
     section_doc = section_span.as_doc()
     section_doc._.set('col_related', True)
+    section_doc._.set('report_type', doc._.report_type)
+    copy_false_pos_flags(doc, section_doc, section_start, section_end)
     # section_doc.user_data['full_report_text'] = doc.text
 
     return section_doc
 
 
+# Alternative to extract_relevant_sections_path: keep the full doc and only record the section window on it
+@Language.component("select_relevant_sections_path")
+def select_relevant_sections_path(doc):
+    if not doc._.col_related:
+        doc.ents = []
+        return doc
+
+    section_start, section_end = relevant_section_bounds_path(doc)
+    return set_section_window(doc, section_start, section_end)
+
+
 # Only keep ents in Findings or Description of the Procedure sections
 @Language.component("filter_outside_ents_col")
 def filter_outside_ents_col(doc):
@@ -120,33 +222,23 @@ def filter_outside_ents_col(doc):
     return doc
 
 
-# make new doc with only relevant report sections
-@Language.component("extract_relevant_sections_col")
-def extract_relevant_sections_col(doc):
-    if not doc._.col_related:
-        doc.ents = []
-        return doc
-
-    section_headers = doc._.get('section_header_list')
+# Token bounds of the report section kept for colonoscopy: first Findings or Description of the Procedure section
+# returns: (start, end), the whole doc if there is no such section
+def relevant_section_bounds_col(doc):
+    section_index = get_section_index(doc)
     section_start = 0
     section_end = len(doc)
 
-    findings = False
     # if no headers were found, just process entire doc
-    if len(section_headers) > 0:
-        for idx, header_ent in enumerate(section_headers):
-            if header_ent.ent_id_ in ['section_FIN', 'section_DOTP']:
-                findings = True
-                section_start = header_ent.end
-                if idx < len(section_headers) - 1:
-                    section_end = section_headers[idx + 1].start
-                else:
-                    section_end = len(doc)
-                # I think the ADDENDUM findings get cut off, should use first findings section
-                break
+    if len(section_index.headers) > 0:
+        # I think the ADDENDUM findings get cut off, should use first findings section
+        section_bounds = section_index.section_bounds(['section_FIN', 'section_DOTP'], first=True)
+        if section_bounds:
+            section_start, section_end = section_bounds
 
         # use DESCRIPTION OF PROCEDURE section (only if there is no FINDINGS or DOTP section)
-        if not findings:
+        else:
+            section_headers = section_index.header_spans(doc)
             for idx, header_ent in enumerate(section_headers):
                 if header_ent.ent_id == 'section_DOP':
                     section_start = header_ent.end
@@ -155,6 +247,18 @@ def extract_relevant_sections_col(doc):
                     else:
                         section_end = len(doc)
 
+    return section_start, section_end
+
+
+# make new doc with only relevant report sections
+@Language.component("extract_relevant_sections_col")
+def extract_relevant_sections_col(doc):
+    if not doc._.col_related:
+        doc.ents = []
+        return doc
+
+    section_start, section_end = relevant_section_bounds_col(doc)
+
     try:
         # turn section into its own doc
         section_span = doc[section_start:section_end]
@@ -163,43 +267,70 @@ def extract_relevant_sections_col(doc):
 
         # copy over extracted props and flags from original doc
         section_doc._.set('col_related', doc._.col_related)
+        section_doc._.set('report_type', doc._.report_type)
         section_doc.user_data['extracted_props'] = doc.user_data['extracted_props'].copy()
         section_doc._.set('has_poor_prep', doc._.has_poor_prep)
         section_doc._.set('has_incomplete_proc', doc._.has_incomplete_proc)
         section_doc._.set('has_retained_polyp', doc._.has_retained_polyp)
         section_doc._.set('has_removed_piecemeal', doc._.has_removed_piecemeal)
+        copy_false_pos_flags(doc, section_doc, section_start, section_end)
 
     except ZeroDivisionError:
-        print('Could not make section doc')
+        diagnostics.logger.warning('extract_relevant_sections_col: could not make section doc')
         # doc.user_data['full_report_text'] = doc.text
         return doc
 
     return section_doc
 
 
+# Carry pending false positive removals over to a section doc made from doc[section_start:section_end]
+def copy_false_pos_flags(doc, section_doc, section_start, section_end):
+    section_flags = false_pos_flags.get_flags(doc)[section_start:section_end]
+    if section_flags.any():
+        false_pos_flags.get_flags(section_doc)[:] = section_flags
+
+
+# Alternative to extract_relevant_sections_col: keep the full doc and only record the section window on it
+# (extracted props and flags stay on the doc, nothing has to be copied)
+@Language.component("select_relevant_sections_col")
+def select_relevant_sections_col(doc):
+    if not doc._.col_related:
+        doc.ents = []
+        return doc
+
+    section_start, section_end = relevant_section_bounds_col(doc)
+    return set_section_window(doc, section_start, section_end)
+
+
+# Restrict a doc to a section window instead of copying the section into a new doc:
+# records the token bounds (doc._.section_bounds, doc._.relevant_section), marks ents outside of them for removal
+# and starts new sentences at the window edges, so later components see the same ents and sentences.
+# Components that read context around an entity must stay inside the bounds (see false_pos_filter._context_bounds).
+def set_section_window(doc, section_start, section_end):
+    doc._.set('section_bounds', (section_start, section_end))
+    for ent in doc.ents:
+        if ent.start < section_start or ent.end > section_end:
+            false_pos_flags.mark(doc, ent.start)
+    for token_i in (section_start, section_end):
+        if 0 < token_i < len(doc) and section_start < section_end:
+            doc[token_i].is_sent_start = True
+    return doc
+
+
 # extract span contents of report section (starting after header ent, ending at next section header)
 #   for example, the indications section:
 #   INDICATIONS FOR EXAMINATION:      Screening Colonoscopy.
 #   function returns span with tokenized string for "Screening Colonoscopy."
 @Language.component("extract_section_span")
 def extract_section_span(doc, section_id):
-    section_headers = doc._.get('section_header_list')
-    section_start = 0
-    section_end = len(doc)
+    # uses the last header of that type
+    section_bounds = get_section_index(doc).section_bounds(section_id)
 
-    # If there are no headers of that type, return empty list
-    if not any([ent.ent_id_ == section_id for ent in doc.ents]):
+    # If there are no headers of that type, return None
+    if section_bounds is None:
         return None
 
-    if len(section_headers) > 0:
-        for idx, header_ent in enumerate(section_headers):
-            if header_ent.ent_id_ == section_id:
-                section_start = header_ent.end
-                if idx < len(section_headers) - 1:
-                    section_end = section_headers[idx + 1].start
-                else:
-                    section_end = len(doc)
-
+    section_start, section_end = section_bounds
     return doc[section_start: section_end]
 
 
@@ -225,9 +356,10 @@ def filter_outside_properties_col(doc):
 
     for ent in doc.ents:
         if ent.start <= boundary_pos and ent.label_ != 'SECTION_HEADER':
-            doc[ent.start]._.set('is_false_pos', True)
+            false_pos_flags.mark(doc, ent.start)
 
-    return false_pos_filter.remove_false_pos(doc)
+    # removal is deferred to the pipeline's final remove_false_pos
+    return doc
 
 
 # make new doc with only relevant report sections for prostate MRI
@@ -58,7 +58,8 @@ polyp_patterns = [
      "id": "morph_broad"},
     {"label": "POLYP_MORPH", "pattern": [{"LOWER": "flat"}], "id": "morph_flat"},
     {"label": "POLYP_MORPH", "pattern": [{"LOWER": "sessile"}], "id": "morph_sessile"},
-    {"label": "POLYP_SIZE_MEAS", "pattern": [{"LOWER": {"REGEX": "\\d+-?[cm]m"}}], "id": "size_meas"},
+    # matches the same tokens as \d+-?[cm]m, without backtracking over long digit runs
+    {"label": "POLYP_SIZE_MEAS", "pattern": [{"LOWER": {"REGEX": "\\d-?[cm]m"}}], "id": "size_meas"},
     {"label": "POLYP_SIZE_MEAS", "pattern": [{"IS_DIGIT": True}, {"LOWER": {"IN": ["cm", "mm"]}}]},
     {"label": "POLYP_PROC", "pattern": [{"LOWER": {"IN": ["biopsy", "biopsied"]}}, {"LOWER": "taken", "OP": "?"}],
      "id": "proc_biopsy_taken"}
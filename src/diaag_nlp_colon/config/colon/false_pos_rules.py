@@ -0,0 +1,71 @@
+# False positive rules applied by the fused mark_false_pos component, per pipeline and entity label
+# Each rule names a context check (see false_pos_filter.FP_CHECKS) and its parameters:
+#   words: word list the check compares against (lowercase tokens, phrases are words separated by single spaces)
+#   case_sensitive: compare the exact token text instead of the lowercase form
+#   substrings: strings the check searches for in the entity text
+#   window: number of tokens before/after the entity the check looks at
+#   ent_id: only apply the rule to entities with this id
+# An entity is marked as a false positive if any rule of its label matches.
+
+# words right before/after a size entity, e.g. 'COLON AT 15 cm'
+SIZE_PREV_FPS = ['at', 'first', 'distal']
+SIZE_NEXT_FPS = ['snare', 'snares', 'number', 'quantity', 'amount',
+                 'clots', 'above', 'round', 'long', 'hiatal', 'erosions',
+                 'sec', 'second', 'area', 'from', 'circumference']
+SIZE_FOLLOWING_FPS = ['boston', 'scientific', 'circumference']
+
+size_nonspec_rules = [
+    {'check': 'prev_word', 'words': ['no']},
+    {'check': 'next_word', 'words': SIZE_NEXT_FPS},
+    {'check': 'mentions_ulcer'},
+]
+
+FP_RULES = {
+    'col': {
+        'POLYP_SIZE_MEAS': [
+            {'check': 'prev_word', 'words': SIZE_PREV_FPS},
+            {'check': 'next_word', 'words': SIZE_NEXT_FPS},
+            {'check': 'next_words', 'words': SIZE_FOLLOWING_FPS, 'window': 4},
+            # units other than cm or mm
+            {'check': 'no_size_units', 'window': 3},
+            {'check': 'next_words_equal', 'words': ['biopsy forceps']},
+            {'check': 'mentions_ulcer'},
+        ],
+        'POLYP_SIZE_NONSPEC': size_nonspec_rules,
+        'POLYP_SAMPLE': [
+            {'check': 'prev_phrase', 'words': ['no evidence of']},
+            {'check': 'prev_word', 'words': ['no']},
+        ],
+        'SAMPLE': [
+            {'check': 'first_word', 'words': ['diagnosis']},
+        ],
+        # sometimes size is mistaken for quantity, e.g. 14-mm or 10-15mm polyp
+        'POLYP_QUANT': [
+            {'check': 'size_unit_quant', 'unit_words': ['mm', 'cm', 'millimeter', 'centimeter']},
+        ],
+        'POLYP_PROC': [
+            {'check': 'next_words', 'words': ['forcep', 'forceps'], 'window': 3, 'ent_id': 'proc_biopsy_taken'},
+            {'check': 'prev_words', 'words': ['random', 'removed', 'cold'], 'window': 3, 'ent_id': 'proc_biopsy_taken'},
+        ],
+    },
+    'path': {
+        'POLYP_SIZE_MEAS': [
+            {'check': 'prev_word', 'words': SIZE_PREV_FPS},
+            {'check': 'next_word', 'words': SIZE_NEXT_FPS},
+            {'check': 'next_words', 'words': SIZE_FOLLOWING_FPS, 'window': 4},
+            {'check': 'mentions_ulcer'},
+        ],
+        'POLYP_SIZE_NONSPEC': size_nonspec_rules,
+        # "specimen received in two containers" ...
+        'POLYP_QUANT': [
+            {'check': 'ent_contains', 'substrings': ['#']},
+            {'check': 'next_word', 'words': ['container', 'containers', 'deeper']},
+        ],
+        'POLYP_LOC': [
+            {'check': 'prev_phrase', 'words': ['labelled "', 'designated as'], 'case_sensitive': True},
+        ],
+        'MALIGNANCY': [
+            {'check': 'prev_words', 'words': ['negative', 'no'], 'window': 8},
+        ],
+    }
+}
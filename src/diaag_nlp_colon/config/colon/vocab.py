@@ -38,6 +38,13 @@ HIST_TYPES = {
     'tubular': 'tubular adenoma'
 }
 
+# Histology types that put a patient in bucket 4
+BUCKET_4_HISTS = [
+    'tubulovillous adenoma',
+    'villous adenoma',
+    'traditional serrated adenoma'
+]
+
 COL_NO_HIST = [
     'colonic mucosa',
     'lymphoid aggregate',
@@ -1,13 +1,20 @@
 from spacy.tokens import Doc, Span, Token
 from spacy import displacy
+from spacy.util import load_model_from_init_py
+import collections
+import importlib
+import itertools
+import multiprocessing
+import os
 import re
 
-from diaag_nlp_colon.services import prop_getters
+from diaag_nlp_colon.services import false_pos_flags, prop_getters
 from diaag_nlp_colon.classes.report import ColReport, PathReport
 from diaag_nlp_colon.config.colon import displacy_configs, col_patterns, path_patterns
 from diaag_nlp_colon.nlp_models import en_trained_sections_col, en_trained_sections_path
 from diaag_nlp_colon.components import (  # These imports are needed to register the extensions below
     colo_keyword_filter,
+    colon_entity_ruler,
     report_section_filter,
     false_pos_filter,
     lesion_property_extractor,
@@ -17,6 +24,7 @@ from diaag_nlp_colon.components import (  # These imports are needed to register
 # SET SPACY EXTENSIONS
 # Doc extensions
 Doc.set_extension('col_related', default=True)
+Doc.set_extension('report_type', default=None)
 Doc.set_extension('has_large_polyp', default=False)
 Doc.set_extension('has_poor_prep', default=False)
 Doc.set_extension('has_incomplete_proc', default=False)
@@ -24,6 +32,9 @@ Doc.set_extension('has_retained_polyp', default=False)
 Doc.set_extension('has_removed_piecemeal', default=False)
 Doc.set_extension('section_headers', getter=prop_getters.get_section_headers)
 Doc.set_extension('section_header_list', getter=prop_getters.get_section_header_list)
+# token bounds of the relevant section when the pipeline keeps the full doc (section_view), else None
+Doc.set_extension('section_bounds', default=None)
+Doc.set_extension('relevant_section', getter=prop_getters.get_relevant_section)
 Doc.set_extension('has_props', getter=prop_getters.has_props)
 Doc.set_extension('has_malignancy', getter=prop_getters.has_malignancy)
 
@@ -38,37 +49,46 @@ Span.set_extension('size_nonspec_count', getter=prop_getters.size_nonspec_count)
 Span.set_extension('has_props', getter=prop_getters.has_props)
 
 # Token extensions
-Token.set_extension('is_false_pos', default=False)
+# backed by the per-doc false positive flag array (services.false_pos_flags)
+Token.set_extension('is_false_pos', getter=false_pos_flags.get_is_false_pos, setter=false_pos_flags.set_is_false_pos)
 
 
-# Runs the colonoscopy report text through the spaCy pipeline
-# required param: report text
-# returns: ColReport object
-def col_pipeline(report_text, to_html=False):
-    # Some reports have newlines that cause problems
-    if to_html:
-        report_text = re.sub(r'[\r\n]+', r' \r\n ', report_text)
-    else:
-        report_text = re.sub(r'[\r\n]+', ' ', report_text)
+# Assembled pipelines, built once per process and reused for every report
+_nlp_cache = {}
 
-    Doc.set_extension('report_type', default='col', force=True)
 
+# Load the trained colonoscopy model and add the rule-based components
+# optional param: section_ner, only run the trained model on the FINDINGS / DESCRIPTION OF THE PROCEDURE section
+#   (faster, but the model sees less context, so entities near section boundaries can differ)
+# optional param: section_view, keep the full doc and process the relevant section as a window on it
+#   instead of copying the section into a new doc
+# returns: spaCy Language object
+def build_col_nlp(section_ner=False, section_view=False):
     # IMPORT MODEL
     nlp = en_trained_sections_col.load()
 
     # BUILD PIPELINE
 
+    # run trained model only on the section used for polyp extraction
+    if section_ner:
+        _add_section_ner(nlp, 'col')
+
     # add col keyword filter to pipeline
     nlp.add_pipe("col_keyword_filter", first=True)
 
+    # tag docs as colonoscopy reports
+    nlp.add_pipe("set_report_type", config={"report_type": "col"}, first=True)
+
     # add colonoscopy entity ruler for rule-based entities
-    col_ruler = nlp.add_pipe("entity_ruler", config={"overwrite_ents": True})
+    # (spaCy's entity ruler with a linear-time overwrite of the model's entities)
+    col_ruler = nlp.add_pipe("colon_entity_ruler", name="entity_ruler", config={"overwrite_ents": True})
     col_ruler.add_patterns(col_patterns.header_patterns)
     col_ruler.add_patterns(col_patterns.polyp_patterns)
     col_ruler.add_patterns(col_patterns.metrics_patterns)
 
     # Scan entire report text for review flags
-    # mark and remove entities that are in or before Indication section, likely false pos
+    # mark entities that are in or before Indication section, likely false pos
+    # (marked entities are skipped by later components and removed by the polyp property extractor)
     nlp.add_pipe("filter_outside_properties_col")
 
     # Extract procedure-level properties, add to user_data, set review flags
@@ -76,36 +96,126 @@ def col_pipeline(report_text, to_html=False):
     nlp.add_pipe("extract_col_props")
 
     # filter doc, only grab relevant report section(s)
-    nlp.add_pipe("extract_relevant_sections_col")
+    nlp.add_pipe("select_relevant_sections_col" if section_view else "extract_relevant_sections_col")
 
-    # flag location / size false positives
-    nlp.add_pipe("mark_size_false_pos")
+    # flag size, sample, quantity and procedure false positives (one pass over the ents)
+    nlp.add_pipe("mark_false_pos", config={"report_type": "col", "defer_removal": True})
 
-    # flag sample false positives
-    nlp.add_pipe("mark_sample_false_pos")
+    # get doc's sentences to distinguish polyps
+    nlp.add_pipe("sentencizer")
 
-    # flag quantity false positives
-    nlp.add_pipe("mark_quant_false_pos_col")
+    # add component to extract polyp data from entities
+    # group them into polyp objects and add to doc.user_data
+    # then removes all flagged false positive entities (the only doc.ents update after the section filter)
+    nlp.add_pipe("polyp_property_extractor_col")
 
-    # flag procedure false positives
-    nlp.add_pipe("mark_proc_false_pos_col")
+    return nlp
 
-    # remove false positive entities
-    nlp.add_pipe("remove_false_pos")
 
-    # get doc's sentences to distinguish polyps
-    nlp.add_pipe("sentencizer")
+# Load the trained pathology model and add the rule-based components
+# optional param: section_ner, only run the trained model on the FINAL DIAGNOSIS section (see build_col_nlp)
+# optional param: section_view, keep the full doc and process the relevant section as a window on it
+#   instead of copying the section into a new doc
+# returns: spaCy Language object
+def build_path_nlp(section_ner=False, section_view=False):
+    # IMPORT MODEL
+    nlp = en_trained_sections_path.load()
+
+    # BUILD PIPELINE
+
+    # run trained model only on the section used for polyp extraction
+    if section_ner:
+        _add_section_ner(nlp, 'path')
+
+    # add col keyword filter to pipeline
+    # NOTE: When filtered by sections, many gross descriptions do not contain col-related keywords
+    nlp.add_pipe("col_keyword_filter", first=True)
+
+    # tag docs as pathology reports
+    nlp.add_pipe("set_report_type", config={"report_type": "path"}, first=True)
+
+    # add entity ruler
+    path_ruler = nlp.add_pipe("colon_entity_ruler", name="entity_ruler", config={"overwrite_ents": True})
+    path_ruler.add_patterns(path_patterns.header_patterns)
+    path_ruler.add_patterns(path_patterns.polyp_patterns)
+
+    # filter doc, only grab relevant report section(s)
+    nlp.add_pipe("select_relevant_sections_path" if section_view else "extract_relevant_sections_path")
+
+    # flag size, quantity, location and malignant histology false positives (one pass over the ents)
+    nlp.add_pipe("mark_false_pos", config={"report_type": "path", "defer_removal": True})
 
     # add component to extract polyp data from entities
     # group them into polyp objects and add to doc.user_data
-    nlp.add_pipe("polyp_property_extractor_col")
+    # then removes all flagged false positive entities (the only doc.ents update after the section filter)
+    nlp.add_pipe("polyp_property_extractor_path")
+
+    return nlp
+
+
+# Replace the trained model pipes with the section_ner component, which runs them on the relevant section only
+def _add_section_ner(nlp, report_type):
+    nlp.add_pipe("section_ner", before="tok2vec", config={"report_type": report_type})
+    nlp.disable_pipe("tok2vec")
+    nlp.disable_pipe("ner")
+
+
+_nlp_builders = {
+    'col': build_col_nlp,
+    'path': build_path_nlp
+}
+
+
+# Names of the serialized pipeline packages written by package_pipelines.py
+PACKAGED_PIPELINES = {
+    'col': 'colon_pipeline_col',
+    'path': 'colon_pipeline_path'
+}
+
+
+# Assemble a new pipeline for a report type ('col' or 'path')
+def build_nlp(report_type, **kwargs):
+    return _nlp_builders[report_type](**kwargs)
+
+
+# Load a pipeline package built by package_pipelines.py from the nlp_models directory
+# (a single load() call restores the model, entity ruler patterns and custom components)
+# optional param: package_dir, package directory written by package_pipeline to another output directory
+def load_packaged_nlp(report_type, package_dir=None):
+    if package_dir is not None:
+        return load_model_from_init_py(os.path.join(package_dir, '__init__.py'))
+    package = importlib.import_module('diaag_nlp_colon.nlp_models.en_{}'.format(PACKAGED_PIPELINES[report_type]))
+    return package.load()
+
+
+# Returns the assembled pipeline for a report type ('col' or 'path')
+# The pipeline is built on first use and cached for the rest of the process
+# optional params: build options of build_col_nlp / build_path_nlp, each set of options is cached separately
+#   (the default pipeline under the report type itself)
+def get_nlp(report_type, **options):
+    key = (report_type, tuple(sorted(options.items()))) if options else report_type
+    if key not in _nlp_cache:
+        _nlp_cache[key] = build_nlp(report_type, **options)
+    return _nlp_cache[key]
+
+
+# Drop cached pipelines, e.g. after changing patterns or models in a running session
+def clear_nlp_cache():
+    _nlp_cache.clear()
+
+
+# Some reports have newlines that cause problems
+def clean_report_text(report_text, to_html=False):
+    if to_html:
+        return re.sub(r'[\r\n]+', r' \r\n ', report_text)
+    return re.sub(r'[\r\n]+', ' ', report_text)
 
-    # RUN PIPELINE
-    doc = nlp(report_text)
 
+# Build ColReport from a doc processed by the colonoscopy pipeline
+def make_col_report(doc):
     # SET REPORT PROPERTIES
     extracted_props = doc.user_data.get('extracted_props', {})
-    report = ColReport(doc.text, **extracted_props)
+    report = ColReport(doc._.relevant_section.text_with_ws, **extracted_props)
 
     # Computed properties
     total_indiv_polyps = 0
@@ -132,77 +242,217 @@ def col_pipeline(report_text, to_html=False):
     if total_indiv_polyps > 10:
         report.review_flags['many_polyps'] = True
 
-    if to_html:
-        doc.user_data['title'] = 'Colonoscopy Report Findings:'
-        options = displacy_configs.DISPLACY_RENDER_OPTIONS['col']
-        return displacy.render(doc, style='ent', page=True, minify=True, options=options)
-    else:
-        return report
+    return report
 
 
-# Runs the pathology report text through the spaCy pipeline
-# required param: report text
-# returns: PathReport object
-def path_pipeline(report_text, to_html=False):
-    # Some reports have newlines that cause problems
-    if to_html:
-        report_text = re.sub(r'[\r\n]+', r' \r\n ', report_text)
-    else:
-        report_text = re.sub(r'[\r\n]+', ' ', report_text)
-
-    Doc.set_extension('report_type', default='path', force=True)
+# Build PathReport from a doc processed by the pathology pipeline
+def make_path_report(doc):
+    # determine report properties
+    report = PathReport(doc._.relevant_section.text_with_ws)
+    doc_polyps = doc.user_data.get('polyps', [])
 
-    # IMPORT MODEL
-    nlp = en_trained_sections_path.load()
+    report.polyps = doc_polyps
 
-    # BUILD PIPELINE
+    if doc._.has_malignancy:
+        report.review_flags['malignancy'] = True
 
-    # add col keyword filter to pipeline
-    # NOTE: When filtered by sections, many gross descriptions do not contain col-related keywords
-    nlp.add_pipe("col_keyword_filter", first=True)
+    return report
 
-    # add entity ruler
-    path_ruler = nlp.add_pipe("entity_ruler", config={"overwrite_ents": True})
-    path_ruler.add_patterns(path_patterns.header_patterns)
-    path_ruler.add_patterns(path_patterns.polyp_patterns)
 
-    # filter doc, only grab relevant report section(s)
-    nlp.add_pipe("extract_relevant_sections_path")
+# Report for text that was screened out as not colon-related before running the pipeline
+# Note: unlike the full pipeline, no procedure-level properties or review flags are extracted
+def make_empty_report(report_type, report_text):
+    if report_type == 'col':
+        return ColReport(report_text, col_related=False)
+    return PathReport(report_text)
 
-    # filter out location / size false positives
-    nlp.add_pipe("mark_size_false_pos")
 
-    # filter out quantity false positives
-    nlp.add_pipe("mark_quant_false_pos")
+# Runs the colonoscopy report text through the spaCy pipeline
+# required param: report text
+# optional param: prescreen, check the raw text for colon keywords first and
+#   return an empty report without running the model if the report is not colon-related
+# optional param: profiler, services.pipeline_profiler.PipelineProfiler that records the time spent in each pipe
+# optional param: cache, services.result_cache.ResultCache, return the stored report if this text was processed
+#   by the same pipeline version before (the profiler records nothing for a stored report)
+# returns: ColReport object
+def col_pipeline(report_text, to_html=False, prescreen=False, profiler=None, cache=None):
+    report_text = clean_report_text(report_text, to_html)
+    if cache is not None and not to_html:
+        # cleaned text has no newlines left, cleaning it again in the call below keeps it the same
+        key = cache.key('col', [report_text], prescreen=prescreen)
+        return cache.get_or_compute(key, lambda: col_pipeline(report_text, prescreen=prescreen, profiler=profiler))
+    if prescreen and not to_html and not colo_keyword_filter.is_col_related(report_text):
+        return make_empty_report('col', report_text)
 
-    # filter out location false positives
-    nlp.add_pipe("mark_loc_false_pos")
+    # RUN PIPELINE
+    doc = _run_nlp('col', report_text, profiler)
 
-    # filter out malignant histology false positives
-    nlp.add_pipe("mark_malignancy_false_pos")
+    if to_html:
+        doc.user_data['title'] = 'Colonoscopy Report Findings:'
+        options = displacy_configs.DISPLACY_RENDER_OPTIONS['col']
+        return displacy.render(doc, style='ent', page=True, minify=True, options=options)
+    else:
+        return _make_report('col', doc, profiler)
 
-    # remove false positive entities
-    nlp.add_pipe("remove_false_pos")
 
-    # add component to extract polyp data from entities
-    # group them into polyp objects and add to doc.user_data
-    nlp.add_pipe("polyp_property_extractor_path")
+# Runs the pathology report text through the spaCy pipeline
+# required param: report text
+# optional param: prescreen, see col_pipeline
+# optional param: profiler, see col_pipeline
+# optional param: cache, see col_pipeline
+# returns: PathReport object
+def path_pipeline(report_text, to_html=False, prescreen=False, profiler=None, cache=None):
+    report_text = clean_report_text(report_text, to_html)
+    if cache is not None and not to_html:
+        # cleaned text has no newlines left, cleaning it again in the call below keeps it the same
+        key = cache.key('path', [report_text], prescreen=prescreen)
+        return cache.get_or_compute(key, lambda: path_pipeline(report_text, prescreen=prescreen, profiler=profiler))
+    if prescreen and not to_html and not colo_keyword_filter.is_col_related(report_text):
+        return make_empty_report('path', report_text)
 
     # RUN PIPELINE
-    doc = nlp(report_text)
-
-    # determine report properties
-    report = PathReport(doc.text)
-    doc_polyps = doc.user_data.get('polyps', [])
-
-    report.polyps = doc_polyps
-
-    if doc._.has_malignancy:
-        report.review_flags['malignancy'] = True
+    doc = _run_nlp('path', report_text, profiler)
 
     if to_html:
         doc.user_data['title'] = 'Pathology Report Entities:'
         options = displacy_configs.DISPLACY_RENDER_OPTIONS['path']
         return displacy.render(doc, style='ent', page=True, minify=True, options=options)
     else:
-        return report
+        return _make_report('path', doc, profiler)
+
+
+# Run one report text through the cached pipeline, timing each pipe if a profiler is given
+def _run_nlp(report_type, report_text, profiler):
+    nlp = get_nlp(report_type)
+    if profiler is None:
+        return nlp(report_text)
+    return next(profiler.pipe(report_type, nlp, [report_text]))
+
+
+def _make_report(report_type, doc, profiler):
+    if profiler is None:
+        return _report_makers[report_type](doc)
+    with profiler.timer(report_type, 'make_report'):
+        return _report_makers[report_type](doc)
+
+
+# Runs many colonoscopy reports through the spaCy pipeline using nlp.pipe
+# required param: iterable of report texts, or of (report text, context) tuples if as_tuples is True
+#   (e.g. the report_list returned by file_proc.read_report_files)
+# optional param: batch_size, number of reports per batch (defaults to the model's configured batch size)
+# optional param: n_process, number of worker processes (-1 for one per CPU)
+# optional param: prescreen, skip the model for reports without colon keywords (see col_pipeline)
+# optional param: profiler, PipelineProfiler that records the time spent in each pipe (only with n_process=1)
+# yields: ColReport objects in input order, or (ColReport, context) tuples if as_tuples is True
+def col_pipeline_batch(reports, as_tuples=False, batch_size=None, n_process=1, prescreen=False, profiler=None):
+    yield from _run_batch('col', reports, as_tuples, batch_size, n_process, prescreen, profiler)
+
+
+# Runs many pathology reports through the spaCy pipeline using nlp.pipe
+# required param: iterable of report texts, or of (report text, context) tuples if as_tuples is True
+# optional param: batch_size, number of reports per batch (defaults to the model's configured batch size)
+# optional param: n_process, number of worker processes (-1 for one per CPU)
+# optional param: prescreen, skip the model for reports without colon keywords (see col_pipeline)
+# optional param: profiler, see col_pipeline_batch
+# yields: PathReport objects in input order, or (PathReport, context) tuples if as_tuples is True
+def path_pipeline_batch(reports, as_tuples=False, batch_size=None, n_process=1, prescreen=False, profiler=None):
+    yield from _run_batch('path', reports, as_tuples, batch_size, n_process, prescreen, profiler)
+
+
+_report_makers = {
+    'col': make_col_report,
+    'path': make_path_report
+}
+
+
+def _run_batch(report_type, reports, as_tuples, batch_size, n_process, prescreen, profiler=None):
+    if n_process == -1:
+        n_process = os.cpu_count() or 1
+    if profiler is not None and n_process > 1:
+        raise ValueError('Pipeline profiling is only supported with n_process=1')
+    if not as_tuples:
+        reports = ((text, None) for text in reports)
+
+    if n_process > 1:
+        results = _run_batch_multiprocess(report_type, reports, batch_size, n_process, prescreen)
+    else:
+        results = _run_batch_single(report_type, reports, batch_size, prescreen, profiler)
+
+    for report, context in results:
+        yield (report, context) if as_tuples else report
+
+
+def _run_batch_single(report_type, reports, batch_size, prescreen, profiler=None):
+    nlp = get_nlp(report_type)
+    # Reports (and their contexts) waiting for their doc to come out of nlp.pipe, in input order
+    # Contexts are kept here rather than passed with nlp.pipe(as_tuples=True),
+    # since the section filters return new Docs which drops spaCy's context.
+    # Pre-screened reports never reach nlp.pipe, so docs are matched to the oldest col_related entry.
+    pending = collections.deque()
+
+    def pipe_texts():
+        for text, context in reports:
+            text = clean_report_text(text)
+            col_related = not prescreen or colo_keyword_filter.is_col_related(text)
+            pending.append((text, context, col_related))
+            if col_related:
+                yield text
+
+    if profiler is None:
+        docs = nlp.pipe(pipe_texts(), batch_size=batch_size)
+    else:
+        docs = profiler.pipe(report_type, nlp, pipe_texts(), batch_size=batch_size)
+    for doc in docs:
+        # pre-screened reports come back in order with the processed ones
+        text, context, col_related = pending.popleft()
+        while not col_related:
+            yield make_empty_report(report_type, text), context
+            text, context, col_related = pending.popleft()
+        yield _make_report(report_type, doc, profiler), context
+    for text, context, _ in pending:
+        yield make_empty_report(report_type, text), context
+
+
+# Split reports into chunks of batch_size and process them in a pool of worker processes
+# The pipeline is built in the parent before the pool starts, so forked workers inherit it;
+# otherwise each worker builds it once in its initializer.
+# Only report texts are sent to workers and only Report objects come back, contexts stay in this process.
+# At most 2 chunks per worker are in flight, so memory stays bounded for long input streams.
+def _run_batch_multiprocess(report_type, reports, batch_size, n_process, prescreen):
+    nlp = get_nlp(report_type)
+    chunk_size = batch_size or nlp.batch_size
+    max_pending = n_process * 2
+    pending = collections.deque()
+    reports = iter(reports)
+    with multiprocessing.Pool(n_process, initializer=get_nlp, initargs=(report_type,)) as pool:
+        while True:
+            chunk = list(itertools.islice(reports, chunk_size))
+            if chunk:
+                texts = [text for text, _ in chunk]
+                contexts = [context for _, context in chunk]
+                pending.append((pool.apply_async(_process_chunk, (report_type, texts, prescreen)), contexts))
+            if pending and (len(pending) >= max_pending or not chunk):
+                result, contexts = pending.popleft()
+                yield from zip(result.get(), contexts)
+            elif not chunk:
+                break
+
+
+# Worker task: run one chunk of report texts through the cached pipeline
+def _process_chunk(report_type, texts, prescreen):
+    return [report for report, _ in _run_batch_single(report_type, ((text, None) for text in texts), None, prescreen)]
+
+
+# Split reports into colon-related and non colon-related using only the keyword filter (no model)
+# required param: iterable of report texts, or of (report text, context) tuples if as_tuples is True
+# returns: (list of colon-related reports, list of other reports), items as given in input
+def triage_reports(reports, as_tuples=False):
+    col_reports = []
+    other_reports = []
+    for report in reports:
+        text = report[0] if as_tuples else report
+        if colo_keyword_filter.is_col_related(clean_report_text(text)):
+            col_reports.append(report)
+        else:
+            other_reports.append(report)
+    return col_reports, other_reports
@@ -0,0 +1,130 @@
+import argparse
+import functools
+import json
+import sys
+
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import diagnostics, stream_engine
+
+# Command line batch runner: JSONL reports in, JSONL results out
+#   diaag-nlp-colon-batch [--input reports.jsonl] [--output results.jsonl] [--batch-size 64] [--workers 4]
+# Input lines: {"id": ..., "type": "col" or "path", "text": ..., "mrn": ... (optional)}, read from stdin by default.
+# Output lines, in input order (stdout by default):
+#   {"id": ..., "type": ..., "report": report.to_dict(), "quality_metrics": ... (col only), "review_flags": ...}
+# Lines that cannot be read get {"id": ..., "error": ...} instead. Reports are read, processed and written in chunks
+# through bounded queues, so memory use does not grow with the input.
+
+REPORT_TYPES = ['col', 'path']
+
+
+# returns (record, None) for a valid input line, (None, error message) otherwise
+def parse_line(line):
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, 'invalid JSON: {}'.format(e)
+    if not isinstance(record, dict):
+        return None, 'not a JSON object'
+    if record.get('type') not in REPORT_TYPES:
+        return record, 'type must be one of {}'.format(REPORT_TYPES)
+    if not isinstance(record.get('text'), str):
+        return record, 'text missing'
+    return record, None
+
+
+# Output record for a processed report
+def result_record(record, report):
+    report.pat_mrn = record.get('mrn')
+    return {
+        'id': record.get('id'),
+        'type': record['type'],
+        'report': report.to_dict(),
+        'quality_metrics': report.quality_metrics if record['type'] == 'col' else None,
+        'review_flags': report.review_flags,
+    }
+
+
+# Processes one chunk of input lines, each report type in one batch
+# returns: list of output records in input order
+def process_chunk(lines, batch_size=None, n_process=1, prescreen=False):
+    outputs = [None] * len(lines)
+    by_type = {report_type: [] for report_type in REPORT_TYPES}
+    for index, line in enumerate(lines):
+        record, error = parse_line(line)
+        if error:
+            diagnostics.logger.warning('jsonl_runner: line skipped, %s', error)
+            outputs[index] = {'id': record.get('id') if record else None, 'error': error}
+        else:
+            by_type[record['type']].append((record['text'], (index, record)))
+
+    pipeline_batches = {'col': colon_pipelines.col_pipeline_batch, 'path': colon_pipelines.path_pipeline_batch}
+    for report_type, reports in by_type.items():
+        if not reports:
+            continue
+        results = pipeline_batches[report_type](reports, as_tuples=True, batch_size=batch_size, n_process=n_process,
+                                                prescreen=prescreen)
+        for report, (index, record) in results:
+            outputs[index] = result_record(record, report)
+    return outputs
+
+
+# Reads JSONL lines from input_file, writes one JSONL result per line to output_file
+# Chunks of lines are processed by a services.stream_engine.StreamEngine: reading, processing (in n_process worker
+# processes) and writing overlap, and a slow output holds back the reading
+# returns: number of (results, errors) written
+def run(input_file, output_file, chunk_size=256, batch_size=None, n_process=1, prescreen=False):
+    counts = {'results': 0, 'errors': 0}
+
+    def write(output):
+        output_file.write(json.dumps(output, default=str) + '\n')
+        counts['errors' if 'error' in output else 'results'] += 1
+
+    if n_process != 1:
+        # forked workers inherit the pipelines
+        for report_type in REPORT_TYPES:
+            colon_pipelines.get_nlp(report_type)
+    process = functools.partial(process_chunk, batch_size=batch_size, prescreen=prescreen)
+    engine = stream_engine.StreamEngine(process, workers=n_process, chunk_size=chunk_size)
+    engine.run((line for line in input_file if line.strip()), write)
+    output_file.flush()
+    return counts['results'], counts['errors']
+
+
+# argparse type for --workers: a count of at least 1, or -1 for one per CPU
+def worker_count(value):
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid int value: {!r}'.format(value))
+    if workers != -1 and workers < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, or -1 for one per CPU')
+    return workers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run colonoscopy and pathology reports from JSONL through the '
+                                                 'colon pipelines, write the results as JSONL')
+    parser.add_argument('--input', default='-', help='JSONL file of reports (default: stdin)')
+    parser.add_argument('--output', default='-', help='JSONL file for the results (default: stdout)')
+    parser.add_argument('--batch-size', type=int, help='reports per nlp.pipe batch (default: model setting)')
+    parser.add_argument('--workers', type=worker_count, default=1, help='worker processes (-1 for one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=256, help='reports per worker task')
+    parser.add_argument('--prescreen', action='store_true',
+                        help='skip the model for reports without colon keywords')
+    args = parser.parse_args(argv)
+
+    input_file = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        results, errors = run(input_file, output_file, args.chunk_size, args.batch_size, args.workers,
+                              args.prescreen)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    print('{} reports processed, {} lines skipped'.format(results, errors), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from pathlib import Path
+import shutil
+import sys
+import srsly
+
+from diaag_nlp_colon import nlp_models
+from diaag_nlp_colon.config import pipeline_configs
+from diaag_nlp_colon.pipelines import colon_pipelines
+
+# Build step: serialize the fully assembled colonoscopy and pathology pipelines
+# (trained model + entity ruler patterns + custom components) as loadable spaCy packages.
+# Re-run after changing patterns, components or the trained models:
+#   python -m diaag_nlp_colon.pipelines.package_pipelines [output_dir]
+
+
+# Package __init__.py, same layout as the trained model packages
+# Importing colon_pipelines registers the custom components and Doc/Span/Token extensions
+INIT_PY = '''from pathlib import Path
+from spacy.util import load_model_from_init_py, get_model_meta
+
+# registers the custom components and extensions used by the pipeline
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+__version__ = get_model_meta(Path(__file__).parent)['version']
+
+
+def load(**overrides):
+    return load_model_from_init_py(__file__, **overrides)
+'''
+
+
+# Assemble pipeline for report type ('col' or 'path') and write it as a package
+# optional param: output_dir, defaults to the nlp_models directory
+# returns: path to package directory
+def package_pipeline(report_type, output_dir=None):
+    nlp = colon_pipelines.build_nlp(report_type)
+    name = colon_pipelines.PACKAGED_PIPELINES[report_type]
+    nlp.meta['name'] = name
+    nlp.meta['version'] = pipeline_configs.CURRENT_VERSIONS['colon']
+    nlp.meta['description'] = 'Assembled {} pipeline built by diaag_nlp_colon'.format(report_type)
+
+    output_dir = Path(output_dir) if output_dir else Path(nlp_models.__file__).parent
+    package_dir = output_dir / '{}_{}'.format(nlp.lang, name)
+    model_dir = package_dir / '{}_{}-{}'.format(nlp.lang, name, nlp.meta['version'])
+
+    # replace any previous build
+    if package_dir.exists():
+        shutil.rmtree(package_dir)
+    package_dir.mkdir(parents=True)
+    nlp.to_disk(model_dir)
+    srsly.write_json(package_dir / 'meta.json', nlp.meta)
+    (package_dir / '__init__.py').write_text(INIT_PY)
+
+    return package_dir
+
+
+if __name__ == '__main__':
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    for rt in colon_pipelines.PACKAGED_PIPELINES:
+        print('Wrote', package_pipeline(rt, out_dir))
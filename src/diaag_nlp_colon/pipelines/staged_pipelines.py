@@ -0,0 +1,135 @@
+import collections
+from pathlib import Path
+
+import srsly
+from spacy.tokens import DocBin
+
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import result_cache
+
+# Run the colon pipelines in two stages: the trained model once, the rules as often as they change
+# The model stage (tokenizer, report type, keyword filter and the trained tok2vec + ner, run by section_ner) writes
+# its Docs to sharded DocBin files. The rule stage (entity ruler, section filters, false positive markers, property
+# extractors) replays them and makes the reports, so pattern, rule and bucket changes can be checked on a whole corpus
+# without running the model again:
+#   staged_pipelines.run_model_stage('col', report_texts, 'stage/col')
+#   reports = list(staged_pipelines.replay_rule_stage('col', 'stage/col'))
+
+# Pipes that run the trained model, the model stage ends with the last of them in the pipeline
+MODEL_PIPES = ['section_ner', 'tok2vec', 'ner']
+
+# Description of the shards, written next to them
+META_FILE = 'model_stage.json'
+
+# doc.user_data key of the context stored with a report (as_tuples)
+CONTEXT_KEY = 'stage_context'
+
+
+# returns (names of the model stage pipes, names of the rule stage pipes) of a pipeline, enabled pipes only
+def split_pipes(nlp):
+    names = nlp.pipe_names
+    last_model_pipe = max(names.index(name) for name in MODEL_PIPES if name in names)
+    return names[:last_model_pipe + 1], names[last_model_pipe + 1:]
+
+
+# Runs reports through the model stage of the cached pipeline and writes the Docs as DocBin shards
+# required param: report type ('col' or 'path'), iterable of report texts (or of (report text, context) tuples if
+#   as_tuples is True, contexts must be msgpack serializable, e.g. file ids), output directory
+# optional param: shard_size, number of docs per shard file
+# optional param: batch_size, see colon_pipelines.col_pipeline_batch
+# returns: list of shard paths
+def run_model_stage(report_type, reports, output_dir, shard_size=1000, as_tuples=False, batch_size=None):
+    nlp = colon_pipelines.get_nlp(report_type)
+    model_pipes, rule_pipes = split_pipes(nlp)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if not as_tuples:
+        reports = ((text, None) for text in reports)
+
+    texts = ((colon_pipelines.clean_report_text(text), context) for text, context in reports)
+    shards = []
+    doc_count = 0
+    doc_bin = DocBin(store_user_data=True)
+    for doc, context in nlp.pipe(texts, as_tuples=True, batch_size=batch_size, disable=rule_pipes):
+        if as_tuples:
+            doc.user_data[CONTEXT_KEY] = context
+        doc_bin.add(doc)
+        doc_count += 1
+        if len(doc_bin) >= shard_size:
+            shards.append(_write_shard(doc_bin, output_dir, len(shards)))
+            doc_bin = DocBin(store_user_data=True)
+    if len(doc_bin) or not shards:
+        shards.append(_write_shard(doc_bin, output_dir, len(shards)))
+
+    srsly.write_json(output_dir / META_FILE, {
+        'report_type': report_type,
+        'models': result_cache.version_info()['models'],
+        'model_pipes': model_pipes,
+        'shards': [shard.name for shard in shards],
+        'docs': doc_count,
+    })
+    return shards
+
+
+def _write_shard(doc_bin, output_dir, index):
+    path = output_dir / 'shard_{:05d}.spacy'.format(index)
+    doc_bin.to_disk(path)
+    return path
+
+
+# Reads the description of a shard directory
+# Raises ValueError if the shards were made for another report type or by other trained model versions
+def read_meta(report_type, shard_dir):
+    meta = srsly.read_json(Path(shard_dir) / META_FILE)
+    if meta['report_type'] != report_type:
+        raise ValueError('{} has {} reports, not {}'.format(shard_dir, meta['report_type'], report_type))
+    models = result_cache.version_info()['models']
+    if meta['models'] != models:
+        raise ValueError('{} was made by models {}, the current models are {}: run the model stage again'.format(
+            shard_dir, meta['models'], models))
+    return meta
+
+
+# Reads the model stage Docs of a shard directory, in the order they were written (see read_meta for errors)
+# yields: Docs (with their context if as_tuples is True)
+def read_model_stage(report_type, shard_dir, as_tuples=False):
+    shard_dir = Path(shard_dir)
+    meta = read_meta(report_type, shard_dir)
+    vocab = colon_pipelines.get_nlp(report_type).vocab
+    for shard in meta['shards']:
+        for doc in DocBin().from_disk(shard_dir / shard).get_docs(vocab):
+            if as_tuples:
+                yield doc, doc.user_data.pop(CONTEXT_KEY, None)
+            else:
+                yield doc
+
+
+# Runs model stage Docs through the rule stage of the cached pipeline
+# yields: processed Docs in input order
+def run_rule_stage(report_type, docs, batch_size=None):
+    nlp = colon_pipelines.get_nlp(report_type)
+    model_pipes, _ = split_pipes(nlp)
+    # nlp.pipe skips the tokenizer for Docs
+    yield from nlp.pipe(docs, batch_size=batch_size, disable=model_pipes)
+
+
+# Replays the rule stage on the shards written by run_model_stage and makes the reports
+# yields: ColReport / PathReport objects in the order of the model stage input,
+#   or (report, context) tuples if as_tuples is True
+def replay_rule_stage(report_type, shard_dir, as_tuples=False, batch_size=None):
+    read_meta(report_type, shard_dir)
+    make_report = colon_pipelines.make_col_report if report_type == 'col' else colon_pipelines.make_path_report
+    if not as_tuples:
+        for doc in run_rule_stage(report_type, read_model_stage(report_type, shard_dir), batch_size):
+            yield make_report(doc)
+        return
+    # contexts are taken off the docs before the rule stage, the section filters return new Docs
+    pending = collections.deque()
+
+    def docs():
+        for doc, context in read_model_stage(report_type, shard_dir, as_tuples=True):
+            pending.append(context)
+            yield doc
+
+    for doc in run_rule_stage(report_type, docs(), batch_size):
+        yield make_report(doc), pending.popleft()
@@ -1,5 +1,8 @@
+import functools
+
 from diaag_nlp_colon.classes.report import ColReport, PathReport
 from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import stream_engine
 
 
 # returns ColReport with updated candidate buckets
@@ -189,20 +192,34 @@ def make_rec(col_polyps, path_polyps, large_polyp=None, mentions_hist=None, **kw
 
 
 # given col + path text, run through pipeline and merge buckets
-def make_rec_from_text(col_text, path_text, **kwargs):
+# optional param: cache, services.result_cache.ResultCache, return the stored result if these texts were processed
+#   by the same pipeline version before (the col and path reports are cached separately as well)
+def make_rec_from_text(col_text, path_text, cache=None, **kwargs):
     _ = kwargs
+    if cache is None:
+        return _rec_from_text(col_text, path_text)
+    key = cache.key('rec', [colon_pipelines.clean_report_text(col_text),
+                            colon_pipelines.clean_report_text(path_text) if path_text else None])
+    return cache.get_or_compute(key, lambda: _rec_from_text(col_text, path_text, cache))
+
 
+def _rec_from_text(col_text, path_text, cache=None):
     # Run colo report through pipeline to get polyps
-    col_report = colon_pipelines.col_pipeline(col_text)
+    col_report = colon_pipelines.col_pipeline(col_text, cache=cache)
+    # If there's a path report, run through pipeline to get polyps
+    path_report = colon_pipelines.path_pipeline(path_text, cache=cache) if path_text else None
+    return rec_from_reports(col_report, path_report)
+
 
+# given the col report and path report (None if there is no path report) made by the pipelines, merge buckets
+# returns: same as make_rec_from_text
+def rec_from_reports(col_report, path_report):
     # Filter buckets using colo polyps
     col = filter_buckets_col(col_report)
 
-    # If there's a path report, run through pipeline to get polyps
-    if not path_text:
+    if path_report is None:
         path = None
     else:
-        path_report = colon_pipelines.path_pipeline(path_text)
         # Filter buckets using path polyps
         path = filter_buckets_path(path_report)
 
@@ -224,3 +241,32 @@ def make_rec_from_text(col_text, path_text, **kwargs):
     }
 
     return all_buckets, flags, col_report.report_props, col_report.quality_metrics, computed
+
+
+# Recommendations for a cohort: make_rec_from_text for every patient, with the pipelines loaded once
+# Patients are processed in chunks: the col texts and then the path texts of a chunk each go through their pipeline as
+# one batch, and the reports are joined again per patient. With workers > 1 the chunks are processed in that many
+# processes (see services.stream_engine.StreamEngine), which inherit the pipelines built here.
+# Note: the col and path batches of a chunk run sequentially, not concurrently. Threads inside forked pool workers are
+# not safe, and the pipelines hold the GIL for most of their work, so the parallelism comes from the chunk processes.
+# required param: iterable of (patient id, col text, path text), path text may be None or empty
+# optional param: workers, chunk_size, see StreamEngine; batch_size, see colon_pipelines.col_pipeline_batch
+# yields: (patient id, result of make_rec_from_text) in input order
+def make_recs_from_text(patients, workers=1, chunk_size=64, batch_size=None):
+    process = functools.partial(_recs_from_chunk, batch_size=batch_size)
+    engine = stream_engine.StreamEngine(process, workers=workers, chunk_size=chunk_size)
+    colon_pipelines.get_nlp('col')
+    colon_pipelines.get_nlp('path')
+    yield from engine.results(patients)
+
+
+# Worker task: recommendations for one chunk of (patient id, col text, path text)
+def _recs_from_chunk(patients, batch_size=None):
+    col_reports = list(colon_pipelines.col_pipeline_batch([col_text for _, col_text, _ in patients],
+                                                          batch_size=batch_size))
+    path_texts = [(path_text, index) for index, (_, _, path_text) in enumerate(patients) if path_text]
+    path_reports = [None] * len(patients)
+    for path_report, index in colon_pipelines.path_pipeline_batch(path_texts, as_tuples=True, batch_size=batch_size):
+        path_reports[index] = path_report
+    return [(patient_id, rec_from_reports(col_report, path_report))
+            for (patient_id, _, _), col_report, path_report in zip(patients, col_reports, path_reports)]
@@ -0,0 +1,74 @@
+import json
+import logging
+
+# Diagnostics channel for the pipeline components, replaces print() on the hot path
+# Messages go to the 'diaag_nlp_colon.diagnostics' logger at DEBUG level. The logger is set to WARNING, so the
+# channel stays off even if the application logs DEBUG, until enable() is called (or the level is lowered).
+# Formatting is lazy, nothing is built while the channel is off.
+# Events carry the component, rule, entity label and character offsets, never report text.
+
+LOGGER_NAME = 'diaag_nlp_colon.diagnostics'
+logger = logging.getLogger(LOGGER_NAME)
+logger.setLevel(logging.WARNING)
+
+# LogRecord attribute holding the structured event dict
+EVENT_ATTR = 'diag_event'
+
+
+# returns True if diagnostics are enabled
+def enabled():
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+# Emit a diagnostic event
+# params:
+#   component: name of the pipeline component or function
+#   rule: what was found, e.g. a false positive rule name
+#   ent: optional entity Span, adds its label and character offsets
+#   fields: extra (non-PHI) values for the event
+def event(component, rule, ent=None, **fields):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    diag_event = {'component': component, 'rule': rule}
+    if ent is not None:
+        diag_event['label'] = ent.label_
+        diag_event['start'] = ent.start_char
+        diag_event['end'] = ent.end_char
+    diag_event.update(fields)
+    logger.debug('%s: %s %s', component, rule, _format_fields(diag_event), extra={EVENT_ATTR: diag_event})
+
+
+def _format_fields(diag_event):
+    return ' '.join('{}={}'.format(key, value) for key, value in diag_event.items()
+                    if key not in ('component', 'rule'))
+
+
+# Formats a record as one JSON object per line: the event dict, or the message for records without one
+class StructuredFormatter(logging.Formatter):
+    def format(self, record):
+        diag_event = getattr(record, EVENT_ATTR, None)
+        if diag_event is None:
+            diag_event = {'message': record.getMessage()}
+        return json.dumps(diag_event, default=str)
+
+
+# Turn on diagnostics
+# params:
+#   structured: emit JSON events instead of text messages
+#   handler: logging handler to send events to, defaults to stderr
+# returns: the handler added to the diagnostics logger (pass it to disable())
+def enable(structured=False, handler=None):
+    if handler is None:
+        handler = logging.StreamHandler()
+    if structured:
+        handler.setFormatter(StructuredFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    return handler
+
+
+# Turn off diagnostics, removing the handler returned by enable()
+def disable(handler=None):
+    if handler is not None:
+        logger.removeHandler(handler)
+    logger.setLevel(logging.WARNING)
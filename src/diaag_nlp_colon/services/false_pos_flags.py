@@ -0,0 +1,90 @@
+import numpy
+from spacy.attrs import ENT_IOB
+from spacy.tokens import Doc
+
+# False positive flags of a Doc: one boolean per token, stored as an array in doc.user_data
+# Marking a token and checking a span are array operations instead of Token extension lookups.
+# Token._.is_false_pos reads and writes the same array.
+
+# doc.user_data key of the flag array
+FALSE_POS_KEY = 'false_pos_flags'
+
+
+# returns the flag array of a doc, created on first use
+def get_flags(doc):
+    flags = doc.user_data.get(FALSE_POS_KEY)
+    if flags is None or len(flags) != len(doc):
+        flags = numpy.zeros(len(doc), dtype=bool)
+        doc.user_data[FALSE_POS_KEY] = flags
+    return flags
+
+
+# mark the token at position token_i as (part of) a false positive entity
+def mark(doc, token_i):
+    get_flags(doc)[token_i] = True
+
+
+# returns (doc, start, end) for a Doc or Span
+def span_bounds(tokens):
+    if isinstance(tokens, Doc):
+        return tokens, 0, len(tokens)
+    return tokens.doc, tokens.start, tokens.end
+
+
+# returns flags of the tokens in a Doc or Span
+def span_flags(tokens):
+    doc, start, end = span_bounds(tokens)
+    return get_flags(doc)[start:end]
+
+
+# returns True if any token in a Doc or Span is marked
+def span_has_false_pos(tokens):
+    return bool(span_flags(tokens).any())
+
+
+# Token extension getter / setter for is_false_pos
+def get_is_false_pos(token):
+    return bool(get_flags(token.doc)[token.i])
+
+
+def set_is_false_pos(token, value):
+    get_flags(token.doc)[token.i] = bool(value)
+
+
+# returns mask of the tokens that belong to an entity marked for removal (any of its tokens is flagged)
+def removed_tokens(doc, ent_iob=None):
+    if ent_iob is None:
+        ent_iob = doc.to_array(ENT_IOB)
+    in_ent = (ent_iob == 3) | (ent_iob == 1)
+    ent_idx = numpy.cumsum(ent_iob == 3) - 1
+    n_ents = int(ent_idx[-1]) + 1 if len(doc) > 0 else 0
+    if n_ents == 0:
+        return numpy.zeros(len(doc), dtype=bool)
+    removed_ents = numpy.bincount(ent_idx[in_ent & get_flags(doc)], minlength=n_ents) > 0
+    return in_ent & removed_ents[ent_idx]
+
+
+# Entities of a Doc or Span that are not marked for removal
+# Removals are deferred: marked entities stay in doc.ents until remove_false_pos commits them,
+# components in between read entities through this function.
+def valid_ents(tokens):
+    flags = get_flags(span_bounds(tokens)[0])
+    return [ent for ent in tokens.ents if not flags[ent.start:ent.end].any()]
+
+
+# valid_ents of every sentence of a Doc, in one pass over the entities
+# (Span.ents goes through doc.ents from the start, so calling valid_ents per sentence is quadratic)
+# returns: list with a list of entities per sentence, entities crossing a sentence boundary are left out like in Span.ents
+def valid_ents_by_sent(doc):
+    ents = valid_ents(doc)
+    ent_i = 0
+    sent_ents = []
+    for sent in doc.sents:
+        while ent_i < len(ents) and ents[ent_i].start < sent.start:
+            ent_i += 1
+        in_sent = []
+        while ent_i < len(ents) and ents[ent_i].end <= sent.end:
+            in_sent.append(ents[ent_i])
+            ent_i += 1
+        sent_ents.append(in_sent)
+    return sent_ents
@@ -1,10 +1,16 @@
 import os
 import pandas as pd
 from diaag_nlp_colon.config.colon import brat_label_configs
+from diaag_nlp_colon.services import diagnostics
 
 
 # Functions to handle file processing
 
+
+# Report id of a report .txt or brat .ann file: characters 3 to 9 of its filename (shared by the two files)
+def report_file_id(filename):
+    return filename[3:10]
+
 # Reads brat .ann files and report .txt files into memory
 # Returns:
 # dict of file_id -> brat report text (brat_dict)
@@ -14,9 +20,8 @@ def read_report_files(paths):
     brat_dict = {}
     report_dict = {}
     report_list = []
-    print('\nReading reports...')
     for path, old_reports in paths.items():
-        print(path)
+        diagnostics.event('read_report_files', 'read_dir', path=path)
         # Read every file in directory
         for filename in os.listdir(path):
             # 2 reports without matches
@@ -32,11 +37,11 @@ def read_report_files(paths):
                         continue
                     f_str = f.read()
 
-                    file_id = filename[3:10]
+                    file_id = report_file_id(filename)
 
                     if '.ann' in filename:
                         if file_id in brat_dict:
-                            print('Duplicate ann file:', filename)
+                            diagnostics.event('read_report_files', 'duplicate_ann_file', filename=filename)
                         else:
                             brat_dict[file_id] = f_str
                     elif '.txt' in filename:
@@ -49,12 +54,12 @@ def read_report_files(paths):
                             else:
                                 f_str = f_str.replace('\n', '  ')
                         if file_id in report_dict:
-                            print('Duplicate txt file:', filename)
+                            diagnostics.event('read_report_files', 'duplicate_txt_file', filename=filename)
                         else:
                             report_dict[file_id] = f_str
                             report_list.append((f_str, {'filename': filename}))
             except UnicodeDecodeError:
-                print('encoding error:', filename)
+                diagnostics.logger.warning('read_report_files: encoding error in %s', filename)
 
     return brat_dict, report_dict, report_list
 
@@ -177,6 +182,8 @@ def generate_col_dataset(brat_data, report_data):
     # make list of brat entity annotations (lines that start with T1, T2, ...)
     for filename in brat_data.keys():
         sample_ents = {'entities': []}
+        # character offsets covered by the entities kept so far
+        covered_chars = set()
         full = brat_data[filename]
         lines = full.split('\n')
         contains_relation = False
@@ -237,16 +244,10 @@ def generate_col_dataset(brat_data, report_data):
                 # avoid overlapping ents
                 start = int(ann[1])
                 end = int(ann[2])
-                overlapping = False
-                for ex in sample_ents['entities']:
-                    ex_start = int(ex[0])
-                    ex_end = int(ex[1])
-                    if (start >= ex_start) and (start < ex_end):
-                        overlapping = True
-                        break
-                if overlapping:
+                if start in covered_chars:
                     # print('skipping overlapping annotation')
                     continue
+                covered_chars.update(range(start, end))
                 sample_ents['entities'].append((int(ann[1]), int(ann[2]), ent_label))
         # if not contains_relation:
         #     no_rel += 1
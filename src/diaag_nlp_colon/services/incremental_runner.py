@@ -0,0 +1,145 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+
+from diaag_nlp_colon.config import pipeline_configs
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import diagnostics, file_proc
+
+# Incremental processing of a report corpus that keeps growing
+# A manifest next to the outputs records every processed report (id, content hash, pipeline version, output file),
+# so a run only processes reports that are new or whose text changed since the last run:
+#   incremental_runner.run_incremental('col', incremental_runner.report_files('reports/col/'), 'output/col')
+
+# Manifest file name in the output directory
+MANIFEST_FILE = 'manifest.json'
+
+# Subdirectory of the output directory for the report results
+REPORTS_DIR = 'reports'
+
+
+# sha256 of a report text
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# Version of the pipeline that made a result
+def pipeline_version():
+    return pipeline_configs.CURRENT_VERSIONS['colon']
+
+
+# Result file for a report id, relative to the output directory
+# Report ids can be any string: the file name keeps the id's safe characters (for readability) and adds a hash of the
+# full id, so ids like 'manifest', 'a/b' or '..' get distinct files inside REPORTS_DIR
+def output_file(report_id):
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', report_id)[:64]
+    id_hash = hashlib.sha256(report_id.encode('utf-8')).hexdigest()[:12]
+    return '{}/{}-{}.json'.format(REPORTS_DIR, safe_id, id_hash)
+
+
+# Reads the .txt report files of a directory one at a time, ids follow file_proc.read_report_files
+# yields: (report id, report text)
+def report_files(path):
+    for filename in sorted(os.listdir(path)):
+        if filename.startswith('.') or not filename.endswith('.txt'):
+            continue
+        try:
+            with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+                yield file_proc.report_file_id(filename), f.read()
+        except UnicodeDecodeError:
+            diagnostics.logger.warning('report_files: encoding error in %s', filename)
+
+
+class ReportManifest:
+    """
+    Record of the processed reports of an output directory, stored as JSON.
+
+    Each entry maps a report id to the content hash of the processed text, the pipeline version
+    (CURRENT_VERSIONS['colon']) that processed it, its output file (relative to the manifest) and when it was processed.
+    save() replaces the file in one step, a run that stops part way keeps the manifest of its last save.
+    """
+
+    def __init__(self, path, report_type):
+        self.path = path
+        self.report_type = report_type
+        self.reports = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            if manifest['report_type'] != report_type:
+                raise ValueError('{} is a manifest of {} reports, not {}'.format(
+                    path, manifest['report_type'], report_type))
+            self.reports = manifest['reports']
+
+    # returns 'new', 'changed', 'outdated' (same text, other pipeline version) or 'current'
+    def status(self, report_id, text_hash, version):
+        entry = self.reports.get(report_id)
+        if entry is None:
+            return 'new'
+        if entry['content_hash'] != text_hash:
+            return 'changed'
+        if entry['version'] != version:
+            return 'outdated'
+        return 'current'
+
+    def record(self, report_id, text_hash, version, output):
+        self.reports[report_id] = {
+            'content_hash': text_hash,
+            'version': version,
+            'output': output,
+            'processed': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def save(self):
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'report_type': self.report_type, 'reports': self.reports}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+# Runs the new and changed reports through the pipeline and writes one JSON file per report (report.to_dict())
+# to REPORTS_DIR, see output_file; the manifest maps each report id to its file
+# required param: report type ('col' or 'path'), iterable of (report id, report text), output directory
+# optional param: force, process every report again
+# optional param: reprocess_outdated, also process reports that were processed by another pipeline version
+#   (CURRENT_VERSIONS['colon'] changed), by default their results are kept
+# optional param: checkpoint, save the manifest after this many processed reports
+# optional param: batch_size, n_process, see colon_pipelines.col_pipeline_batch
+# returns: dict of counts per report status ('new', 'changed', 'outdated', 'current', 'duplicate')
+#   and of processed reports
+def run_incremental(report_type, reports, output_dir, force=False, reprocess_outdated=False, checkpoint=1000,
+                    batch_size=None, n_process=1):
+    os.makedirs(os.path.join(output_dir, REPORTS_DIR), exist_ok=True)
+    manifest = ReportManifest(os.path.join(output_dir, MANIFEST_FILE), report_type)
+    version = pipeline_version()
+    counts = dict.fromkeys(['new', 'changed', 'outdated', 'current', 'duplicate', 'processed'], 0)
+    seen = set()
+
+    def to_process():
+        for report_id, text in reports:
+            report_id = str(report_id)
+            if report_id in seen:
+                diagnostics.event('run_incremental', 'duplicate_report_id', report_id=report_id)
+                counts['duplicate'] += 1
+                continue
+            seen.add(report_id)
+            text_hash = content_hash(text)
+            status = manifest.status(report_id, text_hash, version)
+            counts[status] += 1
+            if force or status in ('new', 'changed') or (status == 'outdated' and reprocess_outdated):
+                yield text, (report_id, text_hash)
+
+    pipeline_batch = colon_pipelines.col_pipeline_batch if report_type == 'col' else colon_pipelines.path_pipeline_batch
+    results = pipeline_batch(to_process(), as_tuples=True, batch_size=batch_size, n_process=n_process)
+    for report, (report_id, text_hash) in results:
+        output = output_file(report_id)
+        with open(os.path.join(output_dir, output), 'w') as f:
+            json.dump(report.to_dict(), f, default=str)
+        manifest.record(report_id, text_hash, version, output)
+        counts['processed'] += 1
+        if counts['processed'] % checkpoint == 0:
+            manifest.save()
+    manifest.save()
+    return counts
@@ -0,0 +1,92 @@
+import re
+from collections import namedtuple
+from diaag_nlp_colon.config.colon import vocab
+
+# Precompiled keyword scanning of raw report text
+
+# Characters that make a vocab entry a regex rather than a literal term
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+# Escapes whose meaning changes when lowercased (e.g. \S -> \s)
+UPPER_ESCAPE_REGEX = re.compile(r'\\[A-Z]')
+
+# First (leftmost) match of a category in a text
+KeywordHit = namedtuple('KeywordHit', ['start', 'end', 'text', 'term'])
+
+
+class KeywordScanner:
+    """
+    Finds the first case-insensitive match of each keyword category in a text.
+
+    All vocab lists are compiled once. The text is lowercased once per scan and shared by every category:
+    literal terms are found with str.find and regex entries are matched by their own precompiled,
+    lowercased patterns, which lets the regex engine use its fast literal-prefix search.
+    A hit is the leftmost match of any term in the category (first listed term wins ties), the same match
+    re.search would return for the category's terms joined into one IGNORECASE alternation.
+    """
+
+    def __init__(self, categories):
+        self.terms = {name: list(terms) for name, terms in categories.items()}
+        self._compiled = {name: [self._compile_term(term) for term in terms] for name, terms in self.terms.items()}
+
+    # returns (lowered literal term or None, pattern for lowered text or None, IGNORECASE pattern for original text)
+    @staticmethod
+    def _compile_term(term):
+        if not REGEX_CHARS.intersection(term):
+            return term.lower(), None, re.compile(re.escape(term), re.IGNORECASE)
+        if UPPER_ESCAPE_REGEX.search(term):
+            return None, None, re.compile(term, re.IGNORECASE)
+        return None, re.compile(term.lower()), re.compile(term, re.IGNORECASE)
+
+    # returns dict of category -> KeywordHit (or None) for the given categories (default all)
+    def scan(self, text, categories=None):
+        categories = categories or self.terms
+        lowered = text.lower()
+        # offsets in the lowered text only line up if lowercasing kept the length
+        if len(lowered) != len(text):
+            lowered = None
+        return {name: self._category_hit(text, lowered, name) for name in categories}
+
+    # returns KeywordHit (or None) for a single category
+    def search(self, text, category):
+        return self.scan(text, [category])[category]
+
+    def _category_hit(self, text, lowered, name):
+        best_start = None
+        best_end = None
+        best_term = None
+        for term, (literal, lowered_pattern, pattern) in zip(self.terms[name], self._compiled[name]):
+            if lowered is None:
+                match = pattern.search(text)
+                if not match:
+                    continue
+                start, end = match.span()
+            elif literal is not None:
+                # only look for occurrences that start before the current best hit
+                limit = len(lowered) if best_start is None else best_start - 1 + len(literal)
+                start = lowered.find(literal, 0, limit)
+                if start < 0:
+                    continue
+                end = start + len(literal)
+            else:
+                match = lowered_pattern.search(lowered) if lowered_pattern is not None else pattern.search(text)
+                if not match:
+                    continue
+                start, end = match.span()
+            if best_start is None or start < best_start:
+                best_start, best_end, best_term = start, end, term
+        if best_start is None:
+            return None
+        return KeywordHit(best_start, best_end, text[best_start:best_end], best_term)
+
+
+# Scanner for all keyword categories checked on raw report text
+REPORT_SCANNER = KeywordScanner({
+    'col': vocab.COL_KEYWORDS,
+    'col_fp': vocab.COL_FP_KEYWORDS,
+    'poor_prep': vocab.COL_POOR_PREP_REGEX,
+    'incomplete_proc': vocab.COL_INCOMPLETE_PROC,
+    'hist': vocab.HIST_TYPES.keys(),
+    'bucket_4_hist': vocab.BUCKET_4_HISTS,
+    'malignancy': vocab.PATH_MALIGNANCY,
+})
@@ -0,0 +1,163 @@
+import bisect
+import os
+import time
+from contextlib import contextmanager
+
+# Opt-in per-component timing of the colon pipelines
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style (cumulative, plus +Inf)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Metric name prefix of the Prometheus dump
+METRIC_PREFIX = 'diaag_nlp_colon'
+
+
+class ComponentStats:
+    """
+    Latency of one pipeline component over a run.
+
+    count: docs that came out of the component
+    total_seconds: time spent in the component (including time that was not attributed to a single doc,
+        e.g. flushing the last batch)
+    bucket_counts: number of docs per histogram bucket (not cumulative), the last one is +Inf
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], self.bucket_counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.count if self.count else 0.0,
+            'max_seconds': self.max_seconds,
+            'buckets': buckets,
+        }
+
+
+class PipelineProfiler:
+    """
+    Times every pipe of a spaCy pipeline, per doc, and aggregates the timings across a run.
+
+    pipe() runs texts through the enabled pipes the way nlp.pipe does (tokenizer, then each pipe's pipe() or
+    __call__), with a timer around every stage. Stages are chained generators, so a stage's time is measured
+    exclusive of the stages before it. Pipes that work in batches (e.g. section_ner) do their work when the first
+    doc of a batch is requested, so the whole batch is charged to that doc: use total_seconds for those, the
+    histogram shows the batch latency.
+    Timings are keyed by (pipeline name, component name), one profiler can be shared by the col and path pipelines.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.stats = {}
+        # time spent in upstream stages during the current next() call of each active stage
+        self._upstream = []
+
+    def _get_stats(self, key):
+        if key not in self.stats:
+            self.stats[key] = ComponentStats(self.buckets)
+        return self.stats[key]
+
+    # Run texts through the pipeline, timing each stage
+    # params: pipeline name (label of the timings, e.g. 'col'), spaCy Language object, iterable of texts
+    # yields: processed Docs in input order
+    def pipe(self, pipeline, nlp, texts, batch_size=None):
+        kwargs = {} if batch_size is None else {'batch_size': batch_size}
+        # stats are created in pipeline order (the generators below start from the last stage)
+        for name in ['tokenizer'] + nlp.pipe_names:
+            self._get_stats((pipeline, name))
+        # time spent producing the texts is not charged to the tokenizer
+        docs = self._timed(None, texts)
+        docs = self._timed((pipeline, 'tokenizer'), map(nlp.make_doc, docs))
+        for name, proc in nlp.pipeline:
+            if hasattr(proc, 'pipe'):
+                docs = proc.pipe(docs, **kwargs)
+            else:
+                docs = map(proc, docs)
+            docs = self._timed((pipeline, name), docs)
+        yield from docs
+
+    # Context manager timing a step outside the spaCy pipeline (e.g. building the report object)
+    @contextmanager
+    def timer(self, pipeline, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._get_stats((pipeline, name)).observe(time.perf_counter() - start)
+
+    # Wraps an iterator, charging the time of each next() call (minus upstream stages) to key
+    # key None only passes the time on as upstream time
+    def _timed(self, key, docs):
+        docs = iter(docs)
+        stats = self._get_stats(key) if key is not None else None
+        while True:
+            self._upstream.append(0.0)
+            start = time.perf_counter()
+            try:
+                doc = next(docs)
+            except StopIteration:
+                doc = None
+                exhausted = True
+            else:
+                exhausted = False
+            elapsed = time.perf_counter() - start
+            upstream = self._upstream.pop()
+            if self._upstream:
+                self._upstream[-1] += elapsed
+            if stats is not None:
+                if exhausted:
+                    stats.total_seconds += elapsed - upstream
+                else:
+                    stats.observe(elapsed - upstream)
+            if exhausted:
+                return
+            yield doc
+
+    # returns dict of pipeline name -> component name -> stats dict, components in pipeline order
+    def to_dict(self):
+        result = {}
+        for (pipeline, name), stats in self.stats.items():
+            result.setdefault(pipeline, {})[name] = stats.to_dict()
+        return result
+
+    # returns the timings as a Prometheus text format histogram (seconds per doc, per pipeline and component)
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        metric = '{}_component_seconds'.format(prefix)
+        lines = [
+            '# HELP {} Time spent per doc in each pipeline component.'.format(metric),
+            '# TYPE {} histogram'.format(metric),
+        ]
+        for (pipeline, name), stats in self.stats.items():
+            labels = 'pipeline="{}",component="{}"'.format(pipeline, name)
+            for bound, cumulative in stats.to_dict()['buckets'].items():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, bound, cumulative))
+            lines.append('{}_sum{{{}}} {!r}'.format(metric, labels, stats.total_seconds))
+            lines.append('{}_count{{{}}} {}'.format(metric, labels, stats.count))
+        return '\n'.join(lines) + '\n'
+
+    # Write the Prometheus dump to a file, e.g. for the node_exporter textfile collector
+    # (written to a temporary file and renamed, so a scrape never sees a partial file)
+    def write_prometheus(self, path, prefix=METRIC_PREFIX):
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        self.stats.clear()
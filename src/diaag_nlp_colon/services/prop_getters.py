@@ -1,14 +1,28 @@
+from collections import namedtuple
+import numpy
+from spacy.attrs import ENT_TYPE, ENT_IOB, SENT_START
+from diaag_nlp_colon.services import false_pos_flags, section_index
+
 # Getters for custom property extensions
 
 
+# returns entity type hashes of the tokens in a Doc or Span
+# and a mask of the tokens whose entity is not marked as false pos
+def _ent_types(tokens):
+    doc, start, end = false_pos_flags.span_bounds(tokens)
+    ent_types, ent_iob = doc.to_array([ENT_TYPE, ENT_IOB]).T
+    valid = ~false_pos_flags.removed_tokens(doc, ent_iob)
+    return ent_types[start:end], valid[start:end]
+
+
 # returns True if span has any token marked as a false pos
 def has_false_positive(tokens):
-    return any([t._.get('is_false_pos') for t in tokens])
+    return false_pos_flags.span_has_false_pos(tokens)
 
 
 # returns True if span has a sample entity
 def has_sample(tokens):
-    return any([t.ent_type_ == 'POLYP_SAMPLE' and not t._.is_false_pos for t in tokens])
+    return sample_count(tokens) > 0
 
 
 # returns True if span has any entity marked as related to a previously seen lesion
@@ -18,47 +32,85 @@ def has_prev_lesion(tokens):
 
 # returns number of sample entities (tokens) in span
 def sample_count(tokens):
-    return len([t for t in tokens if t.ent_type_ == 'POLYP_SAMPLE' and not t._.is_false_pos])
+    ent_types, valid = _ent_types(tokens)
+    return int(numpy.count_nonzero(valid & (ent_types == tokens.vocab.strings['POLYP_SAMPLE'])))
 
 
 # returns number of location entities in span
 def loc_count(span):
-    return len([e for e in span.ents if e.label_ == 'POLYP_LOC'])
+    return len([e for e in false_pos_flags.valid_ents(span) if e.label_ == 'POLYP_LOC'])
 
 
 # returns number of measured size entities in span
 def size_meas_count(span):
-    return len([e for e in span.ents if e.label_ == 'POLYP_SIZE_MEAS'])
+    return len([e for e in false_pos_flags.valid_ents(span) if e.label_ == 'POLYP_SIZE_MEAS'])
 
 
 # returns number of nonspecific size entities in span
 def size_nonspec_count(span):
-    return len([e for e in span.ents if e.label_ == 'POLYP_SIZE_NONSPEC'])
+    return len([e for e in false_pos_flags.valid_ents(span) if e.label_ == 'POLYP_SIZE_NONSPEC'])
 
 
 # returns True if span has sample properties
 def has_props(tokens):
-    return any([t.ent_type_ and t.ent_type_ != 'POLYP_SAMPLE' and not t._.is_false_pos for t in tokens])
+    ent_types, valid = _ent_types(tokens)
+    return bool((valid & (ent_types != 0) & (ent_types != tokens.vocab.strings['POLYP_SAMPLE'])).any())
 
 
 # returns True if span has any entities marking malignant pathology samples
 def has_malignancy(tokens):
-    return any([t.ent_type_ and t.ent_type_ == 'MALIGNANCY' and not t._.is_false_pos for t in tokens])
+    ent_types, valid = _ent_types(tokens)
+    return bool((valid & (ent_types == tokens.vocab.strings['MALIGNANCY'])).any())
+
+
+# Per-sentence entity statistics of a doc, one array entry per sentence (in doc.sents order)
+SentenceEntTable = namedtuple('SentenceEntTable', ['has_sample', 'has_props', 'loc_count', 'size_meas_count'])
+
+
+# returns SentenceEntTable computed in one pass over doc.to_array, same values as the has_sample, has_props,
+# loc_count and size_meas_count Span getters of each sentence
+def sentence_ent_table(doc):
+    strings = doc.vocab.strings
+    ent_type, ent_iob, sent_start = doc.to_array([ENT_TYPE, ENT_IOB, SENT_START]).T
+    is_start = sent_start == 1
+    if len(doc) > 0:
+        is_start[0] = True
+    sent_ids = numpy.cumsum(is_start) - 1
+    n_sents = int(is_start.sum())
+
+    # token level: entity tokens not marked as false positive
+    valid = ~false_pos_flags.removed_tokens(doc, ent_iob)
+    is_sample = ent_type == strings['POLYP_SAMPLE']
+    sample_tokens = numpy.bincount(sent_ids[valid & is_sample], minlength=n_sents)
+    prop_tokens = numpy.bincount(sent_ids[valid & (ent_type != 0) & ~is_sample], minlength=n_sents)
+
+    # entity level: entities that start and end in the same sentence (like Span.ents)
+    # and have no token marked for removal
+    ent_starts = numpy.flatnonzero(ent_iob == 3)
+    continues = numpy.append(ent_iob[1:] == 1, False)
+    ent_lasts = numpy.flatnonzero(((ent_iob == 3) | (ent_iob == 1)) & ~continues)
+    in_sent = (sent_ids[ent_starts] == sent_ids[ent_lasts]) & valid[ent_starts]
+    ent_labels = ent_type[ent_starts]
+
+    def ent_count(label):
+        return numpy.bincount(sent_ids[ent_starts[in_sent & (ent_labels == strings[label])]], minlength=n_sents)
+
+    return SentenceEntTable(sample_tokens > 0, prop_tokens > 0, ent_count('POLYP_LOC'), ent_count('POLYP_SIZE_MEAS'))
 
 
 # returns True if report mentions incomplete procedure
 def has_incomplete_proc(doc):
-    return any([ent.label_  == 'INCOMPLETE_PROC' for ent in doc.ents])
+    return any([ent.label_ == 'INCOMPLETE_PROC' for ent in false_pos_flags.valid_ents(doc)])
 
 
 # returns True if report mentions piecemeal removal
 def has_removed_piecemeal(doc):
-    return any([ent.label_ == "REMOVED_PIECEMEAL" for ent in doc.ents])
+    return any([ent.label_ == "REMOVED_PIECEMEAL" for ent in false_pos_flags.valid_ents(doc)])
 
 
 # returns True if any PREP_QUALITY entity indicates poor or inadequate preparation for exam
 def has_poor_prep(doc):
-    for ent in doc.ents:
+    for ent in false_pos_flags.valid_ents(doc):
         if ent.label_ == 'PREP_QUALITY':
             if any(token.lower_ in ['poor', 'inadequate'] for token in ent):
                 return True
@@ -67,7 +119,7 @@ def has_poor_prep(doc):
 
 # True if polyp finding is marked as retained or if the description appears outside of Findings section
 def has_retained_polyp_ent(doc):
-    return any([ent.label_ == 'RETAINED_POLYP' for ent in doc.ents])
+    return any([ent.label_ == 'RETAINED_POLYP' for ent in false_pos_flags.valid_ents(doc)])
 
 
 # True if polyp finding is marked as retained or if the description appears outside of Findings section
@@ -83,26 +135,22 @@ def has_retained_polyp(doc):
 # returns list of section header entities
 def get_section_headers(doc):
     header_ents = {}
-    order = 0
-    for ent in doc.ents:
-        if ent.label_ == 'SECTION_HEADER':
-            header_ents[ent.ent_id_] = (ent, order)
-            order += 1
+    for order, ent in enumerate(get_section_header_list(doc)):
+        header_ents[ent.ent_id_] = (ent, order)
     return header_ents
 
 
 # Doc extension getter
-# return ordered list of section header ents
+# return ordered list of section header ents (from the cached section index)
 def get_section_header_list(doc):
-    header_ent_dict = {}
-    header_ents = []
-    for ent in doc.ents:
-        if ent.label_ == 'SECTION_HEADER':
-            header_ent_dict[ent.start] = ent
-    for start in sorted(header_ent_dict.keys()):
-        ent = header_ent_dict[start]
-        header_ents.append(ent)
-    return header_ents
+    return section_index.get_section_index(doc).header_spans(doc)
+
+
+# Doc extension getter
+# returns Span of the relevant report section (whole doc if no section window was set)
+def get_relevant_section(doc):
+    section_bounds = doc._.section_bounds or (0, len(doc))
+    return doc[section_bounds[0]: section_bounds[1]]
 
 
 def get_score_PIRADS(doc):
@@ -0,0 +1,168 @@
+import collections
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+
+import diaag_nlp_colon
+from diaag_nlp_colon.config import pipeline_configs
+from diaag_nlp_colon.config.colon import false_pos_rules
+from diaag_nlp_colon.nlp_models import en_trained_sections_col, en_trained_sections_path
+
+# Content-addressed cache of pipeline results (opt-in, see colon_pipelines.col_pipeline)
+
+# Package sources that are part of the cache version, relative to the package directory (directories include every
+# .py file below them): editing a pattern, rule, vocab list or component invalidates cached results
+RULE_SOURCES = [
+    'config',
+    'components',
+    'classes',
+    'pipelines/colon_pipelines.py',
+    'services/colon_report_buckets.py',
+    'services/false_pos_flags.py',
+    'services/keyword_scanner.py',
+    'services/prop_getters.py',
+    'services/section_index.py',
+    'services/section_splitter.py',
+]
+
+
+# sha256 of the RULE_SOURCES files, in a fixed order
+def rule_source_hash():
+    package_dir = os.path.dirname(diaag_nlp_colon.__file__)
+    paths = []
+    for source in RULE_SOURCES:
+        source = os.path.join(package_dir, source)
+        if os.path.isdir(source):
+            paths += [os.path.join(root, filename) for root, _, filenames in os.walk(source)
+                      for filename in filenames if filename.endswith('.py')]
+        else:
+            paths.append(source)
+    source_hash = hashlib.sha256()
+    for path in sorted(paths):
+        source_hash.update(os.path.relpath(path, package_dir).encode())
+        with open(path, 'rb') as f:
+            source_hash.update(f.read())
+    return source_hash.hexdigest()
+
+
+# Everything besides the report text that the pipeline output depends on
+# returns dict of pipeline version, trained model versions (from their meta.json), rule source hash and
+#   false positive rule table hash (the table as loaded, so rules changed at runtime count too)
+def version_info():
+    rules = json.dumps(false_pos_rules.FP_RULES, sort_keys=True, default=str)
+    return {
+        'versions': pipeline_configs.CURRENT_VERSIONS,
+        'models': {
+            'col': en_trained_sections_col.__version__,
+            'path': en_trained_sections_path.__version__,
+        },
+        'sources': rule_source_hash(),
+        'fp_rules': hashlib.sha256(rules.encode()).hexdigest(),
+    }
+
+
+class ResultCache:
+    """
+    Stores pipeline results by a hash of their input text and the pipeline version.
+
+    Keys hash the kind of result (e.g. 'col'), the input texts, options that change the result and version_info(),
+    so results made before a version bump, model update or pattern, rule or component edit are never returned.
+    Results are pickled: every get() returns a new copy, callers can modify it (the bucket filters do).
+    The most recent max_entries results are kept in memory (LRU); with a path, all results are also stored in a
+    SQLite database and survive the process. Safe to share between threads.
+    The version is read when the cache is created; create a new cache after editing rules in a running session.
+    """
+
+    def __init__(self, path=None, max_entries=10000):
+        self.max_entries = max_entries
+        self.version = hashlib.sha256(json.dumps(version_info(), sort_keys=True).encode()).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, value BLOB)')
+            self._db.commit()
+
+    # returns hex key for a result
+    # params: kind of result (e.g. 'col', 'path', 'rec'), list of input texts (None for a missing text),
+    #   options that change the result
+    def key(self, kind, texts, **options):
+        payload = json.dumps([self.version, kind, texts, options], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    # returns (True, copy of the stored result) or (False, None)
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    data = row[0]
+                    self._remember(key, data)
+            if data is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        return True, pickle.loads(data)
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, data)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results (key, version, value) VALUES (?, ?, ?)',
+                                 (key, self.version, data))
+                self._db.commit()
+
+    # Return the stored result for the key, or compute, store and return it
+    # params: key (see key()), function of no arguments that makes the result
+    def get_or_compute(self, key, compute):
+        found, value = self.get(key)
+        if found:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # Delete stored results of other versions from the database
+    # returns: number of deleted results
+    def prune(self):
+        if self._db is None:
+            return 0
+        with self._lock:
+            deleted = self._db.execute('DELETE FROM results WHERE version != ?', (self.version,)).rowcount
+            self._db.commit()
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
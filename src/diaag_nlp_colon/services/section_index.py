@@ -0,0 +1,90 @@
+import numpy
+from spacy.attrs import ENT_IOB, ENT_TYPE, ENT_ID
+from spacy.tokens import Span
+from diaag_nlp_colon.services.section_splitter import SectionHeader
+
+# Section layout of a Doc, computed once from its SECTION_HEADER ents and cached in doc.user_data
+
+# doc.user_data key of the cached index
+SECTION_INDEX_KEY = 'section_index'
+
+# ENT_IOB values of tokens inside an entity
+IOB_BEGIN = 3
+IOB_INSIDE = 1
+
+
+class SectionIndex:
+    """
+    Section headers of a Doc, in token offsets.
+
+    headers: list of SectionHeader(start, end, section_id), sorted by position
+    token_sections: array of header index for each token, -1 for header tokens and tokens before the first header
+    A section runs from the end of its header to the start of the next header (or the end of the doc).
+    """
+
+    def __init__(self, headers, token_sections, ents_key):
+        self.headers = headers
+        self.token_sections = token_sections
+        # fingerprint of the doc's entity annotation the index was built from, see _ents_key
+        self.ents_key = ents_key
+
+    @classmethod
+    def from_doc(cls, doc):
+        ent_array = doc.to_array([ENT_IOB, ENT_TYPE, ENT_ID])
+        iob = ent_array[:, 0]
+        is_header = ent_array[:, 1] == doc.vocab.strings.add('SECTION_HEADER')
+        starts = numpy.flatnonzero(is_header & (iob == IOB_BEGIN))
+        # a header ends where the next token does not continue it
+        continues = numpy.append(is_header[1:] & (iob[1:] == IOB_INSIDE), False)
+        ends = numpy.flatnonzero(is_header & ~continues) + 1
+
+        headers = [
+            SectionHeader(int(start), int(end), doc.vocab.strings[int(ent_array[start, 2])] or None)
+            for start, end in zip(starts, ends)
+        ]
+        token_sections = numpy.full(len(doc), -1, dtype=numpy.int32)
+        for idx, header in enumerate(headers):
+            section_end = headers[idx + 1].start if idx < len(headers) - 1 else len(doc)
+            token_sections[header.end:section_end] = idx
+        return cls(headers, token_sections, _ents_key(doc))
+
+    # Token range of the content of a section, None if there is no header with one of the section ids
+    # optional param: first, use the first matching header instead of the last one
+    # returns: (start, end)
+    def section_bounds(self, section_ids, first=False):
+        if isinstance(section_ids, str):
+            section_ids = [section_ids]
+        matches = [idx for idx, header in enumerate(self.headers) if header.section_id in section_ids]
+        if not matches:
+            return None
+        idx = matches[0] if first else matches[-1]
+        section_end = self.headers[idx + 1].start if idx < len(self.headers) - 1 else len(self.token_sections)
+        return self.headers[idx].end, section_end
+
+    # section id of the section containing a token, None for header tokens and tokens before the first header
+    def token_section(self, token_i):
+        idx = self.token_sections[token_i]
+        return self.headers[idx].section_id if idx >= 0 else None
+
+    # header ents as Spans, same as the SECTION_HEADER ents of the doc
+    def header_spans(self, doc):
+        return [Span(doc, h.start, h.end, label='SECTION_HEADER', span_id=h.section_id or 0) for h in self.headers]
+
+
+# Cheap fingerprint of a doc's ents: doc length, number of ents and the bounds of the first and last ent
+# The components that write doc.ents after the entity ruler only drop ents, which changes the count, and a section doc
+# made with as_doc(copy_user_data=True) has a different length, so the annotation is not hashed on every lookup.
+def _ents_key(doc):
+    ents = doc.ents
+    if not ents:
+        return len(doc), 0, 0, 0
+    return len(doc), len(ents), ents[0].start, ents[-1].end
+
+
+# Return the cached section index of a doc, rebuilt only if the doc's ents changed since it was computed
+def get_section_index(doc):
+    index = doc.user_data.get(SECTION_INDEX_KEY)
+    if index is None or index.ents_key != _ents_key(doc):
+        index = SectionIndex.from_doc(doc)
+        doc.user_data[SECTION_INDEX_KEY] = index
+    return index
@@ -0,0 +1,82 @@
+import re
+from collections import namedtuple
+
+# Locate report section headers on raw text, before the report is tokenized
+
+# Header found in report text, character offsets
+SectionHeader = namedtuple('SectionHeader', ['start', 'end', 'section_id'])
+
+
+class SectionSplitter:
+    """
+    Finds section headers in raw report text using the entity ruler's SECTION_HEADER token patterns.
+
+    Each token pattern is translated into a regex: TEXT values match case-sensitively, LOWER values
+    case-insensitively, REGEX predicates are searched within a token, IN lists become alternations and
+    "?" operators make a token optional. Word tokens must sit on word boundaries, the way the tokenizer
+    splits them. A REGEX token always takes the whole word it is found in, like a tokenizer token, so a match
+    is never retried with a shorter token (which is quadratic on long runs of a header word without its colon).
+    Overlapping matches are resolved like the entity ruler: longest match first, then earliest.
+    """
+
+    def __init__(self, header_patterns):
+        self.patterns = [
+            (re.compile(self._pattern_regex(p['pattern'])), p.get('id'))
+            for p in header_patterns
+            if p['label'] == 'SECTION_HEADER'
+        ]
+
+    @classmethod
+    def _pattern_regex(cls, token_patterns):
+        parts = []
+        for idx, token in enumerate(token_patterns):
+            part = r'(?:{}\s*)'.format(cls._token_regex(token, 't{}'.format(idx)))
+            if token.get('OP') == '?':
+                part += '?'
+            parts.append(part)
+        return ''.join(parts)
+
+    # group: name of the capture group used to make a REGEX token atomic
+    @staticmethod
+    def _token_regex(token, group):
+        attr = next(key for key in token if key.upper() in ('TEXT', 'LOWER'))
+        value = token[attr]
+        # scoped case flag: TEXT is case-sensitive, LOWER is not
+        flag = '-i' if attr.upper() == 'TEXT' else 'i'
+        if isinstance(value, dict) and 'REGEX' in value:
+            # REGEX predicates are searched within the token text
+            # the lookahead and backreference emulate an atomic group (not available before Python 3.11)
+            return r'(?{}:(?<!\w)(?=(?P<{}>\w*(?:{})\w*(?!\w)))(?P={}))'.format(flag, group, value['REGEX'], group)
+        values = value['IN'] if isinstance(value, dict) else [value]
+        alternation = '|'.join(re.escape(v) for v in values)
+        if all(re.match(r'\w', v) for v in values):
+            alternation = r'(?<!\w)(?:{})(?!\w)'.format(alternation)
+        return '(?{}:{})'.format(flag, alternation)
+
+    # returns list of SectionHeader sorted by position
+    def find_headers(self, text):
+        candidates = []
+        for regex, section_id in self.patterns:
+            for match in regex.finditer(text):
+                # matches include trailing whitespace after the last token
+                end = match.start() + len(match.group().rstrip())
+                if end > match.start():
+                    candidates.append(SectionHeader(match.start(), end, section_id))
+        headers = []
+        taken = set()
+        for header in sorted(candidates, key=lambda h: (h.start - h.end, h.start)):
+            if not any(i in taken for i in range(header.start, header.end)):
+                headers.append(header)
+                taken.update(range(header.start, header.end))
+        return sorted(headers)
+
+    # Character range of the content of the first section with one of the given ids
+    # (from the end of its header to the start of the next header)
+    # returns: (start, end) or None if there is no such section
+    def section_range(self, text, section_ids):
+        headers = self.find_headers(text)
+        for idx, header in enumerate(headers):
+            if header.section_id in section_ids:
+                end = headers[idx + 1].start if idx < len(headers) - 1 else len(text)
+                return header.end, end
+        return None
@@ -0,0 +1,235 @@
+import functools
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+
+from diaag_nlp_colon.pipelines import colon_pipelines
+
+# Streaming execution of large batch runs: reader -> NLP workers -> writer, connected by bounded queues
+
+# Seconds a blocked thread waits on a queue before checking whether the run was stopped
+POLL_SECONDS = 0.1
+
+# Marks the end of the input on the queues
+_END = object()
+
+
+class StreamEngine:
+    """
+    Runs items from a source through a chunk processing function and hands the results to a sink, in input order.
+
+    A reader thread takes chunk_size items at a time from the source, worker threads process the chunks and a writer
+    thread passes the results to the sink. The threads are connected by queues of at most queue_size chunks and the
+    reader waits while queue_size * 2 + workers chunks are read but not written, so a slow sink (or one slow chunk)
+    blocks the reader instead of piling up results, and reading and writing overlap with processing.
+    With workers > 1 the chunks are processed in a pool of that many processes (spaCy pipelines are CPU bound and not
+    thread safe), the worker threads only hand chunks to it: process, its arguments, the items and results must be
+    picklable. The first error in any thread stops the run and is raised by run().
+    """
+
+    def __init__(self, process, workers=1, chunk_size=64, queue_size=None, initializer=None, initargs=()):
+        if workers != -1 and workers < 1:
+            raise ValueError('workers must be at least 1, or -1 for one per CPU, not {}'.format(workers))
+        self.process = process
+        self.workers = (os.cpu_count() or 1) if workers == -1 else workers
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size or self.workers * 2
+        self.initializer = initializer
+        self.initargs = initargs
+        self.items_read = 0
+        self.items_written = 0
+        self._stop = threading.Event()
+        self._errors = []
+
+    # Process every item of source and call sink with each result, in input order
+    # params: iterable of items, function called with one result at a time (from the writer thread)
+    # returns: number of results passed to sink
+    def run(self, source, sink):
+        return self._run(source, sink, self._start_pool())
+
+    # Like run(), but yields the results in input order instead of passing them to a sink
+    # The engine runs in a background thread, results wait in a queue of chunk_size results for the caller.
+    # Closing the generator early stops the run.
+    def results(self, source):
+        output = queue.Queue(self.chunk_size)
+        closed = threading.Event()
+        errors = []
+
+        def sink(result):
+            while not closed.is_set():
+                try:
+                    output.put(result, timeout=POLL_SECONDS)
+                    return
+                except queue.Full:
+                    pass
+            self._stop.set()
+
+        def run_engine():
+            try:
+                self._run(source, sink, pool)
+            except BaseException as e:
+                errors.append(e)
+            sink(_END)
+
+        # the pool forks its workers here, before the engine threads start
+        pool = self._start_pool()
+        thread = threading.Thread(target=run_engine, name='stream-engine')
+        thread.start()
+        try:
+            while True:
+                result = output.get()
+                if result is _END:
+                    break
+                yield result
+        finally:
+            closed.set()
+            self._stop.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    # Process pool for workers > 1 (None otherwise), made on the calling thread before any engine thread starts:
+    # forking while other threads run can leave a worker with a lock held by a thread that doesn't exist there
+    def _start_pool(self):
+        if self.workers > 1:
+            return multiprocessing.Pool(self.workers, initializer=self.initializer, initargs=self.initargs)
+        if self.initializer:
+            self.initializer(*self.initargs)
+        return None
+
+    def _run(self, source, sink, pool):
+        self._stop.clear()
+        self._errors = []
+        self.items_read = 0
+        self.items_written = 0
+        chunks = queue.Queue(self.queue_size)
+        results = queue.Queue(self.queue_size)
+        # chunks read but not written yet
+        self._in_flight = threading.Semaphore(self.queue_size * 2 + self.workers)
+        if pool is not None:
+            def process(chunk):
+                return pool.apply(self.process, (chunk,))
+        else:
+            process = self.process
+        threads = [threading.Thread(target=self._guard, args=(self._read, source, chunks), name='stream-reader')]
+        threads += [threading.Thread(target=self._guard, args=(self._work, process, chunks, results),
+                                     name='stream-worker-{}'.format(i)) for i in range(self.workers)]
+        threads.append(threading.Thread(target=self._guard, args=(self._write, results, sink), name='stream-writer'))
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self._stop.set()
+            if pool is not None:
+                if self._errors:
+                    pool.terminate()
+                else:
+                    pool.close()
+                pool.join()
+        if self._errors:
+            raise self._errors[0]
+        return self.items_written
+
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    # put that gives up when the run is stopped, returns False then
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # waits for a free in-flight chunk slot, returns False if the run is stopped
+    def _acquire_slot(self):
+        while not self._stop.is_set():
+            if self._in_flight.acquire(timeout=POLL_SECONDS):
+                return True
+        return False
+
+    # get that gives up when the run is stopped, returns _END then
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _read(self, source, chunks):
+        source = iter(source)
+        for index in itertools.count():
+            if not self._acquire_slot():
+                return
+            chunk = list(itertools.islice(source, self.chunk_size))
+            if not chunk:
+                break
+            self.items_read += len(chunk)
+            if not self._put(chunks, (index, chunk)):
+                return
+        for _ in range(self.workers):
+            self._put(chunks, _END)
+
+    def _work(self, process, chunks, results):
+        while True:
+            item = self._get(chunks)
+            if item is _END:
+                self._put(results, _END)
+                return
+            index, chunk = item
+            if not self._put(results, (index, process(chunk))):
+                return
+
+    # chunks can finish out of order, they are held until the chunks before them are written
+    def _write(self, results, sink):
+        waiting = {}
+        next_index = 0
+        ended = 0
+        while ended < self.workers:
+            item = self._get(results)
+            if item is _END:
+                if self._stop.is_set():
+                    return
+                ended += 1
+                continue
+            index, chunk_results = item
+            waiting[index] = chunk_results
+            while next_index in waiting:
+                for result in waiting.pop(next_index):
+                    sink(result)
+                    self.items_written += 1
+                next_index += 1
+                self._in_flight.release()
+
+
+# Chunk processing function for reports: runs (report text, context) tuples through the batch pipeline
+# returns: list of (report, context) in input order
+def process_reports(report_type, reports, batch_size=None, prescreen=False):
+    pipeline_batch = colon_pipelines.col_pipeline_batch if report_type == 'col' else colon_pipelines.path_pipeline_batch
+    return list(pipeline_batch(reports, as_tuples=True, batch_size=batch_size, prescreen=prescreen))
+
+
+# Runs (report text, context) tuples through the pipeline of a report type with a StreamEngine
+# The pipeline is built before the workers start, forked workers inherit it (others build it once each)
+# required param: report type ('col' or 'path'), iterable of (report text, context), function called with each
+#   (report, context) in input order
+# optional param: workers, chunk_size, queue_size, see StreamEngine; batch_size, prescreen, see col_pipeline_batch
+# returns: number of reports passed to sink
+def run_reports(report_type, reports, sink, workers=1, chunk_size=64, queue_size=None, batch_size=None,
+                prescreen=False):
+    process = functools.partial(process_reports, report_type, batch_size=batch_size, prescreen=prescreen)
+    engine = StreamEngine(process, workers=workers, chunk_size=chunk_size, queue_size=queue_size,
+                          initializer=colon_pipelines.get_nlp, initargs=(report_type,))
+    colon_pipelines.get_nlp(report_type)
+    return engine.run(reports, sink)
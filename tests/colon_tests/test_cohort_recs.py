@@ -0,0 +1,33 @@
+import pytest
+from diaag_nlp_colon.classes.report import ColReport, PathReport
+from diaag_nlp_colon.services import colon_report_buckets
+
+
+class TestCohortRecs:
+    def test_rejoined_per_patient(self, batches):
+        patients = [('a', 'colo a', 'path a'), ('b', 'colo b', None), ('c', 'colo c', ''), ('d', 'colo d', 'path d')]
+        recs = list(colon_report_buckets.make_recs_from_text(patients, chunk_size=3))
+        # one col and one path batch per chunk, patients without a path report are left out of the path batch
+        assert batches == [('col', ['colo a', 'colo b', 'colo c']), ('path', ['path a']),
+                           ('col', ['colo d']), ('path', ['path d'])]
+        assert [patient_id for patient_id, _ in recs] == ['a', 'b', 'c', 'd']
+        for (_, col_text, path_text), (_, rec) in zip(patients, recs):
+            path_report = PathReport(path_text) if path_text else None
+            assert rec == colon_report_buckets.rec_from_reports(ColReport(col_text), path_report)
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_stand_in_pipelines(self, col_nlp, path_nlp, workers):
+        # runs the col and path pipelines (with stand-in model pipes) end to end
+        with open('./tests/reports/colo_sample.txt') as f:
+            col_report = f.read()
+        with open('./tests/reports/colo_path_sample.txt') as f:
+            path_report = f.read()
+        patients = [
+            ('a', col_report, path_report),
+            ('b', 'A large polyp in the sigmoid colon was removed.', None),
+            ('c', 'A small polyp in the rectum was removed.', 'FINAL DIAGNOSIS: A. Rectum, polyp: hyperplastic polyp.'),
+        ]
+        recs = list(colon_report_buckets.make_recs_from_text(patients, workers=workers, chunk_size=2))
+        assert [patient_id for patient_id, _ in recs] == ['a', 'b', 'c']
+        for (_, col_text, path_text), (_, rec) in zip(patients, recs):
+            assert rec == colon_report_buckets.make_rec_from_text(col_text, path_text)
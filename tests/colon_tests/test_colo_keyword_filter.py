@@ -0,0 +1,32 @@
+import pytest
+from diaag_nlp_colon.components.colo_keyword_filter import is_col_related
+
+with open(f"./tests/reports/colo_sample.txt") as f:
+    colo_report = f.read()
+
+with open(f"./tests/reports/colo_path_sample.txt") as f:
+    path_report = f.read()
+
+
+class TestColKeywords:
+    @pytest.mark.parametrize(
+        'text',
+        [
+            pytest.param(colo_report, id="colo-report"),
+            pytest.param(path_report, id="path-report"),
+            pytest.param('Polyp removed from the sigmoid.', id="keyword-lowercase"),
+        ]
+    )
+    def test_col_related(self, text):
+        assert is_col_related(text)
+
+    @pytest.mark.parametrize(
+        'text',
+        [
+            pytest.param('EGD: scope passed through the mouth. Colon not examined.', id="fp-keyword"),
+            pytest.param('INITIAL CONSULT for rectal bleeding', id="consult-note"),
+            pytest.param('No relevant keywords here.', id="no-keyword"),
+        ]
+    )
+    def test_not_col_related(self, text):
+        assert not is_col_related(text)
@@ -0,0 +1,45 @@
+import random
+import spacy
+import pytest
+from spacy.tokens import Span
+from diaag_nlp_colon.config.colon import col_patterns
+# registers the custom components
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+WORDS = ['polyp', 'polyps', 'sigmoid', 'colon', 'cecum', 'rectum', '5', 'mm', 'removed', 'with', 'cold', 'snare',
+         'FINDINGS', ':', 'two', 'sessile', '.', 'the', 'in', 'biopsy']
+
+
+def make_ruler(factory, overwrite_ents):
+    nlp = spacy.blank('en')
+    ruler = nlp.add_pipe(factory, config={"overwrite_ents": overwrite_ents})
+    ruler.add_patterns(col_patterns.header_patterns + col_patterns.polyp_patterns)
+    return nlp, ruler
+
+
+# doc with random words and random non-overlapping "model" entities
+def make_doc(nlp, rng):
+    doc = nlp.make_doc(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 60))))
+    ents = []
+    i = 0
+    while i < len(doc):
+        length = rng.randint(1, 3)
+        if rng.random() < 0.3 and i + length <= len(doc):
+            ents.append(Span(doc, i, i + length, label=rng.choice(['POLYP_LOC', 'POLYP_SAMPLE', 'OTHER'])))
+        i += length
+    doc.ents = ents
+    return doc
+
+
+class TestColonEntityRuler:
+    @pytest.mark.parametrize('overwrite_ents', [True, False])
+    def test_same_as_entity_ruler(self, overwrite_ents):
+        rng = random.Random(0)
+        nlp, spacy_ruler = make_ruler('entity_ruler', overwrite_ents)
+        _, colon_ruler = make_ruler('colon_entity_ruler', overwrite_ents)
+        for _ in range(300):
+            doc = make_doc(nlp, rng)
+            expected = spacy_ruler(doc.copy())
+            result = colon_ruler(doc.copy())
+            assert [(e.start, e.end, e.label_, e.ent_id_) for e in result.ents] == \
+                   [(e.start, e.end, e.label_, e.ent_id_) for e in expected.ents]
@@ -0,0 +1,177 @@
+import pytest
+import spacy
+from diaag_nlp_colon.config import pipeline_configs
+from diaag_nlp_colon.nlp_models import en_trained_sections_col, en_trained_sections_path
+from diaag_nlp_colon.pipelines import colon_pipelines, package_pipelines
+from tests.helpers import build_path_nlp_stand_in, trained_ner_stand_in
+
+with open(f"./tests/reports/colo_path_sample.txt") as f:
+    path_report = f.read()
+with open(f"./tests/reports/colo_sample.txt") as f:
+    col_report = f.read()
+with open(f"./tests/reports/colo_prep_sample.txt") as f:
+    col_prep_report = f.read()
+
+texts = [
+    path_report,
+    'FINAL DIAGNOSIS: A. Colon, sigmoid, polyp: tubular adenoma.',
+    'Stomach, antrum, biopsy: chronic gastritis.',
+    'FINAL DIAGNOSIS: B. Rectum, polyp: hyperplastic polyp.',
+    'Esophagus, biopsy: Barrett mucosa.',
+]
+
+
+@pytest.fixture()
+def builds(monkeypatch):
+    # stands in for the pipeline builders: records the (report type, options) of every build
+    calls = []
+
+    def builder(report_type):
+        def build(**options):
+            calls.append((report_type, options))
+            return object()
+        return build
+
+    monkeypatch.setattr(colon_pipelines, '_nlp_cache', {})
+    monkeypatch.setitem(colon_pipelines._nlp_builders, 'col', builder('col'))
+    monkeypatch.setitem(colon_pipelines._nlp_builders, 'path', builder('path'))
+    return calls
+
+
+def single_results(texts, prescreen=False):
+    return [colon_pipelines.path_pipeline(text, prescreen=prescreen).to_dict() for text in texts]
+
+
+class TestGetNlp:
+    def test_cached(self, builds):
+        nlp = colon_pipelines.get_nlp('col')
+        assert colon_pipelines.get_nlp('col') is nlp
+        assert colon_pipelines.get_nlp('path') is not nlp
+        assert builds == [('col', {}), ('path', {})]
+
+    def test_clear_nlp_cache(self, builds):
+        nlp = colon_pipelines.get_nlp('col')
+        colon_pipelines.clear_nlp_cache()
+        assert colon_pipelines.get_nlp('col') is not nlp
+        assert builds == [('col', {}), ('col', {})]
+
+    def test_options(self, builds):
+        nlp = colon_pipelines.get_nlp('col')
+        view_nlp = colon_pipelines.get_nlp('col', section_view=True)
+        both_nlp = colon_pipelines.get_nlp('col', section_view=True, section_ner=False)
+        assert len({id(nlp), id(view_nlp), id(both_nlp)}) == 3
+        assert colon_pipelines.get_nlp('col', section_ner=False, section_view=True) is both_nlp
+        assert colon_pipelines.get_nlp('col', section_view=True) is view_nlp
+        assert builds == [('col', {}), ('col', {'section_view': True}),
+                          ('col', {'section_view': True, 'section_ner': False})]
+
+
+class TestPipelineBatch:
+    @pytest.mark.parametrize('batch_size', [1, 2, 100])
+    def test_order(self, path_nlp, batch_size):
+        reports = list(colon_pipelines.path_pipeline_batch(texts, batch_size=batch_size))
+        assert [report.to_dict() for report in reports] == single_results(texts)
+        assert any(report.polyps for report in reports)
+
+    def test_as_tuples(self, path_nlp):
+        contexts = [{'file_id': str(i)} for i in range(len(texts))]
+        results = list(colon_pipelines.path_pipeline_batch(zip(texts, contexts), as_tuples=True, batch_size=2))
+        assert [context for _, context in results] == contexts
+        assert [report.to_dict() for report, _ in results] == single_results(texts)
+
+    def test_prescreen_interleaving(self, path_nlp, monkeypatch):
+        # pre-screened reports (2 and 4, the last one included) come back between the processed ones
+        piped = []
+        pipe = path_nlp.pipe
+
+        def record_pipe(texts, **kwargs):
+            return pipe((piped.append(text) or text for text in texts), **kwargs)
+
+        monkeypatch.setattr(path_nlp, 'pipe', record_pipe)
+        results = list(colon_pipelines.path_pipeline_batch(((text, i) for i, text in enumerate(texts)),
+                                                           as_tuples=True, batch_size=2, prescreen=True))
+        assert [context for _, context in results] == list(range(len(texts)))
+        assert piped == [colon_pipelines.clean_report_text(texts[i]) for i in [0, 1, 3]]
+        expected = single_results(texts, prescreen=True)
+        assert [report.to_dict() for report, _ in results] == expected
+        for i in [2, 4]:
+            assert expected[i] == colon_pipelines.make_empty_report('path', texts[i]).to_dict()
+
+    # forked workers inherit the stand-in pipeline from the cache
+    @pytest.mark.parametrize('prescreen', [False, True])
+    def test_n_process(self, path_nlp, prescreen):
+        reports = [(text, i) for i, text in enumerate(texts * 3)]
+        expected = list(colon_pipelines.path_pipeline_batch(reports, as_tuples=True, batch_size=2,
+                                                            prescreen=prescreen))
+        results = list(colon_pipelines.path_pipeline_batch(iter(reports), as_tuples=True, batch_size=2, n_process=2,
+                                                           prescreen=prescreen))
+        assert [context for _, context in results] == list(range(len(reports)))
+        assert [report.to_dict() for report, _ in results] == [report.to_dict() for report, _ in expected]
+
+
+class TestPackagePipelines:
+    def test_package_and_load(self, monkeypatch, tmp_path):
+        monkeypatch.setitem(colon_pipelines._nlp_builders, 'path', build_path_nlp_stand_in)
+        package_dir = package_pipelines.package_pipeline('path', tmp_path)
+        assert package_dir == tmp_path / 'en_colon_pipeline_path'
+        nlp = colon_pipelines.load_packaged_nlp('path', package_dir)
+        built_nlp = build_path_nlp_stand_in()
+        assert nlp.pipe_names == built_nlp.pipe_names
+        assert nlp.meta['version'] == pipeline_configs.CURRENT_VERSIONS['colon']
+        for text in texts:
+            assert (colon_pipelines.make_path_report(nlp(text)).to_dict() ==
+                    colon_pipelines.make_path_report(built_nlp(text)).to_dict())
+
+
+# stands in for a trained model package: untrained tok2vec and ner pipes (never run here)
+def trained_model_stand_in():
+    nlp = spacy.blank('en')
+    nlp.add_pipe('tok2vec')
+    nlp.add_pipe('ner')
+    return nlp
+
+
+class TestBuildNlp:
+    @pytest.mark.parametrize('report_type, model', [('col', en_trained_sections_col),
+                                                    ('path', en_trained_sections_path)])
+    def test_section_ner_opt_in(self, monkeypatch, report_type, model):
+        # section_ner changes the model's context and its entities, the default runs the model on the whole report
+        monkeypatch.setattr(model, 'load', trained_model_stand_in)
+        nlp = colon_pipelines.build_nlp(report_type)
+        assert 'section_ner' not in nlp.pipe_names
+        assert nlp.pipe_names[:4] == ['set_report_type', 'col_keyword_filter', 'tok2vec', 'ner']
+        section_nlp = colon_pipelines.build_nlp(report_type, section_ner=True)
+        assert 'section_ner' in section_nlp.pipe_names
+        assert set(section_nlp.disabled) == {'tok2vec', 'ner'}
+
+
+# reports with false positive context right before the relevant section
+section_edge_texts = {
+    'col': [
+        col_report,
+        col_prep_report,
+        'INDICATIONS: Screening. FINDINGS: A large ulcerated polyp in the sigmoid colon was removed. A small polyp '
+        'in the cecum was removed. IMPRESSION: Ulcer.',
+        'INDICATIONS: Screening, no FINDINGS: polyp in the rectum. IMPRESSION: Normal.',
+    ],
+    'path': [
+        path_report,
+        'GROSS DESCRIPTION: Negative for carcinoma, no FINAL DIAGNOSIS: Adenocarcinoma in a sigmoid colon polyp. '
+        'COMMENT: None.',
+        'GROSS DESCRIPTION: Received in two labelled "A" FINAL DIAGNOSIS: Sigmoid colon, polyp: tubular adenoma.',
+    ],
+}
+
+
+class TestSectionView:
+    @pytest.mark.parametrize('report_type, model', [('col', en_trained_sections_col),
+                                                    ('path', en_trained_sections_path)])
+    def test_same_reports_as_section_copy(self, monkeypatch, report_type, model):
+        # context checks in the section window only see the section, like they do in the section copy
+        monkeypatch.setattr(model, 'load', trained_ner_stand_in)
+        copy_nlp = colon_pipelines.build_nlp(report_type)
+        view_nlp = colon_pipelines.build_nlp(report_type, section_view=True)
+        make_report = colon_pipelines._report_makers[report_type]
+        for text in section_edge_texts[report_type]:
+            text = colon_pipelines.clean_report_text(text)
+            assert make_report(view_nlp(text)).to_dict() == make_report(copy_nlp(text)).to_dict()
@@ -0,0 +1,54 @@
+import io
+import json
+import logging
+import spacy
+import pytest
+from spacy.tokens import Span
+from diaag_nlp_colon.components import false_pos_filter
+from diaag_nlp_colon.services import diagnostics
+# registers the custom components and extensions
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+
+@pytest.fixture()
+def doc():
+    nlp = spacy.blank('en')
+    _doc = nlp('colon at 15 cm')
+    _doc.ents = [Span(_doc, 2, 4, label='POLYP_SIZE_MEAS')]
+    _doc._.set('report_type', 'col')
+    return _doc
+
+
+@pytest.fixture()
+def marker():
+    return false_pos_filter.create_false_pos_marker(spacy.blank('en'), 'mark_false_pos', 'col')
+
+
+class TestDiagnostics:
+    def test_off_by_default(self, doc, marker, caplog):
+        with caplog.at_level(logging.DEBUG):
+            marker(doc)
+        assert not diagnostics.enabled()
+        assert not [record for record in caplog.records if record.name == diagnostics.LOGGER_NAME]
+
+    def test_structured_event(self, doc, marker):
+        stream = io.StringIO()
+        handler = diagnostics.enable(structured=True, handler=logging.StreamHandler(stream))
+        try:
+            marker(doc)
+        finally:
+            diagnostics.disable(handler)
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert events == [{'component': 'mark_false_pos', 'rule': 'prev_word', 'label': 'POLYP_SIZE_MEAS',
+                           'start': 9, 'end': 14}]
+        assert not diagnostics.enabled()
+
+    def test_no_report_text(self, doc, marker):
+        stream = io.StringIO()
+        handler = diagnostics.enable(handler=logging.StreamHandler(stream))
+        try:
+            marker(doc)
+        finally:
+            diagnostics.disable(handler)
+        assert stream.getvalue()
+        assert '15 cm' not in stream.getvalue()
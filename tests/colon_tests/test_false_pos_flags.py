@@ -0,0 +1,45 @@
+import spacy
+import pytest
+from spacy.tokens import Span
+from diaag_nlp_colon.components.false_pos_filter import remove_false_pos
+from diaag_nlp_colon.services import false_pos_flags, prop_getters
+
+
+@pytest.fixture(scope='module')
+def doc():
+    nlp = spacy.blank('en')
+    _doc = nlp('two polyps in the sigmoid colon, no polyp in the rectum')
+    _doc.ents = [Span(_doc, 1, 2, label='POLYP_SAMPLE'), Span(_doc, 4, 6, label='POLYP_LOC'),
+                 Span(_doc, 8, 9, label='POLYP_SAMPLE'), Span(_doc, 11, 12, label='POLYP_LOC')]
+    false_pos_flags.mark(_doc, 8)
+    return _doc
+
+
+class TestFalsePosFlags:
+    def test_flags(self, doc):
+        flags = false_pos_flags.get_flags(doc)
+        assert len(flags) == len(doc)
+        assert list(flags.nonzero()[0]) == [8]
+
+    def test_span_queries(self, doc):
+        assert prop_getters.has_false_positive(doc[7:10])
+        assert not prop_getters.has_false_positive(doc[0:7])
+        assert prop_getters.sample_count(doc) == 1
+        assert not prop_getters.has_sample(doc[7:12])
+        assert prop_getters.has_props(doc[7:12])
+
+    def test_valid_ents_by_sent(self, doc):
+        sent_doc = spacy.blank('en')('two polyps. in the sigmoid colon, no polyp. in the rectum')
+        # the second entity crosses a sentence boundary
+        sent_doc.ents = [Span(sent_doc, 1, 2, label='POLYP_SAMPLE'), Span(sent_doc, 2, 4, label='POLYP_LOC'),
+                         Span(sent_doc, 5, 7, label='POLYP_LOC'), Span(sent_doc, 9, 10, label='POLYP_SAMPLE'),
+                         Span(sent_doc, 13, 14, label='POLYP_LOC')]
+        for token in sent_doc:
+            token.is_sent_start = token.i in (0, 3, 11)
+        false_pos_flags.mark(sent_doc, 9)
+        by_sent = false_pos_flags.valid_ents_by_sent(sent_doc)
+        assert by_sent == [false_pos_flags.valid_ents(sent) for sent in sent_doc.sents]
+        assert [[ent.text for ent in ents] for ents in by_sent] == [['polyps'], ['sigmoid colon'], ['rectum']]
+
+    def test_remove(self, doc):
+        assert [ent.text for ent in remove_false_pos(doc).ents] == ['polyps', 'sigmoid colon', 'rectum']
@@ -0,0 +1,88 @@
+import spacy
+import pytest
+from spacy.tokens import Span
+from diaag_nlp_colon.components import false_pos_filter
+from diaag_nlp_colon.config.colon import false_pos_rules
+# registers the custom components and extensions
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+separate_markers = {
+    'col': [false_pos_filter.mark_size_false_pos, false_pos_filter.mark_sample_false_pos,
+            false_pos_filter.mark_quant_false_pos_col, false_pos_filter.mark_proc_false_pos_col],
+    'path': [false_pos_filter.mark_size_false_pos, false_pos_filter.mark_quant_false_pos,
+             false_pos_filter.mark_loc_false_pos, false_pos_filter.mark_malignancy_false_pos],
+}
+
+
+@pytest.fixture(scope='module')
+def nlp():
+    return spacy.blank('en')
+
+
+def make_doc(nlp, text, report_type, ents):
+    doc = nlp(text)
+    doc.ents = [Span(doc, start, end, label=label, span_id=ent_id) for start, end, label, ent_id in ents]
+    doc._.set('report_type', report_type)
+    return doc
+
+
+class TestFusedFalsePos:
+    @pytest.mark.parametrize(
+        'text,report_type,ents,expected',
+        [
+            pytest.param('colon at 15 cm', 'col', [(2, 4, 'POLYP_SIZE_MEAS', 0)], [], id="size-prev-word"),
+            pytest.param('a 5 mm polyp', 'col', [(1, 3, 'POLYP_SIZE_MEAS', 0)], ['5 mm'], id="size-kept"),
+            pytest.param('a 5 inch polyp', 'col', [(1, 2, 'POLYP_SIZE_MEAS', 0)], [], id="size-no-units"),
+            pytest.param('a 5 inch polyp', 'path', [(1, 2, 'POLYP_SIZE_MEAS', 0)], ['5'], id="size-units-col-only"),
+            pytest.param('a 5 mm Boston Scientific clip', 'col', [(1, 3, 'POLYP_SIZE_MEAS', 0)], [],
+                         id="size-following-word"),
+            pytest.param('a 5 mm circumferential polyp', 'col', [(1, 3, 'POLYP_SIZE_MEAS', 0)], ['5 mm'],
+                         id="size-following-word-whole-token"),
+            pytest.param('no evidence of polyp', 'col', [(3, 4, 'POLYP_SAMPLE', 0)], [], id="sample-no-evidence"),
+            pytest.param('designated as sigmoid', 'path', [(2, 3, 'POLYP_LOC', 0)], [], id="loc-designated"),
+            pytest.param('biopsy taken with cold forceps', 'col', [(0, 2, 'POLYP_PROC', 'proc_biopsy_taken')], [],
+                         id="proc-forceps"),
+            pytest.param('biopsy taken with cold forceps', 'col', [(0, 2, 'POLYP_PROC', 0)], ['biopsy taken'],
+                         id="proc-other-id"),
+            pytest.param('received in two containers', 'path', [(2, 3, 'POLYP_QUANT', 0)], [], id="quant-containers"),
+            pytest.param('specimen # 2', 'path', [(1, 3, 'POLYP_QUANT', 0)], [], id="quant-hash"),
+            pytest.param('specimen A#2', 'path', [(1, 2, 'POLYP_QUANT', 0)], [], id="quant-glued-hash"),
+            pytest.param('specimen two', 'path', [(1, 2, 'POLYP_QUANT', 0)], ['two'], id="quant-kept"),
+            pytest.param('negative for malignancy', 'path', [(2, 3, 'MALIGNANCY', 0)], [], id="malignancy-negative"),
+        ]
+    )
+    def test_marks(self, nlp, text, report_type, ents, expected):
+        marker = false_pos_filter.create_false_pos_marker(nlp, 'mark_false_pos', report_type)
+        doc = marker(make_doc(nlp, text, report_type, ents))
+        assert [ent.text for ent in doc.ents] == expected
+
+    @pytest.mark.parametrize('report_type', ['col', 'path'])
+    def test_same_as_separate_markers(self, nlp, report_type):
+        text = 'at 5 cm no polyp 2 mm from random biopsy forceps labelled "A" two containers no adenocarcinoma'
+        ents = [(1, 3, 'POLYP_SIZE_MEAS', 0), (4, 5, 'POLYP_SAMPLE', 0), (5, 7, 'POLYP_QUANT', 0),
+                (9, 10, 'POLYP_PROC', 'proc_biopsy_taken'), (13, 14, 'POLYP_LOC', 0), (15, 16, 'POLYP_QUANT', 0),
+                (18, 19, 'MALIGNANCY', 0)]
+        marker = false_pos_filter.create_false_pos_marker(nlp, 'mark_false_pos', report_type)
+        fused_doc = marker(make_doc(nlp, text, report_type, ents))
+        doc = make_doc(nlp, text, report_type, ents)
+        for mark in separate_markers[report_type]:
+            doc = mark(doc)
+        doc = false_pos_filter.remove_false_pos(doc)
+        assert [ent.text for ent in fused_doc.ents] == [ent.text for ent in doc.ents]
+
+    def test_separate_markers_use_rule_table(self, nlp, monkeypatch):
+        # the separate markers read FP_RULES, a rule added to the table applies to them too
+        loc_rules = false_pos_rules.FP_RULES['path']['POLYP_LOC']
+        monkeypatch.setitem(false_pos_rules.FP_RULES['path'], 'POLYP_LOC',
+                            loc_rules + [{'check': 'prev_word', 'words': ['near']}])
+        doc = make_doc(nlp, 'near sigmoid', 'path', [(1, 2, 'POLYP_LOC', 0)])
+        doc = false_pos_filter.remove_false_pos(false_pos_filter.mark_loc_false_pos(doc))
+        assert list(doc.ents) == []
+
+    @pytest.mark.parametrize('text', ['A#2', '#2', '# 2', 'two #', 'no.2', 'two'])
+    def test_quant_hash_substring(self, nlp, text):
+        # same as the original rule: the entity text contains '#', also when it is glued to other characters
+        doc = make_doc(nlp, 'specimen ' + text, 'path', [(1, len(nlp('specimen ' + text)), 'POLYP_QUANT', 0)])
+        expected = '#' in doc.ents[0].text
+        marker = false_pos_filter.create_false_pos_marker(nlp, 'mark_false_pos', 'path')
+        assert (list(marker(doc).ents) == []) == expected
@@ -0,0 +1,82 @@
+import json
+import pytest
+from diaag_nlp_colon.config import pipeline_configs
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import incremental_runner
+
+
+# texts of the reports run through the (stand-in) pipeline
+def processed_texts(batches):
+    return [text for _, texts in batches for text in texts]
+
+
+class TestIncrementalRunner:
+    def test_only_new_and_changed(self, batches, tmp_path):
+        counts = incremental_runner.run_incremental('col', [('1', 'one polyp'), ('2', 'no polyps')], tmp_path)
+        assert counts['new'] == 2 and counts['processed'] == 2
+        with open(tmp_path / incremental_runner.output_file('1')) as f:
+            assert json.load(f)['text'] == 'one polyp'
+
+        reports = [('1', 'one polyp'), ('2', 'two polyps'), ('3', 'a polyp'), ('3', 'duplicate')]
+        counts = incremental_runner.run_incremental('col', reports, tmp_path)
+        assert processed_texts(batches) == ['one polyp', 'no polyps', 'two polyps', 'a polyp']
+        assert counts == {'new': 1, 'changed': 1, 'outdated': 0, 'current': 1, 'duplicate': 1, 'processed': 2}
+
+        manifest = incremental_runner.ReportManifest(tmp_path / incremental_runner.MANIFEST_FILE, 'col')
+        assert sorted(manifest.reports) == ['1', '2', '3']
+        assert manifest.reports['2']['content_hash'] == incremental_runner.content_hash('two polyps')
+        assert manifest.reports['2']['output'] == incremental_runner.output_file('2')
+
+    @pytest.mark.parametrize('n_process', [1, 2])
+    def test_stand_in_pipeline(self, path_nlp, tmp_path, n_process):
+        # runs the path pipeline (with stand-in model pipes) end to end
+        with open('./tests/reports/colo_path_sample.txt') as f:
+            path_report = f.read()
+        texts = [path_report, 'FINAL DIAGNOSIS: A. Colon, sigmoid, polyp: tubular adenoma.', 'no relevant text']
+        reports = [(str(i), text) for i, text in enumerate(texts)]
+        counts = incremental_runner.run_incremental('path', reports, tmp_path, batch_size=2, n_process=n_process)
+        assert counts['processed'] == 3
+        for report_id, text in reports:
+            with open(tmp_path / incremental_runner.output_file(report_id)) as f:
+                assert json.load(f) == json.loads(json.dumps(colon_pipelines.path_pipeline(text).to_dict(),
+                                                             default=str))
+
+    def test_unsafe_report_ids(self, batches, tmp_path):
+        output_dir = tmp_path / 'output'
+        reports = [('manifest', 'manifest id'), ('../escape', 'parent id'), ('a/b', 'slash id'), ('a_b', 'other id'),
+                   ('..', 'dots id')]
+        counts = incremental_runner.run_incremental('col', reports, output_dir)
+        assert counts['processed'] == 5
+        manifest = incremental_runner.ReportManifest(output_dir / incremental_runner.MANIFEST_FILE, 'col')
+        assert sorted(manifest.reports) == sorted(report_id for report_id, _ in reports)
+        outputs = {report_id: entry['output'] for report_id, entry in manifest.reports.items()}
+        assert len(set(outputs.values())) == 5
+        for report_id, text in reports:
+            path = (output_dir / outputs[report_id]).resolve()
+            assert path.parent == (output_dir / incremental_runner.REPORTS_DIR).resolve()
+            with open(path) as f:
+                assert json.load(f)['text'] == text
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['output']
+
+    def test_version_change(self, batches, tmp_path, monkeypatch):
+        incremental_runner.run_incremental('col', [('1', 'one polyp')], tmp_path)
+        monkeypatch.setitem(pipeline_configs.CURRENT_VERSIONS, 'colon', 'test')
+        counts = incremental_runner.run_incremental('col', [('1', 'one polyp')], tmp_path)
+        assert counts['outdated'] == 1 and counts['processed'] == 0
+        counts = incremental_runner.run_incremental('col', [('1', 'one polyp')], tmp_path, reprocess_outdated=True)
+        assert counts['processed'] == 1
+        counts = incremental_runner.run_incremental('col', [('1', 'one polyp')], tmp_path)
+        assert counts['current'] == 1 and counts['processed'] == 0
+        counts = incremental_runner.run_incremental('col', [('1', 'one polyp')], tmp_path, force=True)
+        assert counts['processed'] == 1
+
+    def test_report_type_mismatch(self, batches, tmp_path):
+        incremental_runner.run_incremental('col', [('1', 'one polyp')], tmp_path)
+        with pytest.raises(ValueError):
+            incremental_runner.run_incremental('path', [('1', 'one polyp')], tmp_path)
+
+    def test_report_files(self, tmp_path):
+        (tmp_path / 'co_1234567_a.txt').write_text('report text')
+        (tmp_path / 'co_1234567_a.ann').write_text('T1\tlocation 0 6\treport')
+        (tmp_path / '.hidden.txt').write_text('hidden')
+        assert list(incremental_runner.report_files(str(tmp_path))) == [('1234567', 'report text')]
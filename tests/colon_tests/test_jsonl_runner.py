@@ -0,0 +1,69 @@
+import io
+import json
+import pytest
+from diaag_nlp_colon.pipelines import colon_pipelines, jsonl_runner
+
+
+def run_lines(records, **kwargs):
+    input_file = io.StringIO(''.join(r if isinstance(r, str) else json.dumps(r) + '\n' for r in records))
+    output_file = io.StringIO()
+    counts = jsonl_runner.run(input_file, output_file, **kwargs)
+    return [json.loads(line) for line in output_file.getvalue().splitlines()], counts
+
+
+class TestJsonlRunner:
+    def test_run(self, batches):
+        records = [
+            {'id': 1, 'type': 'col', 'text': 'one polyp', 'mrn': '123'},
+            {'id': 2, 'type': 'path', 'text': 'tubular adenoma'},
+            '\n',
+            {'id': 3, 'type': 'col', 'text': 'no polyps'},
+            {'id': 4, 'type': 'egd', 'text': 'not a colon report'},
+            'not json\n',
+        ]
+        outputs, counts = run_lines(records, chunk_size=2)
+        assert counts == (3, 2)
+        assert [o['id'] for o in outputs] == [1, 2, 3, 4, None]
+        assert outputs[0]['report']['pat_mrn'] == '123'
+        assert outputs[0]['quality_metrics']['doc_prep_tf'] is False
+        assert outputs[0]['review_flags']['poor_prep'] is False
+        assert outputs[1]['quality_metrics'] is None and outputs[1]['review_flags'] == {'malignancy': False}
+        assert 'error' in outputs[3] and 'error' in outputs[4]
+        # one batch per report type and chunk (blank lines are skipped)
+        assert batches == [('col', ['one polyp']), ('path', ['tubular adenoma']), ('col', ['no polyps'])]
+
+    @pytest.mark.parametrize('n_process', [1, 2])
+    def test_stand_in_pipelines(self, col_nlp, path_nlp, n_process):
+        # runs the col and path pipelines (with stand-in model pipes) end to end
+        with open('./tests/reports/colo_sample.txt') as f:
+            col_report = f.read()
+        with open('./tests/reports/colo_path_sample.txt') as f:
+            path_report = f.read()
+        records = [
+            {'id': 1, 'type': 'col', 'text': col_report},
+            {'id': 2, 'type': 'path', 'text': path_report},
+            {'id': 3, 'type': 'path', 'text': 'FINAL DIAGNOSIS: A. Colon, sigmoid, polyp: tubular adenoma.'},
+            {'id': 4, 'type': 'col', 'text': 'A large polyp in the sigmoid colon was removed.'},
+        ]
+        outputs, counts = run_lines(records, chunk_size=3, batch_size=2, n_process=n_process)
+        assert counts == (4, 0)
+        assert [o['id'] for o in outputs] == [1, 2, 3, 4]
+        pipelines = {'col': colon_pipelines.col_pipeline, 'path': colon_pipelines.path_pipeline}
+        for record, output in zip(records, outputs):
+            report = pipelines[record['type']](record['text'])
+            assert output == json.loads(json.dumps(jsonl_runner.result_record(record, report), default=str))
+
+    def test_main(self, batches, tmp_path, capsys):
+        input_path = tmp_path / 'reports.jsonl'
+        output_path = tmp_path / 'results.jsonl'
+        input_path.write_text(json.dumps({'id': 'a', 'type': 'col', 'text': 'one polyp'}) + '\n')
+        jsonl_runner.main(['--input', str(input_path), '--output', str(output_path), '--batch-size', '8'])
+        assert json.loads(output_path.read_text())['id'] == 'a'
+        assert '1 reports processed' in capsys.readouterr().err
+
+    @pytest.mark.parametrize('workers', ['0', '-2', 'two'])
+    def test_main_invalid_workers(self, workers, capsys):
+        with pytest.raises(SystemExit) as exc_info:
+            jsonl_runner.main(['--workers', workers])
+        assert exc_info.value.code == 2
+        assert '--workers' in capsys.readouterr().err
@@ -0,0 +1,70 @@
+import re
+import pytest
+from diaag_nlp_colon.services.keyword_scanner import KeywordScanner, REPORT_SCANNER
+from diaag_nlp_colon.classes.report import ColReport, PathReport
+
+with open(f"./tests/reports/colo_sample.txt") as f:
+    colo_report = f.read()
+
+with open(f"./tests/reports/colo_path_sample.txt") as f:
+    path_report = f.read()
+
+
+# same search the report methods used before the scanner
+def search_terms(terms, text):
+    return re.search(r'(' + ')|('.join(terms) + r')', text, re.IGNORECASE)
+
+
+class TestKeywordScanner:
+    @pytest.mark.parametrize(
+        'text',
+        [
+            pytest.param(colo_report, id="colo-report"),
+            pytest.param(path_report, id="path-report"),
+            pytest.param('Incomplete colonoscopy, poor bowel prep. Tubulovillous adenoma.', id="overlapping-terms"),
+            pytest.param('', id="empty"),
+            pytest.param('\u0130 Sigmoid colon polyp, POOR   bowel prep', id="lowercase-changes-length"),
+        ]
+    )
+    def test_matches_re_search(self, text):
+        hits = REPORT_SCANNER.scan(text)
+        for category, terms in REPORT_SCANNER.terms.items():
+            expected = search_terms(terms, text)
+            hit = hits[category]
+            assert (hit is None) == (expected is None), category
+            if hit:
+                assert (hit.start, hit.end) == expected.span(), category
+                assert hit.text == expected.group(), category
+
+    def test_overlapping_categories(self):
+        scanner = KeywordScanner({'long': ['colonoscopy'], 'short': ['colon'], 'later': ['scopy']})
+        hits = scanner.scan('Incomplete COLONOSCOPY')
+        assert hits['long'].text == 'COLONOSCOPY'
+        assert (hits['short'].start, hits['short'].end) == (11, 16)
+        assert (hits['later'].start, hits['later'].end) == (17, 22)
+
+    def test_first_listed_term_wins_ties(self):
+        scanner = KeywordScanner({'prep': ['poor prep(aration)?', 'poor prep']})
+        hit = scanner.search('Poor preparation', 'prep')
+        assert hit.term == 'poor prep(aration)?'
+        assert hit.text == 'Poor preparation'
+
+    def test_subset_of_categories(self):
+        hits = REPORT_SCANNER.scan(colo_report, ['col', 'col_fp'])
+        assert set(hits) == {'col', 'col_fp'}
+        assert hits['col'] and not hits['col_fp']
+
+
+class TestReportKeywords:
+    def test_col_report(self):
+        report = ColReport(colo_report)
+        assert report.regex_incomplete_proc()
+        assert not report.regex_poor_prep()
+        report.text = 'The quality of the preparation was poor'
+        assert report.regex_poor_prep()
+
+    def test_path_report(self):
+        report = PathReport(path_report)
+        assert report.text_has_hist()
+        assert report.text_has_bucket_4_hist()
+        assert report.regex_malignancy()
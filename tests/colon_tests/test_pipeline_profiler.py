@@ -0,0 +1,54 @@
+import time
+import spacy
+import pytest
+from spacy.language import Language
+from diaag_nlp_colon.services.pipeline_profiler import PipelineProfiler
+
+
+@Language.component("test_sleep")
+def sleep_component(doc):
+    time.sleep(0.002)
+    return doc
+
+
+@pytest.fixture(scope='module')
+def nlp():
+    _nlp = spacy.blank('en')
+    _nlp.add_pipe('test_sleep')
+    _nlp.add_pipe('sentencizer')
+    return _nlp
+
+
+@pytest.fixture()
+def profiler(nlp):
+    _profiler = PipelineProfiler()
+    texts = ['One polyp. Two polyps.', 'No polyps.', 'Three polyps in the sigmoid colon.']
+    docs = list(_profiler.pipe('col', nlp, texts, batch_size=2))
+    assert [doc.text for doc in docs] == texts
+    assert [len(list(doc.sents)) for doc in docs] == [2, 1, 1]
+    return _profiler
+
+
+class TestPipelineProfiler:
+    def test_stats(self, profiler):
+        stats = profiler.to_dict()['col']
+        assert list(stats) == ['tokenizer', 'test_sleep', 'sentencizer']
+        assert all(component['count'] == 3 for component in stats.values())
+        assert stats['test_sleep']['total_seconds'] >= 0.006
+        # time of upstream stages is not charged to the components after them
+        assert stats['sentencizer']['total_seconds'] < stats['test_sleep']['total_seconds']
+        assert stats['test_sleep']['buckets']['+Inf'] == 3
+        assert stats['test_sleep']['buckets']['0.001'] == 0
+
+    def test_timer(self, profiler):
+        with profiler.timer('col', 'make_report'):
+            pass
+        assert profiler.to_dict()['col']['make_report']['count'] == 1
+
+    def test_prometheus(self, profiler, tmp_path):
+        path = tmp_path / 'colon.prom'
+        profiler.write_prometheus(str(path))
+        lines = path.read_text().splitlines()
+        assert lines[1] == '# TYPE diaag_nlp_colon_component_seconds histogram'
+        assert 'diaag_nlp_colon_component_seconds_count{pipeline="col",component="test_sleep"} 3' in lines
+        assert 'diaag_nlp_colon_component_seconds_bucket{pipeline="col",component="test_sleep",le="+Inf"} 3' in lines
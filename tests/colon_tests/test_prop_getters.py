@@ -0,0 +1,35 @@
+import spacy
+import pytest
+from spacy.tokens import Span
+from diaag_nlp_colon.services import prop_getters
+# registers the Span extensions
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+
+@pytest.fixture(scope='module')
+def doc():
+    nlp = spacy.blank('en')
+    nlp.add_pipe('sentencizer')
+    _doc = nlp.make_doc('Two 5 mm polyps in the sigmoid and the cecum. A 3 mm polyp. Normal rectum.')
+    _doc.ents = [Span(_doc, 0, 1, label='POLYP_QUANT'), Span(_doc, 1, 3, label='POLYP_SIZE_MEAS'),
+                 Span(_doc, 3, 4, label='POLYP_SAMPLE'), Span(_doc, 6, 7, label='POLYP_LOC'),
+                 Span(_doc, 9, 10, label='POLYP_LOC'), Span(_doc, 12, 14, label='POLYP_SIZE_MEAS'),
+                 Span(_doc, 14, 15, label='POLYP_SAMPLE'), Span(_doc, 17, 18, label='POLYP_LOC')]
+    return nlp.get_pipe('sentencizer')(_doc)
+
+
+class TestSentenceEntTable:
+    def test_values(self, doc):
+        table = prop_getters.sentence_ent_table(doc)
+        assert list(table.has_sample) == [True, True, False]
+        assert list(table.has_props) == [True, True, True]
+        assert list(table.loc_count) == [2, 0, 1]
+        assert list(table.size_meas_count) == [1, 1, 0]
+
+    def test_same_as_span_getters(self, doc):
+        table = prop_getters.sentence_ent_table(doc)
+        for sent_i, sent in enumerate(doc.sents):
+            assert table.has_sample[sent_i] == sent._.has_sample
+            assert table.has_props[sent_i] == sent._.has_props
+            assert table.loc_count[sent_i] == sent._.loc_count
+            assert table.size_meas_count[sent_i] == sent._.size_meas_count
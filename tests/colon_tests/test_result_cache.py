@@ -0,0 +1,99 @@
+import pytest
+from diaag_nlp_colon.classes.report import ColReport
+from diaag_nlp_colon.config import pipeline_configs
+from diaag_nlp_colon.config.colon import false_pos_rules
+from diaag_nlp_colon.pipelines import colon_pipelines
+from diaag_nlp_colon.services import result_cache
+from diaag_nlp_colon.services.result_cache import ResultCache
+
+
+@pytest.fixture()
+def pipeline_calls(monkeypatch):
+    # stands in for the trained model: counts pipeline runs, reports keep the text they were made from
+    calls = []
+
+    def run_nlp(report_type, report_text, profiler):
+        calls.append(report_text)
+        return report_text
+
+    monkeypatch.setattr(colon_pipelines, '_run_nlp', run_nlp)
+    monkeypatch.setattr(colon_pipelines, '_make_report', lambda report_type, text, profiler: ColReport(text))
+    return calls
+
+
+class TestResultCache:
+    def test_get_put(self):
+        cache = ResultCache()
+        key = cache.key('col', ['Two polyps.'])
+        assert cache.get(key) == (False, None)
+        cache.put(key, {'polyps': [1, 2]})
+        found, value = cache.get(key)
+        assert found and value == {'polyps': [1, 2]}
+        # every get returns a new copy
+        value['polyps'].append(3)
+        assert cache.get(key)[1] == {'polyps': [1, 2]}
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_key(self):
+        cache = ResultCache()
+        assert cache.key('col', ['a']) == cache.key('col', ['a'])
+        assert cache.key('col', ['a']) != cache.key('path', ['a'])
+        assert cache.key('col', ['a']) != cache.key('col', ['a'], prescreen=True)
+        assert cache.key('rec', ['a', None]) != cache.key('rec', ['a', ''])
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        for key in ['a', 'b']:
+            cache.put(key, key)
+        cache.get('a')
+        cache.put('c', 'c')
+        assert [cache.get(key)[0] for key in ['a', 'b', 'c']] == [True, False, True]
+
+    def test_persistent(self, tmp_path):
+        path = tmp_path / 'results.sqlite'
+        with ResultCache(path) as cache:
+            cache.put(cache.key('col', ['a']), 'report')
+        with ResultCache(path, max_entries=0) as cache:
+            assert cache.get(cache.key('col', ['a'])) == (True, 'report')
+
+    def test_version_change(self, tmp_path, monkeypatch):
+        path = tmp_path / 'results.sqlite'
+        with ResultCache(path) as cache:
+            old_key = cache.key('col', ['a'])
+            cache.put(old_key, 'report')
+        monkeypatch.setitem(pipeline_configs.CURRENT_VERSIONS, 'colon', 'test')
+        with ResultCache(path) as cache:
+            assert cache.key('col', ['a']) != old_key
+            assert not cache.get(cache.key('col', ['a']))[0]
+            assert cache.prune() == 1
+
+    def test_fp_rule_change(self, tmp_path, monkeypatch):
+        path = tmp_path / 'results.sqlite'
+        with ResultCache(path) as cache:
+            cache.put(cache.key('col', ['a']), 'report')
+        with ResultCache(path) as cache:
+            assert cache.get(cache.key('col', ['a']))[0]
+        size_rules = false_pos_rules.FP_RULES['col']['POLYP_SIZE_MEAS']
+        monkeypatch.setitem(false_pos_rules.FP_RULES['col'], 'POLYP_SIZE_MEAS',
+                            size_rules + [{'check': 'prev_word', 'words': ['near']}])
+        with ResultCache(path) as cache:
+            assert not cache.get(cache.key('col', ['a']))[0]
+
+    def test_rule_source_change(self, tmp_path, monkeypatch):
+        rules = tmp_path / 'rules.py'
+        rules.write_text("SIZE_PREV_FPS = ['at']\n")
+        monkeypatch.setattr(result_cache, 'RULE_SOURCES', [str(tmp_path)])
+        before = result_cache.rule_source_hash()
+        rules.write_text("SIZE_PREV_FPS = ['at', 'near']\n")
+        assert result_cache.rule_source_hash() != before
+
+    def test_col_pipeline(self, pipeline_calls):
+        cache = ResultCache()
+        first = colon_pipelines.col_pipeline('Two polyps.\r\nRemoved.', cache=cache)
+        second = colon_pipelines.col_pipeline('Two polyps.\nRemoved.', cache=cache)
+        assert pipeline_calls == ['Two polyps. Removed.']
+        assert second.text == first.text and second is not first
+        # prescreened reports are cached under their own key (here: not colon-related, so no pipeline run)
+        assert not colon_pipelines.col_pipeline('Two polyps.\nRemoved.', prescreen=True, cache=cache).col_related
+        assert len(pipeline_calls) == 1
+        assert (cache.hits, cache.misses) == (1, 2)
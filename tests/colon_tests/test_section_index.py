@@ -0,0 +1,90 @@
+import spacy
+import pytest
+from spacy.tokens import Span
+from diaag_nlp_colon.config.colon import col_patterns, path_patterns
+from diaag_nlp_colon.services import false_pos_flags
+from diaag_nlp_colon.services.section_index import get_section_index, SECTION_INDEX_KEY
+from diaag_nlp_colon.components.report_section_filter import (
+    extract_section_span, extract_relevant_sections_path, select_relevant_sections_path
+)
+# registers the Doc extensions
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+with open(f"./tests/reports/colo_sample.txt") as f:
+    colo_report = f.read()
+
+with open(f"./tests/reports/colo_path_sample.txt") as f:
+    path_report = f.read()
+
+
+@pytest.fixture(scope='module')
+def nlp():
+    _nlp = spacy.blank('en')
+    _nlp.add_pipe("entity_ruler", config={"overwrite_ents": True}).add_patterns(col_patterns.header_patterns)
+    return _nlp
+
+
+class TestSectionIndex:
+    def test_headers_match_ents(self, nlp):
+        doc = nlp(colo_report)
+        header_ents = [(ent.start, ent.end, ent.ent_id_) for ent in doc.ents if ent.label_ == 'SECTION_HEADER']
+        assert [tuple(h) for h in get_section_index(doc).headers] == header_ents
+
+    def test_cached(self, nlp):
+        doc = nlp(colo_report)
+        assert get_section_index(doc) is get_section_index(doc)
+        assert doc.user_data[SECTION_INDEX_KEY] is get_section_index(doc)
+
+    def test_invalidated_on_ents_change(self, nlp):
+        doc = nlp(colo_report)
+        index = get_section_index(doc)
+        doc.ents = [ent for ent in doc.ents if ent.ent_id_ != 'section_IND']
+        assert get_section_index(doc) is not index
+        assert extract_section_span(doc, 'section_IND') is None
+
+    def test_copied_user_data(self, nlp):
+        # a section doc made with copy_user_data starts with the index of the full doc
+        doc = nlp(colo_report)
+        index = get_section_index(doc)
+        section_doc = doc[index.headers[1].start:].as_doc(copy_user_data=True)
+        assert SECTION_INDEX_KEY in section_doc.user_data
+        header_ents = [(ent.start, ent.end, ent.ent_id_) for ent in section_doc.ents if ent.label_ == 'SECTION_HEADER']
+        assert [tuple(h) for h in get_section_index(section_doc).headers] == header_ents
+
+    def test_section_span(self, nlp):
+        doc = nlp(colo_report)
+        index = get_section_index(doc)
+        span = extract_section_span(doc, 'section_IND')
+        header = next(h for h in index.headers if h.section_id == 'section_IND')
+        assert span.start == header.end
+        assert index.token_section(span.start) == 'section_IND'
+        assert index.token_section(header.start) is None
+        assert span.end == len(doc) or index.token_section(span.end) != 'section_IND'
+
+    def test_no_headers(self, nlp):
+        doc = nlp('Polyp removed from the sigmoid.')
+        doc.ents = [Span(doc, 0, 1, label='POLYP')]
+        assert get_section_index(doc).headers == []
+        assert extract_section_span(doc, 'section_FIN') is None
+
+
+class TestSectionWindow:
+    @pytest.fixture(scope='class')
+    def path_nlp(self):
+        _nlp = spacy.blank('en')
+        _nlp.add_pipe("entity_ruler", config={"overwrite_ents": True}).add_patterns(
+            path_patterns.header_patterns + path_patterns.polyp_patterns)
+        return _nlp
+
+    def test_same_as_section_doc(self, path_nlp):
+        section_doc = extract_relevant_sections_path(path_nlp(path_report))
+        doc = select_relevant_sections_path(path_nlp(path_report))
+        assert doc._.relevant_section.text_with_ws == section_doc.text
+        # ents outside the window are marked for removal
+        window_ents = false_pos_flags.valid_ents(doc)
+        assert [(e.text, e.label_) for e in window_ents] == [(e.text, e.label_) for e in section_doc.ents]
+
+    def test_no_window(self, path_nlp):
+        doc = path_nlp(path_report)
+        assert doc._.section_bounds is None
+        assert doc._.relevant_section.text_with_ws == doc.text
@@ -0,0 +1,102 @@
+import spacy
+import pytest
+from spacy.language import Language
+from spacy.tokens import Span
+from diaag_nlp_colon.config.colon import col_patterns, path_patterns
+from diaag_nlp_colon.services.section_splitter import SectionSplitter
+# registers the custom components and Doc extensions
+from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+
+with open(f"./tests/reports/colo_sample.txt") as f:
+    colo_report = f.read()
+
+with open(f"./tests/reports/colo_prep_sample.txt") as f:
+    colo_prep_report = f.read()
+
+with open(f"./tests/reports/colo_path_sample.txt") as f:
+    path_report = f.read()
+
+
+def ruler_headers(header_patterns, text):
+    nlp = spacy.blank('en')
+    nlp.add_pipe("entity_ruler", config={"overwrite_ents": True}).add_patterns(header_patterns)
+    doc = nlp(text)
+    return [(ent.start_char, ent.end_char, ent.ent_id_) for ent in doc.ents if ent.label_ == 'SECTION_HEADER']
+
+
+class TestSectionSplitter:
+    @pytest.mark.parametrize(
+        'header_patterns,text',
+        [
+            pytest.param(col_patterns.header_patterns, colo_report, id="col-report"),
+            pytest.param(col_patterns.header_patterns, colo_prep_report, id="col-prep-report"),
+            pytest.param(path_patterns.header_patterns, path_report, id="path-report"),
+        ]
+    )
+    def test_same_headers_as_ruler(self, header_patterns, text):
+        splitter = SectionSplitter(header_patterns)
+        headers = [tuple(h) for h in splitter.find_headers(text)]
+        assert headers == ruler_headers(header_patterns, text)
+
+    def test_section_range(self):
+        splitter = SectionSplitter(path_patterns.header_patterns)
+        start, end = splitter.section_range(path_report, ['section_FD'])
+        assert 'FINAL DIAGNOSIS' not in path_report[start:end]
+        assert path_report[start:end].strip()
+
+    def test_missing_section(self):
+        splitter = SectionSplitter(path_patterns.header_patterns)
+        assert splitter.section_range('no headers in this text', ['section_FD']) is None
+
+    # a REGEX header token is not retried with shorter words, so a long run of the word without its colon is linear
+    def test_long_header_word_run(self):
+        splitter = SectionSplitter(col_patterns.header_patterns)
+        text = 'recommendation' * 5000 + ' Recommendations: none'
+        headers = splitter.find_headers(text)
+        assert [(text[h.start:h.end], h.section_id) for h in headers] == [('Recommendations:', 'section_REC')]
+
+
+# a model pipe without a pipe method: marks every "polyp" token
+@Language.component("polyp_function_ner")
+def polyp_function_ner(doc):
+    doc.ents = [Span(doc, token.i, token.i + 1, label='POLYP') for token in doc if token.lower_ in ('polyp', 'polyps')]
+    return doc
+
+
+class TestSectionNer:
+    # an entity ruler stands in for the trained model pipes
+    @pytest.fixture(scope='class')
+    def nlp(self):
+        _nlp = spacy.blank('en')
+        _nlp.add_pipe("col_keyword_filter")
+        _nlp.add_pipe("section_ner", config={"report_type": "path", "model_pipes": ["model_ner"]})
+        model_ner = _nlp.add_pipe("entity_ruler", name="model_ner")
+        model_ner.add_patterns([{"label": "POLYP", "pattern": [{"LOWER": {"REGEX": "^polyps?$"}}]}])
+        _nlp.disable_pipe("model_ner")
+        return _nlp
+
+    def test_ents_only_in_section(self, nlp):
+        start, end = SectionSplitter(path_patterns.header_patterns).section_range(path_report, ['section_FD'])
+        doc = nlp(path_report)
+        assert doc.ents
+        assert all(start <= ent.start_char and ent.end_char <= end for ent in doc.ents)
+        assert all(ent.text.lower().startswith('polyp') for ent in doc.ents)
+
+    def test_pipe_matches_call(self, nlp):
+        texts = [path_report, 'Polyp removed from the sigmoid.', 'No relevant keywords here.']
+        piped = [[(e.start_char, e.end_char) for e in doc.ents] for doc in nlp.pipe(texts, batch_size=2)]
+        called = [[(e.start_char, e.end_char) for e in nlp(text).ents] for text in texts]
+        assert piped == called
+        # no section header: model runs on the whole doc; not colon-related: model is skipped
+        assert piped[1] and not piped[2]
+
+    def test_function_model_pipe(self, nlp):
+        function_nlp = spacy.blank('en')
+        function_nlp.add_pipe("col_keyword_filter")
+        function_nlp.add_pipe("section_ner", config={"report_type": "path", "model_pipes": ["polyp_function_ner"]})
+        function_nlp.add_pipe("polyp_function_ner")
+        function_nlp.disable_pipe("polyp_function_ner")
+        texts = [path_report, 'Polyp removed from the sigmoid.', 'No relevant keywords here.']
+        piped = [[(e.start_char, e.end_char) for e in doc.ents] for doc in function_nlp.pipe(texts, batch_size=2)]
+        expected = [[(e.start_char, e.end_char) for e in nlp(text).ents] for text in texts]
+        assert piped == expected
@@ -0,0 +1,35 @@
+import srsly
+import pytest
+from diaag_nlp_colon.pipelines import colon_pipelines, staged_pipelines
+
+with open(f"./tests/reports/colo_path_sample.txt") as f:
+    path_report = f.read()
+
+texts = [path_report, 'FINAL DIAGNOSIS: A. Colon, sigmoid, polyp: tubular adenoma.', 'no relevant text']
+
+
+class TestStagedPipelines:
+    def test_split_pipes(self, path_nlp):
+        model_pipes, rule_pipes = staged_pipelines.split_pipes(path_nlp)
+        assert model_pipes == ['set_report_type', 'col_keyword_filter', 'section_ner']
+        assert rule_pipes[0] == 'entity_ruler' and rule_pipes[-1] == 'polyp_property_extractor_path'
+
+    def test_replay_matches_pipeline(self, path_nlp, tmp_path):
+        shards = staged_pipelines.run_model_stage('path', [(t, i) for i, t in enumerate(texts)], tmp_path,
+                                                  shard_size=2, as_tuples=True)
+        assert [shard.name for shard in shards] == ['shard_00000.spacy', 'shard_00001.spacy']
+        replayed = list(staged_pipelines.replay_rule_stage('path', tmp_path, as_tuples=True))
+        assert [context for _, context in replayed] == [0, 1, 2]
+        expected = [report.to_dict() for report in colon_pipelines.path_pipeline_batch(texts)]
+        assert [report.to_dict() for report, _ in replayed] == expected
+        assert any(report.polyps for report, _ in replayed)
+
+    def test_stale_models(self, path_nlp, tmp_path):
+        staged_pipelines.run_model_stage('path', texts, tmp_path)
+        meta = srsly.read_json(tmp_path / staged_pipelines.META_FILE)
+        meta['models']['path'] = '0.0.0'
+        srsly.write_json(tmp_path / staged_pipelines.META_FILE, meta)
+        with pytest.raises(ValueError):
+            list(staged_pipelines.replay_rule_stage('path', tmp_path))
+        with pytest.raises(ValueError):
+            list(staged_pipelines.replay_rule_stage('col', tmp_path))
@@ -0,0 +1,84 @@
+import multiprocessing
+import threading
+import time
+import pytest
+from diaag_nlp_colon.services import stream_engine
+from diaag_nlp_colon.services.stream_engine import StreamEngine
+
+
+# chunk functions run in worker processes, so they are module level
+def square(chunk):
+    # later chunks finish first
+    time.sleep(0.02 if chunk[0] < 4 else 0)
+    return [n * n for n in chunk]
+
+
+def fail_on_five(chunk):
+    if 5 in chunk:
+        raise ValueError('five')
+    return chunk
+
+
+class TestStreamEngine:
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_results_in_order(self, workers):
+        results = []
+        engine = StreamEngine(square, workers=workers, chunk_size=2)
+        assert engine.run(range(10), results.append) == 10
+        assert results == [n * n for n in range(10)]
+
+    def test_backpressure(self):
+        in_flight = []
+        engine = StreamEngine(square, workers=1, chunk_size=1, queue_size=1)
+
+        def slow_sink(result):
+            time.sleep(0.005)
+            in_flight.append(engine.items_read - engine.items_written)
+
+        engine.run(range(30), slow_sink)
+        # at most queue_size * 2 + workers chunks are read but not written
+        assert max(in_flight) <= 3
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_process_error(self, workers):
+        with pytest.raises(ValueError):
+            StreamEngine(fail_on_five, workers=workers, chunk_size=2).run(range(100), lambda result: None)
+
+    def test_sink_error(self):
+        def sink(result):
+            raise IOError('disk full')
+
+        with pytest.raises(IOError):
+            StreamEngine(square, chunk_size=2).run(range(100), sink)
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_results(self, workers):
+        engine = StreamEngine(square, workers=workers, chunk_size=2)
+        assert list(engine.results(range(10))) == [n * n for n in range(10)]
+
+    def test_results_closed_early(self):
+        results = StreamEngine(square, chunk_size=1).results(range(1000))
+        assert next(results) == 0
+        results.close()
+
+    def test_results_error(self):
+        with pytest.raises(ValueError):
+            list(StreamEngine(fail_on_five, chunk_size=2).results(range(100)))
+
+    @pytest.mark.parametrize('workers', [0, -2])
+    def test_invalid_workers(self, workers):
+        with pytest.raises(ValueError):
+            StreamEngine(square, workers=workers)
+
+    def test_results_pool_before_threads(self, monkeypatch):
+        # the pool forks its workers before the engine starts any thread
+        threads_at_fork = []
+        make_pool = multiprocessing.Pool
+
+        def pool(*args, **kwargs):
+            threads_at_fork.extend(thread.name for thread in threading.enumerate())
+            return make_pool(*args, **kwargs)
+
+        monkeypatch.setattr(stream_engine.multiprocessing, 'Pool', pool)
+        assert list(StreamEngine(square, workers=2, chunk_size=2).results(range(10))) == [n * n for n in range(10)]
+        assert threads_at_fork and not any(name.startswith('stream-') for name in threads_at_fork)
@@ -0,0 +1,42 @@
+import pytest
+from diaag_nlp_colon.classes.report import ColReport, PathReport
+from diaag_nlp_colon.nlp_models import en_trained_sections_col
+from diaag_nlp_colon.pipelines import colon_pipelines
+from tests.helpers import build_path_nlp_stand_in, trained_ner_stand_in
+
+
+# Stand-in for colon_pipelines.col_pipeline_batch / path_pipeline_batch: reports keep the text they were made from
+# returns: list of (report type, list of report texts), one entry per batch call
+@pytest.fixture()
+def batches(monkeypatch):
+    calls = []
+
+    def pipeline_batch(report_type, report_class):
+        def run(reports, as_tuples=False, batch_size=None, n_process=1, prescreen=False, profiler=None):
+            reports = list(reports)
+            calls.append((report_type, [text for text, _ in reports] if as_tuples else reports))
+            for report in reports:
+                yield (report_class(report[0]), report[1]) if as_tuples else report_class(report)
+        return run
+
+    monkeypatch.setattr(colon_pipelines, 'get_nlp', lambda report_type, **options: None)
+    monkeypatch.setattr(colon_pipelines, 'col_pipeline_batch', pipeline_batch('col', ColReport))
+    monkeypatch.setattr(colon_pipelines, 'path_pipeline_batch', pipeline_batch('path', PathReport))
+    return calls
+
+
+# the path pipeline with an entity ruler standing in for the trained model pipes
+@pytest.fixture()
+def path_nlp(monkeypatch):
+    nlp = build_path_nlp_stand_in()
+    monkeypatch.setitem(colon_pipelines._nlp_cache, 'path', nlp)
+    return nlp
+
+
+# the col pipeline with an entity ruler standing in for the trained model
+@pytest.fixture()
+def col_nlp(monkeypatch):
+    monkeypatch.setattr(en_trained_sections_col, 'load', trained_ner_stand_in)
+    nlp = colon_pipelines.build_nlp('col')
+    monkeypatch.setitem(colon_pipelines._nlp_cache, 'col', nlp)
+    return nlp
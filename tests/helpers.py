@@ -1,4 +1,5 @@
 from spacy.language import Language
+import spacy
 import time
 import re
 
@@ -14,6 +15,44 @@ COL_PREP_QUALITY = [
 ]
 
 
+# stands in for a trained model package (en_trained_sections_col / _path load()): an entity ruler named 'ner' that
+# makes some of the model's labels
+def trained_ner_stand_in():
+    nlp = spacy.blank('en')
+    ner = nlp.add_pipe("entity_ruler", name="ner")
+    ner.add_patterns([
+        {"label": "POLYP_SAMPLE", "pattern": [{"LOWER": {"IN": ["polyp", "polyps", "lesion", "mass"]}}]},
+        {"label": "POLYP_SIZE_NONSPEC", "pattern": [{"LOWER": {"IN": ["small", "large", "diminutive"]}}]},
+        {"label": "POLYP_LOC", "pattern": [{"LOWER": {"IN": ["sigmoid", "rectum", "cecum", "transverse"]}},
+                                           {"LOWER": "colon", "OP": "?"}]},
+        {"label": "POLYP_HIST", "pattern": [{"LOWER": {"IN": ["tubular", "hyperplastic"]}},
+                                            {"LOWER": {"IN": ["adenoma", "polyp"]}, "OP": "?"}]},
+    ])
+    return nlp
+
+
+# the path pipeline with an entity ruler standing in for the trained model pipes (the model weights are not needed)
+def build_path_nlp_stand_in():
+    # registers the custom components and extensions
+    from diaag_nlp_colon.pipelines import colon_pipelines  # noqa: F401
+    from diaag_nlp_colon.config.colon import path_patterns
+
+    nlp = spacy.blank('en')
+    nlp.add_pipe("set_report_type", config={"report_type": "path"})
+    nlp.add_pipe("col_keyword_filter")
+    nlp.add_pipe("section_ner", config={"report_type": "path", "model_pipes": ["model_ner"]})
+    model_ner = nlp.add_pipe("entity_ruler", name="model_ner")
+    model_ner.add_patterns([{"label": "POLYP_LOC", "pattern": [{"LOWER": {"IN": ["sigmoid", "rectum", "cecum"]}}]}])
+    nlp.disable_pipe("model_ner")
+    ruler = nlp.add_pipe("colon_entity_ruler", name="entity_ruler", config={"overwrite_ents": True})
+    ruler.add_patterns(path_patterns.header_patterns)
+    ruler.add_patterns(path_patterns.polyp_patterns)
+    nlp.add_pipe("extract_relevant_sections_path")
+    nlp.add_pipe("mark_false_pos", config={"report_type": "path", "defer_removal": True})
+    nlp.add_pipe("polyp_property_extractor_path")
+    return nlp
+
+
 # remove entity Spans that contain a Token marked as a false positive
 @Language.component("remove_false_pos_helper")
 def remove_false_pos(doc):